@@ -0,0 +1,224 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Load benchmark of the API hot paths against local stub upstreams.
+
+Starts stub Phabricator and Transplant servers (see benchmarks.stubs) and
+the API itself on local ports, then drives these scenarios at a fixed
+concurrency:
+
+    revisions:      GET /revisions/{id} of the top of the stack
+    land:           POST /landings of the top of the stack
+    landings:       GET /landings?revision_id={id}
+
+The throughput, latency percentiles and upstream calls of each scenario are
+written as JSON, so that runs can be compared.
+
+Run from the project root:
+
+    $ python -m benchmarks.api_load --shape diamond --latency 0.02 \\
+        --concurrency 8 --output before.json
+"""
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import requests
+from werkzeug.serving import make_server
+
+from benchmarks.stubs import STACK_SHAPES, StubPhabricator, StubTransplant
+
+SCENARIOS = ('revisions', 'land', 'landings')
+
+
+def unmock_transplant_client():
+    """ Send TransplantClient.land() requests to the stub Transplant server,
+    instead of the stub mounted on the session of the client.
+    """
+    from landoapi.transplant_client import TransplantClient
+    TransplantClient._mount_stub = lambda self: None
+
+
+def start_api(workdir, cache_type):
+    """ Serve the API on a local port from a background thread. """
+    from landoapi.app import create_app
+    from landoapi.models.storage import db
+
+    version_path = os.path.join(workdir, 'version.json')
+    with open(version_path, 'w') as f:
+        json.dump({'source': '', 'version': '0.0.0', 'commit': ''}, f)
+
+    database_path = os.path.join(workdir, 'lando.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///%s' % database_path
+    os.environ['CACHE_TYPE'] = cache_type
+    flask_app = create_app(version_path).app
+    with flask_app.app_context():
+        db.create_all()
+
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def percentile(ordered, percent):
+    """ Nearest-rank percentile of an ordered list. """
+    if not ordered:
+        return None
+    rank = max(int(round(percent / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def run_scenario(send, requests_count, concurrency):
+    """ Call send(session) requests_count times from concurrency threads.
+
+    Returns:
+        A (latencies, errors, duration) tuple.
+    """
+    local = threading.local()
+    latencies = []
+    errors = []
+
+    def one(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = send(local.session)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - start
+        (latencies if ok else errors).append(latency)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(requests_count)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, duration, upstream_calls):
+    ordered = sorted(latencies)
+    total = len(latencies) + len(errors)
+    latency = {
+        'mean': sum(ordered) / len(ordered) if ordered else None,
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1] if ordered else None,
+    }
+    per_request = {
+        service: sum(calls.values()) / total if total else None
+        for service, calls in upstream_calls.items()
+    }
+    return {
+        'requests': total,
+        'errors': len(errors),
+        'duration': duration,
+        'throughput': total / duration if duration else None,
+        'latency': latency,
+        'upstream_calls': upstream_calls,
+        'upstream_calls_per_request': per_request,
+    }
+
+
+@click.command()
+@click.option(
+    '--shape',
+    type=click.Choice(sorted(STACK_SHAPES)),
+    default='linear',
+    help='Shape of the revision stack.'
+)
+@click.option(
+    '--size', type=int, help='Size of the stack, defaults per shape.'
+)
+@click.option(
+    '--latency', default=0.0, help='Seconds each upstream call takes.'
+)
+@click.option('--concurrency', default=4, help='Requests in flight.')
+@click.option('--requests', 'requests_count', default=200)
+@click.option(
+    '--scenario',
+    'scenarios',
+    type=click.Choice(SCENARIOS),
+    multiple=True,
+    help='Scenarios to run, all of them by default.'
+)
+@click.option(
+    '--cache-type',
+    type=click.Choice(['simple', 'null']),
+    default='null',
+    help='Revision cache backend, null measures uncached loads.'
+)
+@click.option(
+    '--output', type=click.File('w'), default='-', help='JSON results file.'
+)
+def main(
+    shape, size, latency, concurrency, requests_count, scenarios, cache_type,
+    output
+):
+    build, default_size = STACK_SHAPES[shape]
+    revisions, top = build(size or default_size)
+    phabricator = StubPhabricator(revisions, latency).start()
+    transplant = StubTransplant(latency).start()
+    os.environ['PHABRICATOR_URL'] = phabricator.url
+    os.environ['PHABRICATOR_UNPRIVILEGED_API_KEY'] = 'api-key'
+    os.environ['TRANSPLANT_URL'] = transplant.url
+    unmock_transplant_client()
+
+    revision_id = 'D%s' % top
+
+    def send(name, session, url):
+        if name == 'revisions':
+            return session.get('%s/revisions/%s' % (url, revision_id))
+        elif name == 'land':
+            data = {'revision_id': revision_id}
+            return session.post('%s/landings' % url, json=data)
+        params = {'revision_id': revision_id}
+        return session.get('%s/landings' % url, params=params)
+
+    config = {
+        'shape': shape,
+        'stack_size': len(revisions),
+        'latency': latency,
+        'concurrency': concurrency,
+        'requests': requests_count,
+        'cache_type': cache_type,
+    }
+    results = {'config': config, 'scenarios': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        api = start_api(workdir, cache_type)
+        api_url = 'http://127.0.0.1:%s' % api.server_port
+        try:
+            for name in scenarios or SCENARIOS:
+                phabricator.reset_calls()
+                transplant.reset_calls()
+                latencies, errors, duration = run_scenario(
+                    functools.partial(send, name, url=api_url), requests_count,
+                    concurrency
+                )
+                upstream_calls = {
+                    'phabricator': phabricator.call_counts(),
+                    'transplant': transplant.call_counts(),
+                }
+                results['scenarios'][name] = summarize(
+                    latencies, errors, duration, upstream_calls
+                )
+        finally:
+            api.shutdown()
+            phabricator.stop()
+            transplant.stop()
+
+    json.dump(results, output, indent=2, sort_keys=True)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
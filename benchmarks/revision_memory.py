@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Memory used by a loaded revision stack.
+
+Compares the nested dicts the API returns with the Revision, User and Repo
+value objects that are kept in caches.
+
+Run from the project root:
+
+    $ python -m benchmarks.revision_memory
+"""
+import tracemalloc
+from copy import deepcopy
+
+import click
+
+from landoapi.models.revision import PhabricatorObjects
+from tests.canned_responses.phabricator.repos import CANNED_REPO_MOZCENTRAL
+from tests.canned_responses.phabricator.revisions import CANNED_REVISION_1
+from tests.canned_responses.phabricator.users import CANNED_USER_1
+from tests.utils import first_result_in_response
+
+
+class CannedPhabricatorClient:
+    """ Answers user and repo lookups from canned data. """
+
+    def get_user(self, phid):
+        return deepcopy(first_result_in_response(CANNED_USER_1))
+
+    def get_repo(self, phid):
+        return deepcopy(first_result_in_response(CANNED_REPO_MOZCENTRAL))
+
+
+def raw_revisions(depth):
+    """Build `depth` differential.query results forming a linear stack."""
+    revisions = []
+    for i in range(1, depth + 1):
+        revision = deepcopy(first_result_in_response(CANNED_REVISION_1))
+        revision['id'] = str(i)
+        revision['phid'] = 'PHID-DREV-%s' % i
+        revision['title'] = 'My test diff %s' % i
+        revision['summary'] = 'Summary %s' % i
+        revision['auxiliary']['phabricator:depends-on'] = (
+            ['PHID-DREV-%s' % (i - 1)] if i > 1 else []
+        )
+        revisions.append(revision)
+    return revisions
+
+
+def build_objects(revisions):
+    objects = PhabricatorObjects(CannedPhabricatorClient())
+    stack = None
+    for data in revisions:
+        revision = objects.revision(data)
+        revision.parents = (stack, ) if stack else ()
+        stack = revision
+    return stack
+
+
+def measure(build, revisions):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build(revisions)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    return result, size
+
+
+@click.command()
+@click.option('--depth', default=30, help='Revisions in the stack.')
+@click.option('--stacks', default=100, help='Stacks to hold at once.')
+def main(depth, stacks):
+    revisions = raw_revisions(depth)
+
+    def build_dicts(revisions):
+        return [build_objects(revisions).serialize() for _ in range(stacks)]
+
+    def build_slotted(revisions):
+        return [build_objects(revisions) for _ in range(stacks)]
+
+    for name, build in (('dicts', build_dicts), ('slotted', build_slotted)):
+        _, size = measure(build, revisions)
+        line = '{:<8} {} stacks of {} revisions: {:>10,} bytes'
+        click.echo(line.format(name, stacks, depth, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Local stub Phabricator and Transplant HTTP servers for the benchmarks.
+
+The servers answer from generated data after a configurable latency, and
+count the calls made to each of their methods. Revision stacks are built in
+one of the shapes of STACK_SHAPES; each shape returns the revisions of the
+stack and the id of the revision at its top.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+
+from tests.canned_responses.phabricator.repos import CANNED_REPO_MOZCENTRAL
+from tests.canned_responses.phabricator.revisions import \
+    CANNED_REVISION_1, CANNED_REVISION_1_RAW_DIFF
+from tests.canned_responses.phabricator.users import CANNED_USER_1
+from tests.utils import first_result_in_response
+
+
+def make_revision(id_num, parent_ids=()):
+    """Build a differential.query result depending on `parent_ids`."""
+    revision = deepcopy(first_result_in_response(CANNED_REVISION_1))
+    revision['id'] = str(id_num)
+    revision['phid'] = 'PHID-DREV-%s' % id_num
+    revision['title'] = 'My test diff %s' % id_num
+    revision['uri'] = 'http://phabricator.test/D%s' % id_num
+    revision['summary'] = 'Summary %s' % id_num
+    revision['activeDiffPHID'] = 'PHID-DIFF-%s' % id_num
+    revision['auxiliary']['phabricator:depends-on'] = [
+        'PHID-DREV-%s' % i for i in parent_ids
+    ]
+    return revision
+
+
+def make_diff_handle(id_num):
+    """Build the phid.query result of the diff of revision `id_num`."""
+    return {
+        'phid': 'PHID-DIFF-%s' % id_num,
+        'uri': 'http://phabricator.test/differential/diff/%s/' % id_num,
+        'typeName': 'Differential Diff',
+        'type': 'DIFF',
+        'name': 'Diff %s' % id_num,
+        'fullName': 'Diff %s' % id_num,
+        'status': 'open',
+    }
+
+
+def make_rawdiff(id_num):
+    """Build the differential.getrawdiff result of diff `id_num`."""
+    return CANNED_REVISION_1_RAW_DIFF['result'].replace(
+        'hello, world!', 'hello, diff %s!' % id_num
+    )
+
+
+def linear_stack(size):
+    """D1 <- D2 <- ... <- D`size`."""
+    revisions = [make_revision(1)]
+    for i in range(2, size + 1):
+        revisions.append(make_revision(i, [i - 1]))
+    return revisions, size
+
+
+def wide_stack(size):
+    """A revision depending on `size` - 1 independent revisions."""
+    revisions = [make_revision(i) for i in range(1, size)]
+    revisions.append(make_revision(size, range(1, size)))
+    return revisions, size
+
+
+def diamond_stack(size):
+    """`size` diamonds on top of each other.
+
+    Each diamond is two revisions depending on the top of the diamond below,
+    joined by a revision depending on both. A revision shared by two paths
+    is reached once per path when the stack is walked naively, so keep the
+    size small.
+    """
+    revisions = [make_revision(1)]
+    top = 1
+    for _ in range(size):
+        left, right, join = top + 1, top + 2, top + 3
+        revisions.append(make_revision(left, [top]))
+        revisions.append(make_revision(right, [top]))
+        revisions.append(make_revision(join, [left, right]))
+        top = join
+    return revisions, top
+
+
+def deep_stack(size):
+    """A long linear stack."""
+    return linear_stack(size)
+
+
+# Shape name -> (builder, default size)
+STACK_SHAPES = {
+    'linear': (linear_stack, 5),
+    'wide': (wide_stack, 10),
+    'diamond': (diamond_stack, 3),
+    'deep': (deep_stack, 100),
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer:
+    """ A threaded HTTP server running in the background.
+
+    Subclasses implement handle(method, path, form) returning a JSON
+    serializable response body.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._respond(self)
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.httpd.server_port
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def call_counts(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def _respond(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        form = parse_qs(request.rfile.read(length).decode('utf-8'))
+        path = request.path.split('?')[0]
+        with self._lock:
+            self.calls[path] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(self.handle(request.command, path, form))
+        body = body.encode('utf-8')
+
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def handle(self, method, path, form):
+        raise NotImplementedError()
+
+
+class StubPhabricator(StubServer):
+    """ Conduit methods used by Lando, answering for a single stack and the
+    active diffs of its revisions.
+    """
+
+    def __init__(self, revisions, latency=0.0):
+        super().__init__(latency)
+        self.by_id = {r['id']: r for r in revisions}
+        self.by_phid = {r['phid']: r for r in revisions}
+        self.user = first_result_in_response(CANNED_USER_1)
+        self.repo = first_result_in_response(CANNED_REPO_MOZCENTRAL)
+
+    def handle(self, method, path, form):
+        if path == '/api/differential.query':
+            if 'ids[]' in form:
+                found = [self.by_id.get(i) for i in form['ids[]']]
+            else:
+                found = [self.by_phid.get(p) for p in form['phids[]']]
+            result = [r for r in found if r]
+        elif path == '/api/user.query':
+            result = [self.user]
+        elif path == '/api/user.whoami':
+            result = self.user
+        elif path == '/api/phid.query':
+            result = {phid: self.handle_phid(phid) for phid in form['phids[]']}
+        elif path == '/api/differential.getrawdiff':
+            result = make_rawdiff(form['diffID'][0])
+        else:
+            return {
+                'result': None,
+                'error_code': 'ERR-CONDUIT-CALL',
+                'error_info': 'Unknown method: %s' % path,
+            }
+        return {'result': result, 'error_code': None, 'error_info': None}
+
+    def handle_phid(self, phid):
+        """ The diffs of the revisions are found by their phid, any other
+        phid is the repo.
+        """
+        if phid.startswith('PHID-DIFF-'):
+            return make_diff_handle(phid[len('PHID-DIFF-'):])
+        return self.repo
+
+
+class StubTransplant(StubServer):
+    """ Transplant's /autoland, handing out increasing request ids. """
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.request_ids = iter(range(1, 2**31))
+
+    def handle(self, method, path, form):
+        if path == '/autoland':
+            with self._lock:
+                return {'request_id': next(self.request_ids)}
+        return {'error': 'Unknown path: %s' % path}
@@ -0,0 +1,209 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Admission control of landings by the size of their diff.
+
+Huge patches tie up Transplant and the worker sending them, so landings are
+sent to Transplant through lanes, each admitting a bounded number of
+landings at once:
+
+    small:  Most landings, LANDING_SMALL_CONCURRENCY at once.
+    large:  Landings with a diff of at least LANDING_LARGE_DIFF_LINES lines,
+            or of an unknown size, LANDING_LARGE_CONCURRENCY at once.
+
+The size of a diff is the line count Phabricator gives its revision, which
+is loaded with the revision stack, so the diff isn't requested before the
+landing is admitted. A landing waits for its lane until the request
+deadline. Small landings are thus never stuck behind large ones.
+
+The slots of a lane are per process, unless LANDING_LANE_LOCK_DIR is set:
+the processes of the host then share them through lock files, one per slot,
+and the concurrency of a lane is for the whole host. Either way, the queue
+depth and wait times served at GET /landings/lanes are those of the process
+which responded.
+"""
+import fcntl
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from landoapi.singleflight import LOCK_POLL_INTERVAL
+
+
+class Lane:
+    """ Admits at most concurrency callers at once, recording their waits.
+    """
+
+    def __init__(self, name, concurrency, lock_dir=None):
+        """
+        Args:
+            name: The name of the lane.
+            concurrency: The most callers admitted at once.
+            lock_dir: The directory of the lock files of the slots shared by
+                the processes of the host, or None for slots of this process
+                only.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.lock_dir = lock_dir
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.waiting = 0
+            self.active = 0
+            self.admitted = 0
+            self.timed_out = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """ Hold a slot of the lane, waiting for one if they are all taken.
+
+        Args:
+            timeout: The most seconds to wait for a slot, None to wait for as
+                long as it takes.
+
+        Raises:
+            TimeoutError: If no slot was free within timeout.
+        """
+        start = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            host_slot = self._acquire(start, timeout)
+        except TimeoutError:
+            with self._lock:
+                self.waiting -= 1
+                self.timed_out += 1
+            raise
+        wait = time.monotonic() - start
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._release(host_slot)
+
+    def _acquire(self, start, timeout):
+        """ Take a slot of this process and, with a lock_dir, of the host.
+
+        The slot of the process is taken first, so that the callers waiting
+        on it don't poll the lock files too.
+
+        Returns:
+            The locked file of the slot of the host, or None without a
+            lock_dir.
+
+        Raises:
+            TimeoutError: If no slot was free within timeout of start.
+        """
+        if timeout is None:
+            acquired = self._slots.acquire()
+        else:
+            acquired = self._slots.acquire(timeout=timeout)
+        if not acquired:
+            raise TimeoutError()
+        if self.lock_dir is None:
+            return None
+
+        try:
+            return self._lock_host_slot(start, timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _lock_host_slot(self, start, timeout):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        while True:
+            for slot in range(self.concurrency):
+                name = '{}-{:d}.lock'.format(self.name, slot)
+                f = open(os.path.join(self.lock_dir, name), 'a')
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except BlockingIOError:
+                    f.close()
+            if timeout is not None and time.monotonic() - start >= timeout:
+                raise TimeoutError()
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def _release(self, host_slot):
+        if host_slot is not None:
+            # Closing the file releases its lock.
+            host_slot.close()
+        self._slots.release()
+
+    def snapshot(self):
+        """ Return the queue depth and wait times as a dictionary. """
+        with self._lock:
+            admitted = self.admitted
+            mean_wait = self.total_wait / admitted if admitted else 0
+            return {
+                'concurrency': self.concurrency,
+                'waiting': self.waiting,
+                'active': self.active,
+                'admitted': admitted,
+                'timed_out': self.timed_out,
+                'mean_wait': mean_wait,
+                'max_wait': self.max_wait,
+            }
+
+
+class Admission:
+    """ Routes landings to the lane of their diff size, see the module doc.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('LANDING_SMALL_CONCURRENCY', 8)
+        app.config.setdefault('LANDING_LARGE_CONCURRENCY', 1)
+        app.config.setdefault('LANDING_LARGE_DIFF_LINES', 20000)
+        app.config.setdefault('LANDING_LANE_LOCK_DIR', None)
+
+        self.large_lines = app.config['LANDING_LARGE_DIFF_LINES']
+        lock_dir = app.config['LANDING_LANE_LOCK_DIR']
+        small = Lane(
+            'small', app.config['LANDING_SMALL_CONCURRENCY'], lock_dir
+        )
+        large = Lane(
+            'large', app.config['LANDING_LARGE_CONCURRENCY'], lock_dir
+        )
+        self.lanes = OrderedDict([('small', small), ('large', large)])
+
+    def lane_for(self, revision):
+        """ Return the Lane of the landing of a revision.
+
+        Args:
+            revision: The Revision to land.
+        """
+        # Revisions cached before their line count was recorded have none.
+        line_count = getattr(revision, 'line_count', None)
+        if line_count is None or line_count >= self.large_lines:
+            return self.lanes['large']
+        return self.lanes['small']
+
+    def snapshot(self):
+        """ Return the snapshot of each lane, by name. """
+        return OrderedDict(
+            (name, lane.snapshot()) for name, lane in self.lanes.items()
+        )
+
+    def reset(self):
+        for lane in self.lanes.values():
+            lane.reset()
+
+
+admission = Admission()
@@ -0,0 +1,33 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Diff API
+See the OpenAPI Specification for this API in the spec/swagger.yml file.
+"""
+from connexion import problem
+from flask import request, send_file
+from landoapi import deadline
+from landoapi.diffs import load_rawdiff
+
+
+@deadline.bounded('diffs.get')
+def get(diff_id, api_key=None):
+    """ API endpoint at /diffs/{diff_id} to get the raw text of a diff.
+
+    The diff is sent from the local diff store, without reading it into
+    memory, see landoapi.diffs.
+    """
+    stored = load_rawdiff(diff_id, api_key)
+    if stored is None:
+        return problem(
+            404,
+            'Diff not found',
+            'The requested diff does not exist',
+            type='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/404'
+        )
+
+    response = send_file(stored.path, mimetype='text/x-diff', add_etags=False)
+    # The body is content addressed, its digest is a strong ETag.
+    response.set_etag(stored.digest)
+    return response.make_conditional(request)
@@ -5,16 +5,28 @@
 Transplant API
 See the OpenAPI Specification for this API in the spec/swagger.yml file.
 """
+import json
+import time
+
 from connexion import problem
-from flask import request
+from flask import request, Response
+from landoapi import deadline
+from landoapi.admission import admission
 from landoapi.models.landing import (
     Landing,
+    landing_status_poller,
     LandingNotCreatedException,
     LandingNotFoundException,
     RevisionNotFoundException,
+    TRANSPLANT_JOB_FINISHED,
 )
+from landoapi.models.replica import read_replica, record_write
+from landoapi.models.storage import db
+from landoapi.notifier import landing_statuses
+from landoapi.timeouts import EVENTS_KEEPALIVE, EVENTS_MAX_DURATION
 
 
+@deadline.bounded('landings.land')
 def land(data, api_key=None):
     """ API endpoint at /revisions/{id}/transplants to land revision. """
     # get revision_id from body
@@ -39,9 +51,17 @@ def land(data, api_key=None):
             type='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/502'
         )
 
+    record_write()
     return {'id': landing.id}, 202
 
 
+def lanes():
+    """ API endpoint at /landings/lanes to return the queue depth and wait
+    times of the landing admission lanes of this process.
+    """
+    return admission.snapshot(), 200
+
+
 def get_list(revision_id=None, status=None):
     """ API endpoint at /landings to return all Landing objects related to a
     Revision or of specific status.
@@ -53,21 +73,99 @@ def get_list(revision_id=None, status=None):
     if status:
         kwargs['status'] = status
 
-    landings = Landing.query.filter_by(**kwargs).all()
+    with read_replica():
+        landings = Landing.query.filter_by(**kwargs).all()
     return list(map(lambda l: l.serialize(), landings)), 200
 
 
-def get(landing_id):
+def get(landing_id, wait=0, since_status=None):
     """ API endpoint at /landings/{landing_id} to return stored Landing.
+
+    When wait and since_status are given and the Landing's status is still
+    since_status, the response is held for up to wait seconds until the
+    status changes.
     """
     try:
-        landing = Landing.get(landing_id)
+        with read_replica():
+            landing = Landing.get(landing_id)
     except LandingNotFoundException:
-        return problem(
-            404,
-            'Landing not found',
-            'The requested Landing does not exist',
-            type='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/404'
-        )
+        return _landing_not_found()
+
+    data = landing.serialize()
+    if wait and since_status is not None and data['status'] == since_status:
+        # Don't hold on to a database connection while waiting.
+        db.session.close()
+        status = _wait_for_status(data['request_id'], since_status, wait)
+        if status is not None:
+            data['status'] = status
+
+    return data, 200
+
+
+def events(landing_id):
+    """ API endpoint at /landings/{landing_id}/events to stream the status
+    changes of a Landing as Server-Sent Events.
+    """
+    try:
+        with read_replica():
+            landing = Landing.get(landing_id)
+    except LandingNotFoundException:
+        return _landing_not_found()
+
+    landing_id = landing.id
+    request_id = landing.request_id
+    status = landing.status
+    db.session.close()
+
+    def stream(status):
+        yield _status_event(landing_id, status)
+        deadline = time.monotonic() + EVENTS_MAX_DURATION
+        while status != TRANSPLANT_JOB_FINISHED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed = _wait_for_status(
+                request_id, status, min(EVENTS_KEEPALIVE, remaining)
+            )
+            if changed is None:
+                yield ': keepalive\n\n'
+            else:
+                status = changed
+                yield _status_event(landing_id, status)
+
+    return Response(
+        stream(status),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
+def _wait_for_status(request_id, status, timeout):
+    """ Wait up to timeout seconds for the status of a Landing to change.
+
+    The notifier wakes the request up as soon as this process changes the
+    status, or as soon as landing_status_poller reads a change made by
+    another process.
+
+    Returns:
+        The new status, or None if it didn't change before the timeout.
+    """
+    landing_status_poller.start()
+    return landing_statuses.wait(request_id, status, timeout)
+
+
+def _status_event(landing_id, status):
+    data = json.dumps({'id': landing_id, 'status': status}, sort_keys=True)
+    return 'event: status\ndata: {}\n\n'.format(data)
+
 
-    return landing.serialize(), 200
+def _landing_not_found():
+    return problem(
+        404,
+        'Landing not found',
+        'The requested Landing does not exist',
+        type='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/404'
+    )
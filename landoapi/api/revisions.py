@@ -5,17 +5,39 @@
 Revision API
 See the OpenAPI Specification for this API in the spec/swagger.yml file.
 """
+import base64
+
 from connexion import problem
-from landoapi.phabricator_client import PhabricatorClient
+from landoapi import deadline
+from landoapi.models.revision import REVISION_FIELDS, serialize_levels
+from landoapi.revisions import (
+    load_levels, load_revision, load_stack, load_stacks
+)
 
 
-def get(revision_id, api_key=None):
+@deadline.bounded('revisions.get')
+def get(revision_id, api_key=None, fields=None, parents='full'):
     """ Gets revision from Phabricator.
 
+    Only the fields requested are serialized, and the authors and repos are
+    only requested from Phabricator if their fields are. The parent
+    revisions are only loaded when parents is 'full'. If the deadline passes
+    while loading them, the stack loaded so far is returned with the
+    X-Lando-Partial header.
+
     Returns None or revision.
     """
-    phab = PhabricatorClient(api_key)
-    revision = phab.get_revision(id=revision_id)
+    wanted = REVISION_FIELDS if fields is None else fields
+    options = {
+        'with_users': 'author' in wanted,
+        'with_repos': 'repo' in wanted,
+    }
+    if parents == 'full':
+        revision = load_stack(
+            revision_id, api_key, allow_partial=True, **options
+        )
+    else:
+        revision = load_revision(revision_id, api_key, **options)
 
     if not revision:
         # We could not find a matching revision.
@@ -26,93 +48,81 @@ def get(revision_id, api_key=None):
             type='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/404'
         )
 
-    return _format_revision(phab, revision, include_parents=True), 200
-
-
-def _format_revision(
-    phab, revision, include_parents=False, last_author=None, last_repo=None
-):
-    """ Formats a revision given by Phabricator to match Lando's spec.
-
-    See the swagger.yml spec for the Revision definition.
-
-    Args:
-        phab: The PhabricatorClient to use to make additional requests.
-        revision: The initial revision to format.
-        include_parents: A flag to choose whether this method will recursively
-            load parent revisions and format them as well.
-        last_author: A hash of the author who created the revision. This is
-            mainly used by this method itself when recursively loading parent
-            revisions so as to prevent excess requests for what is often the
-            same author on each parent revision.
-        last_repo: A hash of the repo that this revision belongs to. This is
-            mainly used by this method itself when recursively loading parent
-            revisions so as to prevent excess requests for what is often the
-            same repo on each parent revision.
-    Returns:
-        A hash of the formatted revision information.
-    """
+    headers = {}
+    if deadline.is_partial():
+        headers[deadline.PARTIAL_HEADER] = 'true'
+    return revision.serialize(fields, parents), 200, headers
 
-    # Load the author if it isn't the same as the child revision's author.
-    if last_author and revision['authorPHID'] == last_author['phid']:
-        author = last_author
-    else:
-        raw_author = phab.get_user(revision['authorPHID'])
-        author = {
-            'phid': raw_author['phid'],
-            'username': raw_author['userName'],
-            'real_name': raw_author['realName'],
-            'url': raw_author['uri'],
-            'image_url': raw_author['image'],
-        }
-
-    # Load the repo if it isn't the same as the child revision's repo.
-    if revision['repositoryPHID']:
-        if last_repo and revision['repositoryPHID'] == last_repo['phid']:
-            repo = last_repo
+
+@deadline.bounded('revisions.search')
+def search(ids=None, api_key=None, depth=None, cursor=None):
+    """ Gets several revisions and their stacks from Phabricator.
+
+    The revisions, their ancestors, authors and repos are returned once each
+    in node tables keyed by phid, and refer to each other by phid.
+
+    With depth, only the ancestors up to depth levels up are returned, and
+    the response has a cursor to get the next levels with, if any are left.
+    """
+    if cursor is not None:
+        phids = _decode_cursor(cursor)
+        if phids is None:
+            return problem(
+                400,
+                'Invalid cursor',
+                'The cursor is not one returned by this API.',
+                type='https://developer.mozilla.org/en-US/docs/Web/HTTP/'
+                'Status/400'
+            )
+        revisions = load_levels(phids=phids, api_key=api_key, depth=depth)
+        requested = phids
+    elif ids:
+        if depth is None:
+            revisions = load_stacks(ids, api_key)
         else:
-            raw_repo = phab.get_repo(revision['repositoryPHID'])
-            repo = {
-                'phid': raw_repo['phid'],
-                'short_name': raw_repo['name'],
-                'full_name': raw_repo['fullName'],
-                'url': raw_repo['uri'],
-            }
+            revisions = load_levels(ids, api_key=api_key, depth=depth)
+        requested = ids
     else:
-        repo = None
-
-    # This recursively loads the parent of a revision, and the parents of
-    # that parent, and so on, ultimately creating a linked-list type structure
-    # that connects the dependent revisions.
-    parent_revisions = []
-    if include_parents:
-        parent_phids = revision['auxiliary']['phabricator:depends-on']
-        for parent_phid in parent_phids:
-            parent_revision_data = phab.get_revision(phid=parent_phid)
-            if parent_revision_data:
-                parent_revisions.append(
-                    _format_revision(phab, parent_revision_data, True)
-                )
-
-    bug_id = revision['auxiliary'].get('bugzilla.bug-id', None)
+        return problem(
+            400,
+            'Missing ids',
+            'Either ids or cursor must be given.',
+            type='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/400'
+        )
+
+    results = [
+        {
+            'revision_id': _result_id(key, revisions[key]),
+            'phid': revisions[key].phid if revisions[key] else None,
+        } for key in requested
+    ]
+    found = [revision for revision in revisions.values() if revision]
+    response, frontier = serialize_levels(found, depth)
+    response['results'] = results
+    response['cursor'] = _encode_cursor(frontier) if frontier else None
+    return response, 200
+
+
+def _result_id(key, revision):
+    # The revisions of a cursor are requested by phid, so their id is only
+    # known once found.
+    if not key.startswith('PHID-'):
+        return key
+    return 'D{}'.format(revision.id) if revision else None
+
+
+def _encode_cursor(phids):
+    data = ','.join(phids).encode('ascii')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """ Returns the phids of a cursor, or None if it isn't valid. """
     try:
-        bug_id = int(bug_id)
-    except (TypeError, ValueError):
-        bug_id = None
-
-    return {
-        'id': int(revision['id']),
-        'phid': revision['phid'],
-        'bug_id': bug_id,
-        'title': revision['title'],
-        'url': revision['uri'],
-        'date_created': int(revision['dateCreated']),
-        'date_modified': int(revision['dateModified']),
-        'status': int(revision['status']),
-        'status_name': revision['statusName'],
-        'summary': revision['summary'],
-        'test_plan': revision['testPlan'],
-        'author': author,
-        'repo': repo,
-        'parent_revisions': parent_revisions,
-    }
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        phids = data.decode('ascii').split(',')
+    except (ValueError, UnicodeError):
+        return None
+    if not all(phid.startswith('PHID-DREV-') for phid in phids):
+        return None
+    return phids
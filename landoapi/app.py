@@ -6,8 +6,15 @@ import os
 import click
 import connexion
 from connexion.resolver import RestyResolver
+from landoapi.admission import admission
+from landoapi.cache import cache
+from landoapi.compression import compressor
+from landoapi.diffs import diff_store
 from landoapi.dockerflow import dockerflow
-from landoapi.models.storage import db
+from landoapi.models.landing import landing_status_poller
+from landoapi.models.storage import db, REPLICA_BIND
+from landoapi.profiling import profiler
+from landoapi.timeouts import REQUEST_DEADLINE
 
 
 def create_app(version_path):
@@ -18,16 +25,205 @@ def create_app(version_path):
     # Get the Flask app being wrapped by the Connexion app.
     flask_app = app.app
     flask_app.config['VERSION_PATH'] = version_path
+
     flask_app.config.setdefault(
         'SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite://')
     )
     flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    configure_database(flask_app.config)
+    flask_app.config.setdefault(
+        'CACHE_TYPE', os.environ.get('CACHE_TYPE', 'simple')
+    )
+    flask_app.config.setdefault(
+        'CACHE_DIR', os.environ.get('CACHE_DIR', '/tmp/lando-api-cache')
+    )
+
+    # How long, in seconds, loaded revision stacks are reused for when
+    # viewing a revision, and when landing it.
+    flask_app.config.setdefault(
+        'REVISION_CACHE_MAX_AGE',
+        int(os.environ.get('REVISION_CACHE_MAX_AGE', 30))
+    )
+    flask_app.config.setdefault(
+        'LANDING_REVISION_MAX_AGE',
+        int(os.environ.get('LANDING_REVISION_MAX_AGE', 60))
+    )
+    flask_app.config.setdefault(
+        'REVISION_CACHE_TIMEOUT',
+        max(
+            flask_app.config['REVISION_CACHE_MAX_AGE'],
+            flask_app.config['LANDING_REVISION_MAX_AGE']
+        )
+    )
+
+    # How long, in seconds, the stacks cached by the sync stay cached. They
+    # are used past REVISION_CACHE_MAX_AGE while the sync finds them
+    # unmodified, see landoapi.revisions.record_modified().
+    flask_app.config.setdefault(
+        'REVISION_SYNC_CACHE_TIMEOUT',
+        int(os.environ.get('REVISION_SYNC_CACHE_TIMEOUT', 3600))
+    )
+
+    # A directory for the lock files which let a single process of the host
+    # load a stack at a time, see landoapi.revisions.
+    flask_app.config.setdefault(
+        'REVISION_LOAD_LOCK_DIR', os.environ.get('REVISION_LOAD_LOCK_DIR')
+    )
+
+    # The seconds API operations are given to complete, by default and per
+    # operation, e.g. REQUEST_DEADLINES=revisions.get:10,landings.land:30.
+    # See landoapi.deadline.
+    flask_app.config.setdefault(
+        'REQUEST_DEADLINE',
+        float(os.environ.get('REQUEST_DEADLINE', REQUEST_DEADLINE))
+    )
+    flask_app.config.setdefault(
+        'REQUEST_DEADLINES',
+        parse_deadlines(os.environ.get('REQUEST_DEADLINES', ''))
+    )
+
+    # Opt-in request profiling, see landoapi.profiling.
+    flask_app.config.setdefault(
+        'PROFILE_SECRET', os.environ.get('PROFILE_SECRET')
+    )
+    flask_app.config.setdefault(
+        'PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    )
+    flask_app.config.setdefault(
+        'PROFILE_DIR',
+        os.environ.get('PROFILE_DIR', '/tmp/lando-api-profiles')
+    )
+    flask_app.config.setdefault(
+        'PROFILE_MAX_FILES', int(os.environ.get('PROFILE_MAX_FILES', 100))
+    )
+
+    # Compression of JSON responses, see landoapi.compression.
+    flask_app.config.setdefault(
+        'COMPRESS_MIN_SIZE', int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    )
+    flask_app.config.setdefault(
+        'COMPRESS_LEVEL', int(os.environ.get('COMPRESS_LEVEL', 6))
+    )
+    flask_app.config.setdefault(
+        'COMPRESS_CACHE_SIZE', int(os.environ.get('COMPRESS_CACHE_SIZE', 128))
+    )
+
+    # The local store of raw diffs, see landoapi.diffs. With USE_X_SENDFILE
+    # the front end server sends the stored diffs instead of the app.
+    flask_app.config.setdefault(
+        'DIFF_STORE_DIR',
+        os.environ.get('DIFF_STORE_DIR', '/tmp/lando-api-diffs')
+    )
+    flask_app.config.setdefault(
+        'DIFF_STORE_MAX_SIZE',
+        int(os.environ.get('DIFF_STORE_MAX_SIZE', 1024 * 1024 * 1024))
+    )
+    flask_app.config.setdefault(
+        'USE_X_SENDFILE', os.environ.get('USE_X_SENDFILE') == '1'
+    )
+
+    # Seconds between the reads of the statuses of the landings waited on,
+    # which finds the changes made by other processes. See landoapi.notifier.
+    flask_app.config.setdefault(
+        'LANDING_STATUS_POLL_INTERVAL',
+        float(os.environ.get('LANDING_STATUS_POLL_INTERVAL', 5))
+    )
+
+    # Admission of landings by diff size, see landoapi.admission.
+    flask_app.config.setdefault(
+        'LANDING_SMALL_CONCURRENCY',
+        int(os.environ.get('LANDING_SMALL_CONCURRENCY', 8))
+    )
+    flask_app.config.setdefault(
+        'LANDING_LARGE_CONCURRENCY',
+        int(os.environ.get('LANDING_LARGE_CONCURRENCY', 1))
+    )
+    flask_app.config.setdefault(
+        'LANDING_LARGE_DIFF_LINES',
+        int(os.environ.get('LANDING_LARGE_DIFF_LINES', 20000))
+    )
+
+    # A directory for the lock files which let the processes of the host
+    # share the slots of the admission lanes, see landoapi.admission.
+    flask_app.config.setdefault(
+        'LANDING_LANE_LOCK_DIR', os.environ.get('LANDING_LANE_LOCK_DIR')
+    )
 
     flask_app.register_blueprint(dockerflow)
     db.init_app(flask_app)
+    cache.init_app(flask_app)
+    diff_store.init_app(flask_app)
+    admission.init_app(flask_app)
+    landing_status_poller.init_app(
+        flask_app, flask_app.config['LANDING_STATUS_POLL_INTERVAL']
+    )
+    # Flask runs the after_request hooks in the reverse order of their
+    # registration. The profiler is registered first so that its hook runs
+    # last, and the compression time is included in request profiles.
+    profiler.init_app(flask_app)
+    compressor.init_app(flask_app)
     return app
 
 
+def parse_deadlines(value):
+    """Parse a comma separated list of operation:seconds pairs."""
+    deadlines = {}
+    for pair in value.split(','):
+        if pair.strip():
+            operation, seconds = pair.split(':')
+            deadlines[operation.strip()] = float(seconds)
+    return deadlines
+
+
+def configure_database(config):
+    """Set the database engine and pool options from the environment.
+
+    The pool options only apply to server databases such as PostgreSQL. The
+    defaults suit a worker serving a handful of concurrent requests.
+    """
+    env = os.environ.get
+    config.setdefault(
+        'SQLALCHEMY_POOL_SIZE', int(env('DATABASE_POOL_SIZE', 10))
+    )
+    config.setdefault(
+        'SQLALCHEMY_MAX_OVERFLOW', int(env('DATABASE_MAX_OVERFLOW', 10))
+    )
+    # Seconds to wait for a connection before giving up.
+    config.setdefault(
+        'SQLALCHEMY_POOL_TIMEOUT', int(env('DATABASE_POOL_TIMEOUT', 10))
+    )
+    # Recycle connections before servers or proxies drop idle ones.
+    config.setdefault(
+        'SQLALCHEMY_POOL_RECYCLE', int(env('DATABASE_POOL_RECYCLE', 1800))
+    )
+    config.setdefault(
+        'SQLALCHEMY_POOL_PRE_PING', env('DATABASE_POOL_PRE_PING', '1') == '1'
+    )
+    # Milliseconds, 0 disables the timeout.
+    config.setdefault(
+        'SQLALCHEMY_STATEMENT_TIMEOUT',
+        int(env('DATABASE_STATEMENT_TIMEOUT', 30000))
+    )
+    config.setdefault(
+        'SQLALCHEMY_SQLITE_WAL', env('DATABASE_SQLITE_WAL', '1') == '1'
+    )
+
+    # An optional read replica for read-only endpoints, see
+    # landoapi.models.replica.
+    replica_url = env('DATABASE_REPLICA_URL')
+    if replica_url:
+        config.setdefault('SQLALCHEMY_BINDS', {REPLICA_BIND: replica_url})
+    # Seconds of replication lag after which reads go to the primary.
+    config.setdefault(
+        'READ_REPLICA_MAX_LAG', float(env('READ_REPLICA_MAX_LAG', 10))
+    )
+    # Seconds after a client's write during which its reads go to the
+    # primary.
+    config.setdefault(
+        'READ_REPLICA_WRITE_WINDOW', int(env('READ_REPLICA_WRITE_WINDOW', 10))
+    )
+
+
 @click.command()
 @click.option('--debug', envvar='DEBUG', is_flag=True)
 @click.option('--port', envvar='PORT', default=8888)
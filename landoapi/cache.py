@@ -0,0 +1,76 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Application cache.
+
+The cache backend is chosen by the CACHE_TYPE config value:
+
+    simple:      An in-process cache. Each worker has its own.
+    filesystem:  A cache stored in CACHE_DIR which all the processes on a
+                 host share.
+    null:        Caching is disabled.
+
+Values are pickled by every backend, so callers always get a copy of what
+they stored.
+"""
+from flask import current_app
+from werkzeug.contrib.cache import FileSystemCache, NullCache, SimpleCache
+
+
+class Cache:
+    """ Proxy to the cache backend of the current app. """
+
+    def init_app(self, app):
+        """ Create the cache backend for a Flask app from its config. """
+        app.config.setdefault('CACHE_TYPE', 'simple')
+        app.config.setdefault('CACHE_DIR', '/tmp/lando-api-cache')
+        app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        app.config.setdefault('CACHE_THRESHOLD', 1000)
+
+        cache_type = app.config['CACHE_TYPE']
+        timeout = app.config['CACHE_DEFAULT_TIMEOUT']
+        threshold = app.config['CACHE_THRESHOLD']
+        if cache_type == 'simple':
+            backend = SimpleCache(threshold=threshold, default_timeout=timeout)
+        elif cache_type == 'filesystem':
+            backend = FileSystemCache(
+                app.config['CACHE_DIR'],
+                threshold=threshold,
+                default_timeout=timeout
+            )
+        elif cache_type == 'null':
+            backend = NullCache(default_timeout=timeout)
+        else:
+            raise ValueError('Unknown CACHE_TYPE: {}'.format(cache_type))
+
+        app.extensions['lando_cache'] = backend
+
+    @property
+    def backend(self):
+        return current_app.extensions['lando_cache']
+
+    def get(self, key):
+        """ Get a value, or None if the key is missing or has expired. """
+        return self.backend.get(key)
+
+    def get_many(self, *keys):
+        """ Get several values, in the order of keys, None for the missing
+        ones.
+        """
+        return self.backend.get_many(*keys)
+
+    def set(self, key, value, timeout=None):
+        """ Store a value. A timeout of 0 means it never expires. """
+        return self.backend.set(key, value, timeout=timeout)
+
+    def add(self, key, value, timeout=None):
+        """ Store a value only if the key isn't already set. """
+        return self.backend.add(key, value, timeout=timeout)
+
+    def delete(self, key):
+        """ Remove a value. """
+        return self.backend.delete(key)
+
+
+cache = Cache()
@@ -0,0 +1,150 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compression of response bodies.
+
+JSON responses of at least COMPRESS_MIN_SIZE bytes are compressed
+with the best encoding the client accepts: brotli or zstd when the brotli or
+zstandard package is installed, otherwise gzip. Streamed responses, such as
+the landing events, are never compressed.
+
+The API serves the same bodies over and over, e.g. a revision stack from the
+revision cache, so the compressed bodies of the COMPRESS_CACHE_SIZE most
+recent responses are kept by the digest of the uncompressed body. A body is
+then only compressed once however many times it is served.
+
+COMPRESS_LEVEL is passed as is to every encoder: 1 to 9 is the gzip range,
+and a fast setting for brotli (0 to 11) and zstd (1 to 22).
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/problem+json')
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_encodings():
+    """ Return the supported encodings, most preferred first. """
+    encodings = OrderedDict()
+    if brotli is not None:
+        encodings['br'] = _brotli
+    if zstandard is not None:
+        encodings['zstd'] = _zstd
+    encodings['gzip'] = _gzip
+    return encodings
+
+
+def compressible(response):
+    """ Return True if the body of a response may be compressed. """
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+class CompressedBodies:
+    """ A thread safe LRU of compressed bodies, by encoding and digest. """
+
+    def __init__(self, size):
+        self.size = size
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if not self.size:
+            return
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.size:
+                self._bodies.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+
+
+class Compressor:
+    """ Compresses the responses of an app, see the module doc. """
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 128)
+
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.level = app.config['COMPRESS_LEVEL']
+        self.encodings = available_encodings()
+        self.bodies = CompressedBodies(app.config['COMPRESS_CACHE_SIZE'])
+        app.after_request(self.compress_response)
+
+    def negotiate(self):
+        """ Return the best encoding accepted by the client, or None. """
+        return request.accept_encodings.best_match(list(self.encodings))
+
+    def compress_response(self, response):
+        if not compressible(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def compress(self, data, encoding):
+        """ Return data compressed with encoding, compressing it only if it
+        wasn't recently.
+        """
+        key = (encoding, hashlib.sha256(data).digest())
+        body = self.bodies.get(key)
+        if body is None:
+            body = self.encodings[encoding](data, self.level)
+            self.bodies.set(key, body)
+        return body
+
+
+compressor = Compressor()
@@ -0,0 +1,106 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Per-request deadlines.
+
+An API operation wrapped with bounded() must finish within its budget of
+seconds: the REQUEST_DEADLINES config value for the operation, or the
+REQUEST_DEADLINE default. Each upstream request made while handling it is
+given the time remaining as its timeout, and DeadlineExceeded is raised once
+no time is left. The operation then returns a 504 problem, unless it allows
+a partial response, e.g. a stack missing some of its ancestors, sent with
+the X-Lando-Partial header.
+
+Outside of a bounded operation, e.g. in the sync command, upstream requests
+time out after UPSTREAM_TIMEOUT seconds.
+"""
+import functools
+import time
+
+from connexion import problem
+from flask import current_app, g, has_app_context
+
+# The most seconds a single upstream request may take.
+UPSTREAM_TIMEOUT = 10
+
+# Set on the responses which are missing data for lack of time.
+PARTIAL_HEADER = 'X-Lando-Partial'
+
+
+class DeadlineExceeded(Exception):
+    """ The deadline of the current request has passed. """
+
+
+def remaining():
+    """ Return the seconds left until the deadline, or None without one.
+
+    Raises:
+        DeadlineExceeded: If the deadline has passed.
+    """
+    if not has_app_context():
+        return None
+    deadline = g.get('deadline')
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left
+
+
+def upstream_timeout():
+    """ Return the timeout of the next upstream request. """
+    left = remaining()
+    return UPSTREAM_TIMEOUT if left is None else min(left, UPSTREAM_TIMEOUT)
+
+
+def mark_partial():
+    """ Record that the current response is missing data for lack of time.
+    """
+    g.deadline_partial = True
+
+
+def is_partial():
+    """ Return True if mark_partial() was called for the current request. """
+    return g.get('deadline_partial', False)
+
+
+def budget(operation):
+    """ Return the seconds an operation is given. """
+    deadlines = current_app.config['REQUEST_DEADLINES']
+    return deadlines.get(operation, current_app.config['REQUEST_DEADLINE'])
+
+
+def bounded(operation):
+    """ Decorate an API operation to run it within its deadline.
+
+    Args:
+        operation: The name of the operation in REQUEST_DEADLINES, e.g.
+            'revisions.get'.
+    """
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            seconds = budget(operation)
+            g.deadline = time.monotonic() + seconds
+            g.deadline_partial = False
+            try:
+                return f(*args, **kwargs)
+            except DeadlineExceeded:
+                detail = 'The request could not be completed within {} ' \
+                    'seconds.'.format(seconds)
+                return problem(
+                    504,
+                    'Deadline exceeded',
+                    detail,
+                    type='https://developer.mozilla.org/en-US/docs/Web/HTTP/'
+                    'Status/504'
+                )
+            finally:
+                g.pop('deadline', None)
+
+        return wrapper
+
+    return decorator
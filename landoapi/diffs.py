@@ -0,0 +1,248 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Raw diffs of revisions, stored on local disk.
+
+Raw diffs are requested from Phabricator once, then kept in DIFF_STORE_DIR
+where every process of the host finds them. The bodies are stored by the
+sha256 digest of their content, so a diff seen with several api keys is
+stored once:
+
+    objects/<digest[:2]>/<digest>       The raw diff.
+    index/<namespace>/<diff id>.json    Its digest, size and file count.
+
+The index is namespaced by visibility class, like the revision stacks in
+landoapi.revisions: diffs requested with the unprivileged api key are
+indexed in the public namespace and found with every api key, the others
+only with the api key which requested them.
+
+The bodies take at most DIFF_STORE_MAX_SIZE bytes. Reading a body marks it
+as recently used, and the least recently used ones are removed once the
+store grows beyond that size. Their index entries are removed with them.
+
+Diffs are served from disk with send_file(), so they aren't read into
+memory to be sent: gunicorn hands the file to sendfile(), and with
+USE_X_SENDFILE the front end server sends it instead.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import namedtuple
+
+from landoapi.phabricator_client import INVISIBLE, MISSING, \
+    PhabricatorClient
+from landoapi.utils import extract_rawdiff_id_from_uri
+
+logger = logging.getLogger(__name__)
+
+# Files being written start with this prefix, and are left alone by evict().
+TMP_PREFIX = '.tmp-'
+
+StoredDiff = namedtuple(
+    'StoredDiff', ['diff_id', 'digest', 'size', 'files', 'path']
+)
+
+
+class DiffStore:
+    """ A content addressed store of raw diffs, see the module doc. """
+
+    def init_app(self, app):
+        app.config.setdefault('DIFF_STORE_DIR', '/tmp/lando-api-diffs')
+        app.config.setdefault('DIFF_STORE_MAX_SIZE', 1024 * 1024 * 1024)
+
+        self.directory = app.config['DIFF_STORE_DIR']
+        self.max_size = app.config['DIFF_STORE_MAX_SIZE']
+
+    def get(self, diff_id, api_key=None):
+        """ Get a stored diff which api_key may see, or None. """
+        for namespace in _namespaces(api_key):
+            stored = self._read_index(namespace, diff_id)
+            if stored is None:
+                continue
+            try:
+                # Mark the body as recently used.
+                os.utime(stored.path)
+            except FileNotFoundError:
+                # The body was evicted.
+                continue
+            return stored
+        return None
+
+    def put(self, diff_id, rawdiff, api_key=None):
+        """ Store a raw diff requested with api_key.
+
+        Returns:
+            The StoredDiff.
+        """
+        body = rawdiff.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            _write_atomic(path, body)
+
+        stored = StoredDiff(
+            diff_id=diff_id,
+            digest=digest,
+            size=len(body),
+            files=_count_files(rawdiff),
+            path=path
+        )
+        entry = {
+            'digest': stored.digest,
+            'size': stored.size,
+            'files': stored.files
+        }
+        index_path = self._index_path(_namespaces(api_key)[-1], diff_id)
+        _write_atomic(index_path, json.dumps(entry).encode('utf-8'))
+
+        self.evict()
+        return stored
+
+    def evict(self):
+        """ Remove the least recently used bodies beyond DIFF_STORE_MAX_SIZE,
+        and their index entries.
+        """
+        bodies = []
+        for directory, _, names in os.walk(self._objects_dir()):
+            for name in names:
+                if name.startswith(TMP_PREFIX):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                bodies.append((stat.st_mtime, stat.st_size, name))
+
+        excess = sum(size for _, size, _ in bodies) - self.max_size
+        if excess <= 0:
+            return
+
+        evicted = set()
+        for _, size, digest in sorted(bodies):
+            if excess <= 0:
+                break
+            _remove(self._object_path(digest))
+            evicted.add(digest)
+            excess -= size
+
+        for directory, _, names in os.walk(self._index_dir()):
+            for name in names:
+                if name.startswith(TMP_PREFIX):
+                    continue
+                path = os.path.join(directory, name)
+                entry = _read_json(path)
+                if entry is None or entry['digest'] in evicted:
+                    _remove(path)
+
+    def _read_index(self, namespace, diff_id):
+        entry = _read_json(self._index_path(namespace, diff_id))
+        if entry is None:
+            return None
+        return StoredDiff(
+            diff_id=diff_id,
+            digest=entry['digest'],
+            size=entry['size'],
+            files=entry['files'],
+            path=self._object_path(entry['digest'])
+        )
+
+    def _objects_dir(self):
+        return os.path.join(self.directory, 'objects')
+
+    def _index_dir(self):
+        return os.path.join(self.directory, 'index')
+
+    def _object_path(self, digest):
+        return os.path.join(self._objects_dir(), digest[:2], digest)
+
+    def _index_path(self, namespace, diff_id):
+        name = '{:d}.json'.format(int(diff_id))
+        return os.path.join(self._index_dir(), namespace, name)
+
+
+diff_store = DiffStore()
+
+
+def load_rawdiff(diff_id, api_key=None):
+    """ Gets a raw diff, from the store or else from Phabricator.
+
+    Args:
+        diff_id: The id of the diff, e.g. 43480.
+        api_key: The Phabricator api key to request the diff with, or None
+            to use the unprivileged api key.
+
+    Returns:
+        The StoredDiff, or None if the diff doesn't exist or the api key
+        doesn't have permission to view it.
+    """
+    stored = diff_store.get(diff_id, api_key)
+    if stored is not None:
+        return stored
+
+    phab = PhabricatorClient(api_key)
+    rawdiff = phab.get_rawdiff(diff_id)
+    if rawdiff is None:
+        return None
+    return diff_store.put(diff_id, rawdiff, api_key)
+
+
+def get_diff_id(phab, diff_phid):
+    """ Returns the id of a diff from the uri Phabricator gives it, or None
+    if the diff doesn't exist, can't be viewed or its uri isn't understood.
+    """
+    diff = phab.resolve_phids([diff_phid])[diff_phid]
+    if diff in (MISSING, INVISIBLE):
+        return None
+    try:
+        return extract_rawdiff_id_from_uri(diff.get('uri', ''))
+    except (RuntimeError, ValueError):
+        logger.warning('Unknown uri %r of diff %s', diff.get('uri'), diff_phid)
+        return None
+
+
+def _namespaces(api_key):
+    """ The index namespaces api_key may read, the one it writes last. """
+    if not api_key:
+        return ['public']
+    digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    return ['public', 'key-' + digest]
+
+
+def _count_files(rawdiff):
+    return sum(
+        1 for line in rawdiff.splitlines() if line.startswith('diff --git ')
+    )
+
+
+def _write_atomic(path, data):
+    """ Write a file so that readers never see it partially written. """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
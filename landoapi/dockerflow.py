@@ -10,6 +10,8 @@ import json
 
 from flask import Blueprint, current_app, jsonify
 
+from landoapi.models.storage import pool_stats
+
 dockerflow = Blueprint('dockerflow', __name__)
 
 
@@ -20,9 +22,12 @@ def heartbeat():
     This should check all the services that this service depends on
     and return a 200 iff those services and the app itself are
     performing normally. Return a 5XX if something goes wrong.
+
+    The body reports the database connection pool checkout metrics of the
+    process which responded, see landoapi.models.storage.PoolStats.
     """
     # TODO check backing services
-    return '', 200
+    return jsonify({'database_pool': pool_stats.snapshot()}), 200
 
 
 @dockerflow.route('/__lbheartbeat__')
@@ -0,0 +1,65 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Gunicorn configuration for production.
+
+The app is preloaded in the master process, so the workers share its memory
+copy-on-write and start faster. The database pools are emptied before each
+fork, and every worker starts with its own connections and in-process state.
+
+Workers use the gthread worker class by default. The Transplant stub is
+mounted on the session of each TransplantClient, so the threads of a worker
+don't see each other's requests stubbed.
+
+The settings are read from the environment:
+
+    GUNICORN_BIND:                The address to listen on, by default
+                                  0.0.0.0:$PORT.
+    GUNICORN_WORKERS:             The number of worker processes.
+    GUNICORN_WORKER_CLASS:        The gunicorn worker class, gthread by
+                                  default.
+    GUNICORN_THREADS:             Threads per worker, for the gthread worker
+                                  class. Long-polls and event streams hold a
+                                  thread while they wait, so a worker serves
+                                  at most this many watchers at once. Use the
+                                  gevent worker class for many watchers.
+    GUNICORN_KEEPALIVE:           Seconds to keep idle connections open.
+    GUNICORN_TIMEOUT:             Seconds after which a silent worker is
+                                  restarted, by default a little more than
+                                  the default request deadline. A gthread
+                                  worker stays in touch while its requests,
+                                  e.g. event streams, go on.
+    GUNICORN_MAX_REQUESTS:        Requests after which a worker is recycled,
+                                  0 to never recycle workers.
+    GUNICORN_MAX_REQUESTS_JITTER: Random extra requests per worker, so the
+                                  workers aren't all recycled at once.
+"""
+import multiprocessing
+import os
+
+from landoapi.timeouts import REQUEST_DEADLINE
+
+env = os.environ.get
+
+bind = env('GUNICORN_BIND', '0.0.0.0:%s' % env('PORT', '8000'))
+workers = int(env('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = env('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(env('GUNICORN_THREADS', 4))
+keepalive = int(env('GUNICORN_KEEPALIVE', 5))
+timeout = int(env('GUNICORN_TIMEOUT', REQUEST_DEADLINE + 10))
+max_requests = int(env('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(env('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+preload_app = True
+accesslog = '-'
+
+
+def pre_fork(server, worker):
+    from landoapi.wsgi import dispose_engines
+    dispose_engines()
+
+
+def post_fork(server, worker):
+    from landoapi.wsgi import reset_process_state
+    reset_process_state()
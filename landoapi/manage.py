@@ -2,19 +2,88 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import time
+
+from landoapi import migrations
 from landoapi.app import create_app
 from landoapi.models.storage import db
+from landoapi.sync import sync_revisions
 
 from flask_script import Manager
 
 app = create_app('/version.json')
 manager = Manager(app.app)
+migrations_manager = Manager(usage='Migrate the database schema')
+manager.add_command('db', migrations_manager)
 
 
 @manager.command
 def create_db():
     """Creates SQLAlchemy database schema."""
-    return db.create_all()
+    db.create_all()
+    # The new schema is already up to date with every migration.
+    migrations.stamp(db.engine)
+
+
+@migrations_manager.option(
+    '-t', '--target', type=int, help='The version to upgrade to.'
+)
+def upgrade(target=None):
+    """Apply the pending schema migrations."""
+    applied = migrations.upgrade(db.engine, target=target)
+    if not applied:
+        print('The database schema is up to date.')
+
+
+@migrations_manager.command
+def current():
+    """Show the database schema version."""
+    print(
+        'Schema version {} (latest is {}).'.format(
+            migrations.current_version(db.engine), migrations.head_version()
+        )
+    )
+
+
+@migrations_manager.option(
+    '-t', '--target', type=int, help='The version to mark as applied.'
+)
+def stamp(target=None):
+    """Mark migrations as applied without running them."""
+    migrations.stamp(db.engine, target)
+
+
+@manager.option('--page-size', type=int, default=100)
+@manager.option(
+    '--max-pages',
+    type=int,
+    default=10,
+    help='The most pages of revisions to request per sync. A capped sync '
+    'resumes where it stopped on the next run.'
+)
+@manager.option(
+    '--concurrency',
+    type=int,
+    default=4,
+    help='The most stacks to load at once.'
+)
+@manager.option(
+    '--rate', type=float, help='The most stacks to load per second.'
+)
+@manager.option(
+    '--interval',
+    type=int,
+    help='Keep syncing, waiting this many seconds between syncs.'
+)
+def sync(page_size, max_pages, concurrency, rate=None, interval=None):
+    """Load recently modified revisions from Phabricator ahead of requests."""
+    while True:
+        result = sync_revisions(page_size, max_pages, concurrency, rate)
+        summary = 'Synced {} revisions, {} failed, cursor at {}.'
+        print(summary.format(result.synced, result.failed, result.cursor))
+        if not interval:
+            break
+        time.sleep(interval)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Database schema migrations.
+
+Each module in landoapi/migrations/versions is a migration named
+'<version>_<description>.py', e.g. '0002_landing_timestamps.py'. A migration
+module defines an `upgrade(connection)` function and may set
+`transactional = False` to run outside of a transaction, which PostgreSQL
+requires to build indexes with CREATE INDEX CONCURRENTLY.
+
+Applied versions are recorded in the schema_migrations table. Migrations
+should be safe to re-run, as a failed non-transactional migration can leave
+part of its changes behind; the helpers in this module are.
+"""
+import importlib
+import os
+import pkgutil
+import re
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, inspect, \
+    text
+
+VERSIONS_PACKAGE = 'landoapi.migrations.versions'
+VERSIONS_DIR = os.path.join(os.path.dirname(__file__), 'versions')
+MODULE_NAME_RE = re.compile(r'^(?P<version>\d+)_(?P<name>\w+)$')
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations',
+    _metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class Migration:
+    """ A schema migration module. """
+
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    @property
+    def transactional(self):
+        return getattr(self.module, 'transactional', True)
+
+    def upgrade(self, connection):
+        self.module.upgrade(connection)
+
+    def __repr__(self):
+        return '<Migration: %04d_%s>' % (self.version, self.name)
+
+
+def load_migrations():
+    """ Return all the migrations, ordered by version. """
+    migrations = []
+    for _, module_name, _ in pkgutil.iter_modules([VERSIONS_DIR]):
+        match = MODULE_NAME_RE.match(module_name)
+        if not match:
+            continue
+        module = importlib.import_module(
+            '{}.{}'.format(VERSIONS_PACKAGE, module_name)
+        )
+        version = int(match.group('version'))
+        migrations.append(Migration(version, match.group('name'), module))
+    migrations.sort(key=lambda m: m.version)
+    return migrations
+
+
+def head_version():
+    """ Return the version of the latest migration. """
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version(engine):
+    """ Return the latest version applied to the database, 0 if none. """
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        version = connection.execute(
+            text('SELECT MAX(version) FROM schema_migrations')
+        ).scalar()
+    return version or 0
+
+
+def upgrade(engine, target=None, echo=print):
+    """ Apply the migrations newer than the database's current version.
+
+    Args:
+        engine: The SQLAlchemy engine of the database to migrate.
+        target: The version to stop at. Defaults to the latest migration.
+        echo: A function called with a progress message per migration.
+
+    Returns:
+        The list of migrations applied.
+    """
+    current = current_version(engine)
+    pending = [
+        m for m in load_migrations()
+        if m.version > current and (target is None or m.version <= target)
+    ]
+    for migration in pending:
+        echo('Applying {!r}'.format(migration))
+        if migration.transactional:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                _record(connection, migration.version)
+        else:
+            _upgrade_without_transaction(engine, migration)
+            with engine.begin() as connection:
+                _record(connection, migration.version)
+    return pending
+
+
+def stamp(engine, version=None):
+    """ Mark the database as migrated up to a version without running any
+    migrations, e.g. after creating the schema with `db.create_all()`.
+    """
+    version = head_version() if version is None else version
+    current = current_version(engine)
+    with engine.begin() as connection:
+        for migration in load_migrations():
+            if current < migration.version <= version:
+                _record(connection, migration.version)
+
+
+def _record(connection, version):
+    row = {'version': version, 'applied_at': datetime.utcnow()}
+    connection.execute(schema_migrations.insert().values(**row))
+
+
+def _upgrade_without_transaction(engine, migration):
+    if engine.dialect.name != 'postgresql':
+        # Other databases have no statements which can't run in a
+        # transaction, so use one anyway.
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+        return
+
+    with engine.connect() as connection:
+        migration.upgrade(
+            connection.execution_options(isolation_level='AUTOCOMMIT')
+        )
+
+
+def has_column(connection, table, column):
+    """ Return True if a table has a column. """
+    columns = inspect(connection).get_columns(table)
+    return any(c['name'] == column for c in columns)
+
+
+def add_column(connection, table, column):
+    """ Add a nullable column to a table if it doesn't exist yet.
+
+    Nullable columns without a default are added without rewriting or
+    locking the table for long on PostgreSQL.
+
+    Args:
+        connection: The connection to run the migration with.
+        table: The name of the table.
+        column: A sqlalchemy Column describing the new column.
+    """
+    if has_column(connection, table, column.name):
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    statement = 'ALTER TABLE {} ADD COLUMN {} {}'
+    connection.execute(text(statement.format(table, column.name, column_type)))
+
+
+def create_index(connection, name, table, columns, unique=False):
+    """ Create an index if it doesn't exist yet, without blocking writes.
+
+    On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY, which
+    must run in a non-transactional migration. An invalid index left behind
+    by a failed concurrent build is dropped and built again.
+
+    Args:
+        connection: The connection to run the migration with.
+        name: The name of the index.
+        table: The name of the table.
+        columns: A list of the names of the columns to index.
+        unique: Whether to create a unique index.
+    """
+    is_postgresql = connection.dialect.name == 'postgresql'
+    if is_postgresql and _is_invalid_postgresql_index(connection, name):
+        connection.execute(
+            text('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+        )
+
+    connection.execute(
+        text(
+            'CREATE {unique}INDEX {concurrently}IF NOT EXISTS {name} '
+            'ON {table} ({columns})'.format(
+                unique='UNIQUE ' if unique else '',
+                concurrently='CONCURRENTLY ' if is_postgresql else '',
+                name=name,
+                table=table,
+                columns=', '.join(columns)
+            )
+        )
+    )
+
+
+def _is_invalid_postgresql_index(connection, name):
+    query = text(
+        'SELECT NOT indisvalid FROM pg_index '
+        'JOIN pg_class ON pg_class.oid = pg_index.indexrelid '
+        'WHERE pg_class.relname = :name'
+    )
+    return connection.execute(query, {'name': name}).scalar() or False
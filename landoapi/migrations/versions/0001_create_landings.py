@@ -0,0 +1,23 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Create the landings table.
+
+Databases created with `manage.py create_db` before migrations existed
+already have this table, so it is only created if it is missing.
+"""
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    landings = Table(
+        'landings',
+        metadata,
+        Column('id', Integer, primary_key=True),
+        Column('request_id', Integer, unique=True),
+        Column('revision_id', String(30)),
+        Column('status', Integer),
+    )
+    landings.create(connection, checkfirst=True)
@@ -0,0 +1,16 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Record when landings are created and last updated.
+
+The columns are nullable so that adding them doesn't rewrite the table.
+"""
+from sqlalchemy import Column, DateTime
+
+from landoapi.migrations import add_column
+
+
+def upgrade(connection):
+    add_column(connection, 'landings', Column('created_at', DateTime))
+    add_column(connection, 'landings', Column('updated_at', DateTime))
@@ -0,0 +1,20 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Index the columns landings are looked up by.
+
+GET /landings filters on revision_id and status. request_id already has an
+index through its unique constraint, so it doesn't get a second one.
+"""
+from landoapi.migrations import create_index
+
+# CREATE INDEX CONCURRENTLY can't run in a transaction.
+transactional = False
+
+
+def upgrade(connection):
+    create_index(
+        connection, 'ix_landings_revision_id', 'landings', ['revision_id']
+    )
+    create_index(connection, 'ix_landings_status', 'landings', ['status'])
@@ -0,0 +1,21 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Create the revision_edges index of dependencies between revisions.
+
+The table starts empty and is filled as revision stacks are loaded.
+"""
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    revision_edges = Table(
+        'revision_edges',
+        metadata,
+        Column('child_phid', String(64), primary_key=True),
+        Column('parent_phid', String(64), primary_key=True),
+        Column('date_modified', Integer, nullable=False),
+    )
+    revision_edges.create(connection, checkfirst=True)
@@ -0,0 +1,19 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Create the sync_cursors table of `manage.py sync`.
+"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    sync_cursors = Table(
+        'sync_cursors',
+        metadata,
+        Column('name', String(64), primary_key=True),
+        Column('value', Integer, nullable=False),
+        Column('updated_at', DateTime),
+    )
+    sync_cursors.create(connection, checkfirst=True)
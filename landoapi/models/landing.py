@@ -1,38 +1,29 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from landoapi.models.storage import db
-from landoapi.phabricator_client import PhabricatorClient
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+
+from landoapi import deadline
+from landoapi.admission import admission
+from landoapi.models.storage import (
+    db, in_unit_of_work, RoutingSession, unit_of_work
+)
+from landoapi.notifier import landing_statuses, Poller
+from landoapi.revisions import load_revision
 from landoapi.transplant_client import TransplantClient
 
 TRANSPLANT_JOB_STARTED = 'started'
 TRANSPLANT_JOB_FINISHED = 'finished'
 
+# The most request ids put in one UPDATE, to stay under SQLite's limit of
+# 999 bound parameters per statement.
+BULK_UPDATE_CHUNK_SIZE = 500
 
-def _get_revision(revision_id, api_key=None):
-    """ Gets revision from Phabricator.
-
-    Returns None or revision.
-    """
-    phab = PhabricatorClient(api_key)
-    revision = phab.get_revision(id=revision_id)
-    if not revision:
-        return None
-
-    raw_repo = phab.get_repo(revision['repositoryPHID'])
-    return {
-        'id': int(revision['id']),
-        'phid': revision['phid'],
-        'repo_url': raw_repo['uri'],
-        'title': revision['title'],
-        'url': revision['uri'],
-        'date_created': int(revision['dateCreated']),
-        'date_modified': int(revision['dateModified']),
-        'status': int(revision['status']),
-        'status_name': revision['statusName'],
-        'summary': revision['summary'],
-        'test_plan': revision['testPlan'],
-    }
+# The session.info key of the status changes to publish on commit.
+PENDING_STATUSES_KEY = 'pending_landing_statuses'
 
 
 class Landing(db.Model):
@@ -40,8 +31,12 @@ class Landing(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     request_id = db.Column(db.Integer, unique=True)
-    revision_id = db.Column(db.String(30))
-    status = db.Column(db.Integer)
+    revision_id = db.Column(db.String(30), index=True)
+    status = db.Column(db.Integer, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
 
     def __init__(
         self, request_id=None, revision_id=None, status=TRANSPLANT_JOB_STARTED
@@ -52,15 +47,39 @@ class Landing(db.Model):
 
     @classmethod
     def create(cls, revision_id, phabricator_api_key=None, save=True):
-        """ Land revision and create a Transplant item in storage. """
-        revision = _get_revision(revision_id, phabricator_api_key)
+        """ Land revision and create a Transplant item in storage.
+
+        A revision stack loaded within the last LANDING_REVISION_MAX_AGE
+        seconds, e.g. by the UI viewing the revision, is reused instead of
+        requesting the revision from Phabricator again.
+
+        The landing waits for a free slot in the admission lane of its diff
+        size, as given by the line count of the revision, before being sent
+        to Transplant.
+
+        Raises:
+            DeadlineExceeded: If the request's deadline passes while waiting
+                for the lane.
+        """
+        revision = load_revision(
+            revision_id,
+            phabricator_api_key,
+            max_age=current_app.config['LANDING_REVISION_MAX_AGE']
+        )
         if not revision:
             raise RevisionNotFoundException(revision_id)
 
+        # Large diffs are sent to Transplant through their own lane, so they
+        # don't hold up the others, see landoapi.admission.
+        lane = admission.lane_for(revision)
         trans = TransplantClient()
-        request_id = trans.land(
-            'ldap_username@example.com', revision['repo_url']
-        )
+        try:
+            with lane.admit(timeout=deadline.remaining()):
+                request_id = trans.land(
+                    'ldap_username@example.com', revision.repo.url
+                )
+        except TimeoutError:
+            raise deadline.DeadlineExceeded()
         if not request_id:
             raise LandingNotCreatedException
 
@@ -83,12 +102,62 @@ class Landing(db.Model):
 
         return landing
 
+    @classmethod
+    def bulk_create(cls, landings):
+        """ Insert many Landings in a single transaction.
+
+        The Landings' ids aren't loaded back from the database.
+        """
+        with unit_of_work() as session:
+            session.bulk_save_objects(landings)
+        return landings
+
+    @classmethod
+    def bulk_update_status(cls, statuses):
+        """ Set the status of many Landings in a single transaction.
+
+        Landings are updated with one UPDATE statement per distinct status
+        (and per BULK_UPDATE_CHUNK_SIZE landings), without loading them.
+
+        Args:
+            statuses: A dict mapping Transplant request ids to the new status
+                of their Landing.
+
+        Returns:
+            The number of Landings updated.
+        """
+        by_status = {}
+        for request_id, status in statuses.items():
+            by_status.setdefault(status, []).append(request_id)
+
+        updated = 0
+        with unit_of_work():
+            for status, request_ids in by_status.items():
+                for i in range(0, len(request_ids), BULK_UPDATE_CHUNK_SIZE):
+                    chunk = request_ids[i:i + BULK_UPDATE_CHUNK_SIZE]
+                    query = cls.query.filter(cls.request_id.in_(chunk))
+                    values = {'status': status}
+                    updated += query.update(values, synchronize_session=False)
+                    for request_id in chunk:
+                        _queue_status_change(request_id, status)
+        return updated
+
     def save(self, create=False):
-        """ Save objects in storage. """
+        """ Save objects in storage.
+
+        Inside a unit_of_work() block the changes are only flushed, and are
+        committed when the block exits. The status is published to the
+        landing_statuses notifier once committed.
+        """
         if create:
             db.session.add(self)
+        if self.request_id is not None:
+            _queue_status_change(self.request_id, self.status)
 
-        db.session.commit()
+        if in_unit_of_work():
+            db.session.flush()
+        else:
+            db.session.commit()
         return self
 
     def __repr__(self):
@@ -104,6 +173,43 @@ class Landing(db.Model):
         }
 
 
+def _queue_status_change(request_id, status):
+    pending = db.session.info.setdefault(PENDING_STATUSES_KEY, {})
+    pending[request_id] = status
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _publish_status_changes(session):
+    pending = session.info.pop(PENDING_STATUSES_KEY, None)
+    for request_id, status in (pending or {}).items():
+        landing_statuses.publish(request_id, status)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_status_changes(session):
+    session.info.pop(PENDING_STATUSES_KEY, None)
+
+
+def _read_statuses(request_ids):
+    """ Read the statuses of Landings from the primary database, with one
+    query per BULK_UPDATE_CHUNK_SIZE request ids.
+    """
+    statuses = {}
+    try:
+        for i in range(0, len(request_ids), BULK_UPDATE_CHUNK_SIZE):
+            chunk = request_ids[i:i + BULK_UPDATE_CHUNK_SIZE]
+            query = db.session.query(Landing.request_id, Landing.status)
+            statuses.update(query.filter(Landing.request_id.in_(chunk)))
+    finally:
+        db.session.close()
+    return statuses
+
+
+# Publishes the status changes committed by other processes to the
+# landing_statuses notifier.
+landing_status_poller = Poller(landing_statuses, _read_statuses)
+
+
 class LandingNotCreatedException(Exception):
     """ Transplant service failed to land a revision. """
     pass
@@ -0,0 +1,157 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Routing of read-only queries to a read replica database.
+
+The replica is configured with the 'replica' entry of SQLALCHEMY_BINDS.
+Reads are sent to the primary database instead when:
+
+    - no replica is configured,
+    - the client wrote to the database within the last
+      READ_REPLICA_WRITE_WINDOW seconds, so it reads its own writes,
+    - the replica lags more than READ_REPLICA_MAX_LAG seconds behind the
+      primary, or can't be reached.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import after_this_request, current_app, has_request_context, \
+    request
+from sqlalchemy import text
+
+from landoapi.models.storage import db, REPLICA_BIND
+
+logger = logging.getLogger(__name__)
+
+# Cookie holding the time until which the client's reads go to the primary.
+PRIMARY_UNTIL_COOKIE = 'lando-primary-until'
+
+# How long, in seconds, a replica lag measurement is reused for.
+LAG_CHECK_INTERVAL = 5
+
+
+class ReplicaLag:
+    """ The replica's replication lag, measured at most once per interval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._checked_at = None
+            self._lag = None
+
+    def get(self):
+        """ Return the lag in seconds, or None if the replica is down. """
+        now = time.monotonic()
+        with self._lock:
+            fresh = (
+                self._checked_at is not None and
+                now - self._checked_at < LAG_CHECK_INTERVAL
+            )
+            if fresh:
+                return self._lag
+
+        lag = measure_replica_lag()
+        with self._lock:
+            self._checked_at = now
+            self._lag = lag
+        return lag
+
+
+replica_lag = ReplicaLag()
+
+
+def measure_replica_lag():
+    """ Ask the replica how far behind the primary it is.
+
+    Returns:
+        The lag in seconds, 0 if the database can't report it (e.g. SQLite),
+        or None if the replica can't be reached.
+    """
+    engine = db.get_engine(current_app, bind=REPLICA_BIND)
+    try:
+        with engine.connect() as connection:
+            if engine.dialect.name != 'postgresql':
+                connection.execute(text('SELECT 1'))
+                return 0
+            lag = connection.execute(
+                text(
+                    'SELECT EXTRACT(EPOCH FROM '
+                    'now() - pg_last_xact_replay_timestamp())'
+                )
+            ).scalar()
+    except Exception:
+        logger.exception('The read replica is unavailable.')
+        return None
+    # The lag is NULL when the database isn't a replica.
+    return float(lag or 0)
+
+
+def replica_configured():
+    binds = current_app.config.get('SQLALCHEMY_BINDS') or {}
+    return REPLICA_BIND in binds
+
+
+def client_recently_wrote():
+    """ Return True if the client is in its read-your-writes window. """
+    if not has_request_context():
+        return False
+    try:
+        primary_until = float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() < primary_until
+
+
+def record_write():
+    """ Send the current client's reads to the primary for a while.
+
+    Call this from endpoints which write to the database, so that the client
+    can read its own writes before they reach the replica.
+    """
+    if not replica_configured():
+        return
+
+    window = current_app.config['READ_REPLICA_WRITE_WINDOW']
+    primary_until = time.time() + window
+
+    @after_this_request
+    def set_primary_cookie(response):
+        response.set_cookie(
+            PRIMARY_UNTIL_COOKIE,
+            '{:.3f}'.format(primary_until),
+            max_age=window
+        )
+        return response
+
+
+def use_replica():
+    """ Return True if reads can be sent to the replica right now. """
+    if not replica_configured() or client_recently_wrote():
+        return False
+
+    lag = replica_lag.get()
+    if lag is None or lag > current_app.config['READ_REPLICA_MAX_LAG']:
+        return False
+    return True
+
+
+@contextmanager
+def read_replica():
+    """ Send the queries made in the block to the replica if possible.
+
+    Only use this around read-only queries.
+    """
+    session = db.session()
+    previous = session.use_replica
+    session.use_replica = use_replica()
+    try:
+        yield session
+    finally:
+        session.use_replica = previous
@@ -0,0 +1,368 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compact value objects for the Phabricator data Lando works with.
+
+This is the one place where Phabricator's response fields are mapped to
+Lando's API payloads. See the swagger.yml spec for the Revision, User and
+Repo definitions.
+
+The classes use __slots__ as many of them are held in caches. Revisions of
+the same stack share their User and Repo instances; use a PhabricatorObjects
+registry to build them.
+"""
+from landoapi.phabricator_client import INVISIBLE, MISSING
+
+# The fields of a serialized Revision which can be selected, besides its
+# parents. The id and phid are always included.
+REVISION_FIELDS = (
+    'id', 'phid', 'bug_id', 'title', 'url', 'date_created', 'date_modified',
+    'status', 'status_name', 'summary', 'test_plan', 'author', 'repo'
+)
+
+
+class User:
+    """ A Phabricator user, e.g. the author of a revision. """
+    __slots__ = ('phid', 'username', 'real_name', 'url', 'image_url')
+
+    def __init__(self, phid, username, real_name, url, image_url):
+        self.phid = phid
+        self.username = username
+        self.real_name = real_name
+        self.url = url
+        self.image_url = image_url
+
+    @classmethod
+    def from_phabricator(cls, data):
+        """ Build a User from a user.query result. """
+        return cls(
+            data['phid'], data['userName'], data['realName'], data['uri'],
+            data['image']
+        )
+
+    def serialize(self):
+        """ Serialize to JSON compatible dictionary. """
+        return {
+            'phid': self.phid,
+            'username': self.username,
+            'real_name': self.real_name,
+            'url': self.url,
+            'image_url': self.image_url,
+        }
+
+    def __repr__(self):
+        return '<User: %s>' % self.username
+
+
+class Repo:
+    """ A Phabricator repository. """
+    __slots__ = ('phid', 'short_name', 'full_name', 'url')
+
+    def __init__(self, phid, short_name, full_name, url):
+        self.phid = phid
+        self.short_name = short_name
+        self.full_name = full_name
+        self.url = url
+
+    @classmethod
+    def from_phabricator(cls, data):
+        """ Build a Repo from a phid.query result. """
+        return cls(data['phid'], data['name'], data['fullName'], data['uri'])
+
+    def serialize(self):
+        """ Serialize to JSON compatible dictionary. """
+        return {
+            'phid': self.phid,
+            'short_name': self.short_name,
+            'full_name': self.full_name,
+            'url': self.url,
+        }
+
+    def __repr__(self):
+        return '<Repo: %s>' % self.short_name
+
+
+class Revision:
+    """ A Phabricator revision and, once loaded, its parent revisions. """
+    __slots__ = (
+        'id', 'phid', 'bug_id', 'title', 'url', 'date_created',
+        'date_modified', 'status', 'status_name', 'summary', 'test_plan',
+        'author', 'repo', 'parent_phids', 'parents', 'line_count'
+    )
+
+    def __init__(
+        self,
+        id,
+        phid,
+        bug_id,
+        title,
+        url,
+        date_created,
+        date_modified,
+        status,
+        status_name,
+        summary,
+        test_plan,
+        author,
+        repo,
+        parent_phids=(),
+        parents=(),
+        line_count=None
+    ):
+        self.id = id
+        self.phid = phid
+        self.bug_id = bug_id
+        self.title = title
+        self.url = url
+        self.date_created = date_created
+        self.date_modified = date_modified
+        self.status = status
+        self.status_name = status_name
+        self.summary = summary
+        self.test_plan = test_plan
+        self.author = author
+        self.repo = repo
+        self.parent_phids = parent_phids
+        self.parents = parents
+        self.line_count = line_count
+
+    @classmethod
+    def from_phabricator(cls, data, author, repo):
+        """ Build a Revision from a differential.query result.
+
+        Args:
+            data: The revision hash as returned by Phabricator.
+            author: The User who authored the revision, or None if it is
+                missing or can't be viewed.
+            repo: The Repo of the revision, or None if it has no repo.
+        """
+        auxiliary = data['auxiliary']
+        bug_id = auxiliary.get('bugzilla.bug-id', None)
+        try:
+            bug_id = int(bug_id)
+        except (TypeError, ValueError):
+            bug_id = None
+        try:
+            line_count = int(data['lineCount'])
+        except (KeyError, TypeError, ValueError):
+            line_count = None
+
+        return cls(
+            int(data['id']),
+            data['phid'],
+            bug_id,
+            data['title'],
+            data['uri'],
+            int(data['dateCreated']),
+            int(data['dateModified']),
+            int(data['status']),
+            data['statusName'],
+            data['summary'],
+            data['testPlan'],
+            author,
+            repo,
+            parent_phids=tuple(auxiliary['phabricator:depends-on']),
+            line_count=line_count,
+        )
+
+    def serialize(self, fields=None, parents='full'):
+        """ Serialize to JSON compatible dictionary, including parents.
+
+        Args:
+            fields: The names of the REVISION_FIELDS to include, all of them
+                if None. The id and phid are always included.
+            parents: 'full' to include the parent revisions, serialized with
+                the same fields, 'ids' to include only the phids of the
+                parents, or 'none' to leave the parents out.
+        """
+        payload = {}
+        for name in REVISION_FIELDS:
+            if fields is None or name in fields or name in ('id', 'phid'):
+                payload[name] = getattr(self, name)
+        if payload.get('author'):
+            payload['author'] = self.author.serialize()
+        if payload.get('repo'):
+            payload['repo'] = self.repo.serialize()
+
+        if parents == 'full':
+            payload['parent_revisions'] = [
+                p.serialize(fields, parents) for p in self.parents
+            ]
+        elif parents == 'ids':
+            payload['parent_phids'] = list(self.parent_phids)
+        return payload
+
+    def serialize_node(self):
+        """ Serialize to JSON compatible dictionary, referring to the author,
+        repo and parents by phid.
+        """
+        return {
+            'id': self.id,
+            'phid': self.phid,
+            'bug_id': self.bug_id,
+            'title': self.title,
+            'url': self.url,
+            'date_created': self.date_created,
+            'date_modified': self.date_modified,
+            'status': self.status,
+            'status_name': self.status_name,
+            'summary': self.summary,
+            'test_plan': self.test_plan,
+            'author_phid': self.author.phid if self.author else None,
+            'repo_phid': self.repo.phid if self.repo else None,
+            'parent_phids': [p.phid for p in self.parents],
+        }
+
+    def __repr__(self):
+        return '<Revision: D%s>' % self.id
+
+
+class PhabricatorObjects:
+    """ Builds value objects, sharing one User and Repo instance per phid.
+
+    Users and repos are only requested from Phabricator the first time their
+    phid is seen by the registry, so one registry should be used for all the
+    revisions of a stack. The ones which are missing, or which the api key
+    can't view, are recorded as None so that they aren't requested again.
+    """
+
+    def __init__(self, phab, with_users=True, with_repos=True):
+        """
+        Args:
+            phab: The PhabricatorClient to use to look up users and repos.
+            with_users: False to skip the user lookups, leaving the authors
+                of the revisions built as None.
+            with_repos: False to skip the repo lookups, leaving the repos of
+                the revisions built as None.
+        """
+        self.phab = phab
+        self.with_users = with_users
+        self.with_repos = with_repos
+        self.users = {}
+        self.repos = {}
+
+    def user(self, phid):
+        """ Get the User with the given phid, or None if it is missing or
+        invisible.
+        """
+        if not self.with_users:
+            return None
+        if phid not in self.users:
+            data = self.phab.get_user(phid)
+            self.users[phid] = User.from_phabricator(data) if data else None
+        return self.users[phid]
+
+    def repo(self, phid):
+        """ Get the Repo with the given phid, or None if phid is empty or
+        the repo is missing or invisible.
+        """
+        if not phid or not self.with_repos:
+            return None
+        if phid not in self.repos:
+            data = self.phab.get_repo(phid)
+            self.repos[phid] = Repo.from_phabricator(data) if data else None
+        return self.repos[phid]
+
+    def revision(self, data):
+        """ Build a Revision, without parents, from a differential.query
+        result.
+        """
+        author = self.user(data['authorPHID'])
+        repo = self.repo(data['repositoryPHID'])
+        return Revision.from_phabricator(data, author, repo)
+
+    def revisions(self, revisions_data):
+        """ Build Revisions, without parents, from differential.query results.
+
+        The authors and repos not seen yet are requested together, with a
+        single resolve_phids() call. The missing and invisible ones are
+        recorded as None.
+        """
+        user_phids, repo_phids = set(), set()
+        if self.with_users:
+            user_phids = {data['authorPHID'] for data in revisions_data}
+            user_phids -= set(self.users)
+        if self.with_repos:
+            repo_phids = {data['repositoryPHID'] for data in revisions_data}
+            repo_phids -= set(self.repos)
+            repo_phids.discard(None)
+            repo_phids.discard('')
+
+        if user_phids or repo_phids:
+            resolved = self.phab.resolve_phids(user_phids | repo_phids)
+            for phid, data in resolved.items():
+                found = data not in (MISSING, INVISIBLE)
+                if phid in user_phids:
+                    user = User.from_phabricator(data) if found else None
+                    self.users[phid] = user
+                else:
+                    repo = Repo.from_phabricator(data) if found else None
+                    self.repos[phid] = repo
+
+        return [self.revision(data) for data in revisions_data]
+
+
+def serialize_graph(revisions):
+    """ Serialize revisions and all their ancestors into node tables.
+
+    Each revision, user and repo appears once, however many of the
+    revisions share it.
+
+    Returns:
+        A JSON compatible dictionary with the 'revisions', 'users' and
+        'repos' node tables, each keyed by phid.
+    """
+    graph, _ = serialize_levels(revisions)
+    return graph
+
+
+def serialize_levels(revisions, depth=None):
+    """ Serialize revisions and their ancestors up to depth levels up.
+
+    Like serialize_graph(), but the ancestors more than depth levels above
+    the revisions are left out. The revisions of the last level keep their
+    parent_phids, and the left out parents are returned so that they can be
+    requested next.
+
+    Args:
+        revisions: The Revisions to serialize.
+        depth: The most levels of ancestors to include, or None to include
+            them all.
+
+    Returns:
+        A (graph, frontier) tuple: the node tables as serialize_graph()
+        returns them, and the sorted phids of the parents which were left
+        out.
+    """
+    nodes, users, repos = {}, {}, {}
+    last_level = []
+    level = list(revisions)
+    levels = 0
+    while level:
+        next_level = []
+        for revision in level:
+            if revision.phid in nodes:
+                continue
+            node = revision.serialize_node()
+            nodes[revision.phid] = node
+            if revision.author:
+                users[revision.author.phid] = revision.author.serialize()
+            if revision.repo:
+                repos[revision.repo.phid] = revision.repo.serialize()
+            if depth is not None and levels == depth:
+                # Its parents aren't loaded, or are left out.
+                node['parent_phids'] = list(revision.parent_phids)
+                last_level.append(revision)
+            else:
+                next_level.extend(revision.parents)
+        level = next_level
+        levels += 1
+
+    frontier = {
+        phid
+        for revision in last_level
+        for phid in revision.parent_phids if phid not in nodes
+    }
+    graph = {'revisions': nodes, 'users': users, 'repos': repos}
+    return graph, sorted(frontier)
@@ -0,0 +1,139 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Local index of the dependencies between revisions.
+
+Each row records that a revision depended on a parent revision when the
+revision was last seen with the given dateModified. The index is filled as
+stacks are loaded, and only lets the loader know which revisions to request
+from Phabricator. Phabricator stays the source of truth.
+"""
+import logging
+
+from sqlalchemy import literal, select
+from sqlalchemy.exc import IntegrityError
+
+from landoapi.models.storage import db, in_unit_of_work, unit_of_work
+
+logger = logging.getLogger(__name__)
+
+
+class RevisionEdge(db.Model):
+    __tablename__ = 'revision_edges'
+
+    child_phid = db.Column(db.String(64), primary_key=True)
+    parent_phid = db.Column(db.String(64), primary_key=True)
+    # The dateModified of the child revision when the edge was recorded.
+    date_modified = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, child_phid, parent_phid, date_modified):
+        self.child_phid = child_phid
+        self.parent_phid = parent_phid
+        self.date_modified = date_modified
+
+    @classmethod
+    def ancestors(cls, *phids, depth=None):
+        """ Get the phids of all the known ancestors of revisions.
+
+        The ancestors are found with a single recursive query.
+
+        Args:
+            phids: The phids of the revisions.
+            depth: The most levels of ancestors to get, or None to get them
+                all.
+
+        Returns:
+            A set of phids, empty if the revisions have no known parents.
+        """
+        if depth is not None:
+            return cls._ancestors_within(phids, depth)
+
+        edges = cls.__table__
+        parents = select([edges.c.parent_phid.label('phid')])
+        parents = parents.where(edges.c.child_phid.in_(phids))
+        ancestors = parents.cte('ancestors', recursive=True)
+        # UNION, rather than UNION ALL, stops at revisions already found, so
+        # the query ends even if the recorded edges contain a cycle.
+        next_parents = select([edges.c.parent_phid])
+        next_parents = next_parents.where(
+            edges.c.child_phid == ancestors.c.phid
+        )
+        ancestors = ancestors.union(next_parents)
+        rows = db.session.execute(select([ancestors.c.phid]))
+        return {row.phid for row in rows}
+
+    @classmethod
+    def _ancestors_within(cls, phids, depth):
+        if depth < 1:
+            return set()
+
+        # The level of each ancestor is tracked to stop at depth, which also
+        # ends the query on cycles.
+        edges = cls.__table__
+        columns = [
+            edges.c.parent_phid.label('phid'), literal(1).label('level')
+        ]
+        parents = select(columns)
+        parents = parents.where(edges.c.child_phid.in_(phids))
+        ancestors = parents.cte('ancestors', recursive=True)
+        next_parents = select([edges.c.parent_phid, ancestors.c.level + 1])
+        next_parents = next_parents.where(
+            edges.c.child_phid == ancestors.c.phid
+        ).where(ancestors.c.level < depth)
+        ancestors = ancestors.union(next_parents)
+        rows = db.session.execute(select([ancestors.c.phid]).distinct())
+        return {row.phid for row in rows}
+
+    @classmethod
+    def record(cls, revisions):
+        """ Record the parents of revisions which changed since last seen.
+
+        The edges of a revision are only rewritten when its dateModified
+        differs from the one they were recorded with. Revisions without
+        parents, and without recorded edges, are left alone.
+
+        Recording is best effort: the index is only a hint, so when another
+        request records the same revisions at the same time, the losing
+        transaction is rolled back and its edges are dropped.
+
+        Args:
+            revisions: Revision objects, with their parent_phids.
+        """
+        revisions = {r.phid: r for r in revisions}
+        if not revisions:
+            return
+
+        query = db.session.query(cls.child_phid, cls.date_modified)
+        query = query.filter(cls.child_phid.in_(list(revisions)))
+        recorded = dict(query.distinct())
+        changed = []
+        for phid, r in revisions.items():
+            if phid not in recorded and not r.parent_phids:
+                # There is nothing to record, nor to delete.
+                continue
+            if recorded.get(phid) != r.date_modified:
+                changed.append(r)
+        if not changed:
+            return
+
+        stale = cls.query.filter(cls.child_phid.in_([r.phid for r in changed]))
+        edges = [
+            cls(r.phid, parent_phid, r.date_modified)
+            for r in changed for parent_phid in r.parent_phids
+        ]
+        try:
+            with unit_of_work() as session:
+                stale.delete(synchronize_session=False)
+                session.bulk_save_objects(edges)
+        except IntegrityError:
+            # An enclosing unit of work decides what to do with its
+            # transaction, which can't be partly rolled back.
+            if in_unit_of_work():
+                raise
+            logger.warning(
+                'Revision edges were recorded concurrently, keeping those.'
+            )
+
+    def __repr__(self):
+        return '<RevisionEdge: %s -> %s>' % (self.child_phid, self.parent_phid)
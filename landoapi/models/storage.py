@@ -1,6 +1,211 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from flask_sqlalchemy import SQLAlchemy
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import flask_sqlalchemy
+from sqlalchemy import exc, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+# The SQLALCHEMY_BINDS key of the optional read replica database.
+REPLICA_BIND = 'replica'
+
+# Pool settings which only apply to a QueuePool.
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class PoolStats:
+    """ Connection pool checkout metrics, shared by all the pools of a
+    process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.saturated_checkouts = 0
+
+    def record_checkout(self, wait, checked_out, capacity):
+        """ Record a connection checkout.
+
+        Args:
+            wait: Seconds spent waiting for the connection.
+            checked_out: Connections checked out of the pool, including this
+                one.
+            capacity: The most connections the pool will hand out at once,
+                or None if it has no limit.
+        """
+        saturated = capacity is not None and checked_out >= capacity
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if saturated:
+                self.saturated_checkouts += 1
+
+        if saturated:
+            logger.warning(
+                'Database pool saturated: %s of %s connections in use, '
+                'waited %.3fs for a connection.', checked_out, capacity, wait
+            )
+
+    def snapshot(self):
+        """ Return the metrics as a dictionary. """
+        with self._lock:
+            checkouts = self.checkouts
+            mean_wait = self.total_wait / checkouts if checkouts else 0
+            return {
+                'checkouts': checkouts,
+                'mean_wait': mean_wait,
+                'max_wait': self.max_wait,
+                'saturated_checkouts': self.saturated_checkouts,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """ A QueuePool which records checkout wait times and saturation. """
+
+    def _do_get(self):
+        start = time.monotonic()
+        connection = super()._do_get()
+        if self._max_overflow < 0:
+            capacity = None
+        else:
+            capacity = self.size() + self._max_overflow
+        pool_stats.record_checkout(
+            time.monotonic() - start, self.checkedout(), capacity
+        )
+        return connection
+
+
+def ping_connection(dbapi_connection, connection_record, connection_proxy):
+    """ Test a connection as it is checked out of the pool.
+
+    A DisconnectionError makes the pool discard the connection and retry
+    with a fresh one, instead of handing out a connection the server has
+    already closed.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+
+def enable_sqlite_wal(dbapi_connection, connection_record):
+    """ Use write-ahead logging, so readers don't block the writer. """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    finally:
+        cursor.close()
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """ A session which can send its queries to the read replica.
+
+    Queries go to the primary database unless use_replica is set, see
+    landoapi.models.replica.read_replica(). Writes always go to the primary,
+    including the flushes and bulk updates made while use_replica is set.
+    """
+    use_replica = False
+
+    def get_bind(self, mapper=None, clause=None):
+        writing = self._flushing or isinstance(clause, UpdateBase)
+        if self.use_replica and not writing:
+            return db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """ Flask-SQLAlchemy with Lando's engine configuration.
+
+    The config values used, on top of Flask-SQLAlchemy's own, are:
+
+        SQLALCHEMY_POOL_PRE_PING: Test connections when they are checked out
+            of the pool.
+        SQLALCHEMY_STATEMENT_TIMEOUT: The PostgreSQL statement_timeout, in
+            milliseconds. 0 disables it.
+        SQLALCHEMY_SQLITE_WAL: Put file based SQLite databases in
+            write-ahead logging mode.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+        events = options.setdefault('pool_events', [])
+
+        if info.drivername == 'sqlite':
+            # SQLite doesn't use a QueuePool, which would reject these.
+            for option in QUEUE_POOL_OPTIONS:
+                options.pop(option, None)
+            in_memory = info.database in (None, '', ':memory:')
+            if not in_memory and app.config.get('SQLALCHEMY_SQLITE_WAL'):
+                events.append((enable_sqlite_wal, 'connect'))
+            return
+
+        if 'poolclass' not in options:
+            options['poolclass'] = InstrumentedQueuePool
+
+        if app.config.get('SQLALCHEMY_POOL_PRE_PING'):
+            events.append((ping_connection, 'checkout'))
+
+        statement_timeout = app.config.get('SQLALCHEMY_STATEMENT_TIMEOUT')
+        if statement_timeout and info.drivername.startswith('postgresql'):
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['options'] = '-c statement_timeout={}'.format(
+                int(statement_timeout)
+            )
+
 
 db = SQLAlchemy()
+
+
+@contextmanager
+def unit_of_work():
+    """ Group the database writes made in a block into one transaction.
+
+    Model save() calls made in the block don't commit on their own, the
+    block commits once when it exits, or rolls back if it raises. Blocks
+    can be nested, only the outermost one commits.
+
+    Yields:
+        The database session.
+    """
+    session = db.session
+    depth = session.info.get('unit_of_work_depth', 0)
+    session.info['unit_of_work_depth'] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except Exception:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info['unit_of_work_depth'] = depth
+
+
+def in_unit_of_work():
+    """ Return True when called inside a unit_of_work() block. """
+    return db.session.info.get('unit_of_work_depth', 0) > 0
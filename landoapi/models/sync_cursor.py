@@ -0,0 +1,41 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from datetime import datetime
+
+from landoapi.models.storage import db
+
+
+class SyncCursor(db.Model):
+    """ How far a sync from an upstream service has got. """
+    __tablename__ = 'sync_cursors'
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def __init__(self, name, value=0):
+        self.name = name
+        self.value = value
+
+    @classmethod
+    def get_value(cls, name):
+        """ Get the value of a cursor, 0 if it was never set. """
+        cursor = cls.query.get(name)
+        return cursor.value if cursor else 0
+
+    @classmethod
+    def set_value(cls, name, value):
+        """ Store the value of a cursor. """
+        cursor = cls.query.get(name)
+        if cursor is None:
+            cursor = cls(name)
+            db.session.add(cursor)
+        cursor.value = value
+        db.session.commit()
+        return cursor
+
+    def __repr__(self):
+        return '<SyncCursor: %s>' % self.name
@@ -0,0 +1,172 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+In-process notification of landing status changes.
+
+Long-poll and event stream requests wait on the notifier instead of polling
+the database. Status changes are published by the code which commits them,
+see landoapi.models.landing, so a waiter is woken up right away in the
+process which made the change. The changes made by other processes are
+found by a single Poller per process: every few seconds it reads the values
+of all the keys being waited on with one query, and publishes those which
+changed.
+
+Waiters block their thread without holding a database connection. Each
+waiting request thus takes a worker thread for as long as it waits: serving
+many idle watchers at once needs an async worker class such as gevent, where
+waiters block a greenlet.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# How many keys the last published value is remembered for.
+MAX_REMEMBERED_KEYS = 10000
+
+
+class Notifier:
+    """ Publishes values per key to the threads waiting for them.
+
+    The last value published for a key is remembered, so a value published
+    between a waiter reading its current state and starting to wait isn't
+    missed.
+    """
+
+    def __init__(self, max_keys=MAX_REMEMBERED_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        # key -> [Condition, number of waiters]
+        self._conditions = {}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def publish(self, key, value):
+        """ Set the value of a key and wake up the threads waiting on it. """
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_keys:
+                self._values.popitem(last=False)
+
+            waiting = self._conditions.get(key)
+            if waiting:
+                waiting[0].notify_all()
+
+    def wait(self, key, last, timeout):
+        """ Wait for the value of a key to be different from last.
+
+        Args:
+            key: The key to wait on.
+            last: The value the caller already knows about.
+            timeout: The most seconds to wait for.
+
+        Returns:
+            The new value, or None if it didn't change before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            waiting = self._conditions.setdefault(
+                key, [threading.Condition(self._lock), 0]
+            )
+            waiting[1] += 1
+            try:
+                while True:
+                    value = self._values.get(key, last)
+                    if value != last:
+                        return value
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    waiting[0].wait(remaining)
+            finally:
+                waiting[1] -= 1
+                if not waiting[1]:
+                    del self._conditions[key]
+
+    def get(self, key):
+        """ Return the last value published for a key, or None. """
+        with self._lock:
+            return self._values.get(key)
+
+    def watched(self):
+        """ Return the keys threads are currently waiting on. """
+        with self._lock:
+            return list(self._conditions)
+
+    def waiters(self):
+        """ Return the number of threads currently waiting. """
+        with self._lock:
+            return sum(count for _, count in self._conditions.values())
+
+
+class Poller:
+    """ Publishes the changes of the keys waited on, read from a background
+    thread.
+
+    There is one thread per process and per Poller, however many threads
+    wait. It is started by the first waiter, see start(), and reads nothing
+    while nobody waits.
+    """
+
+    def __init__(self, notifier, read):
+        """
+        Args:
+            notifier: The Notifier to publish the changed values to.
+            read: A function taking a list of keys, and returning a dict of
+                their current values. It is called in an app context.
+        """
+        self.notifier = notifier
+        self.read = read
+        self.app = None
+        self.interval = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app, interval):
+        """
+        Args:
+            app: The Flask app to read the values in the context of.
+            interval: Seconds between reads.
+        """
+        self.app = app
+        self.interval = interval
+
+    def start(self):
+        """ Start the thread of this process, unless it is running. """
+        with self._lock:
+            # After a fork the thread of the parent isn't alive.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='poller', daemon=True
+                )
+                self._thread.start()
+
+    def poll(self):
+        """ Read the keys waited on and publish the changed values. """
+        keys = self.notifier.watched()
+        if not keys:
+            return
+        with self.app.app_context():
+            values = self.read(keys)
+        for key, value in values.items():
+            if value != self.notifier.get(key):
+                self.notifier.publish(key, value)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Unable to poll the keys waited on.')
+
+
+# Landing statuses, keyed by the Transplant request id of the Landing.
+landing_statuses = Notifier()
@@ -3,8 +3,41 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import os
+from collections import defaultdict
+
 import requests
 
+from landoapi import deadline, upstream
+from landoapi.serialization import loads
+
+
+class _Sentinel:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+# Returned by resolve_phids() for objects which don't exist, and for objects
+# which exist but the api key doesn't have permission to view.
+MISSING = _Sentinel('MISSING')
+INVISIBLE = _Sentinel('INVISIBLE')
+
+# The Conduit methods returning the full objects of a phid type, as lists.
+# The objects of every other type, e.g. repos and diffs, are requested with
+# phid.query.
+PHID_TYPE_METHODS = {
+    'USER': '/user.query',
+    'DREV': '/differential.query',
+}
+
+
+def phid_type(phid):
+    """ Return the type of a phid, e.g. 'DREV' for 'PHID-DREV-1'. """
+    parts = phid.split('-', 2)
+    return parts[1] if len(parts) == 3 else None
+
 
 class PhabricatorClient:
     """ A class to interface with Phabricator's Conduit API. 
@@ -13,7 +46,7 @@ class PhabricatorClient:
     Phabricator returns an error response. If there is an actual problem with
     the request to the server or decoding the JSON response, this class will
     bubble up the exception. These exceptions can be one of the request library
-    exceptions or a JSONDecodeError.
+    exceptions or a ValueError (such as a JSONDecodeError).
     """
 
     def __init__(self, api_key):
@@ -39,12 +72,70 @@ class PhabricatorClient:
         """
         result = None
         if id:
-            id_num = str(id).strip().replace('D', '')
-            result = self._GET('/differential.query', {'ids[]': [id_num]})
+            result = self.get_revisions(ids=[id])
         elif phid:
-            result = self._GET('/differential.query', {'phids[]': [phid]})
+            result = self.get_revisions(phids=[phid])
         return result[0] if result else None
 
+    def get_revisions(self, ids=None, phids=None):
+        """ Gets several revisions with a single request to Phabricator.
+
+        Args:
+            ids: A list of revision ids. Each id can be in the form of an
+                integer or an integer prefixed with 'D', e.g. 'D12345'.
+            phids: A list of revision phids to be used if no ids are provided.
+
+        Returns:
+            A list of revision hashes just as they are returned by Phabricator.
+            Revisions which don't exist, or which the api key can't view, are
+            left out of the list. The order of the list is not guaranteed to
+            match the order of the requested ids or phids.
+        """
+        if ids:
+            id_nums = [str(i).strip().replace('D', '') for i in ids]
+            result = self._GET('/differential.query', {'ids[]': id_nums})
+        elif phids:
+            result = self._GET('/differential.query', {'phids[]': phids})
+        else:
+            return []
+        return result or []
+
+    def get_modified_revisions(self, limit, offset=0):
+        """ Gets revisions ordered by modification time, newest first.
+
+        Args:
+            limit: The most revisions to return.
+            offset: The number of revisions to skip, to page through them.
+
+        Returns:
+            A list of revision hashes just as they are returned by Phabricator.
+        """
+        result = self._GET(
+            '/differential.query', {
+                'order': 'order-modified',
+                'limit': limit,
+                'offset': offset,
+            }
+        )
+        return result or []
+
+    def get_rawdiff(self, diff_id):
+        """ Gets the raw text of a diff.
+
+        Args:
+            diff_id: The id of the diff, e.g. 43480.
+
+        Returns:
+            The diff as a string, or None if the diff doesn't exist or the
+            api key can't view it.
+        """
+        try:
+            return self._GET('/differential.getrawdiff', {'diffID': diff_id})
+        except PhabricatorAPIException as e:
+            if e.error_code == 'ERR_NOT_FOUND':
+                return None
+            raise
+
     def get_current_user(self):
         """ Gets the information of the user making this request.
         
@@ -64,8 +155,21 @@ class PhabricatorClient:
             A hash containing the user information, or an None if the user 
             could not be found.
         """
-        result = self._GET('/user.query', {'phids[]': [phid]})
-        return result[0] if result else None
+        users = self.get_users([phid]) if phid else []
+        return users[0] if users else None
+
+    def get_users(self, phids):
+        """ Gets several users with a single request to Phabricator.
+
+        Args:
+            phids: A list of user phids.
+
+        Returns:
+            A list of user hashes. Users which aren't found are left out.
+        """
+        resolved = self.resolve_phids(phids)
+        users = [_found(resolved[phid]) for phid in phids]
+        return [user for user in users if user is not None]
 
     def get_repo(self, phid):
         """ Get basic information about a repo based on its phid. 
@@ -76,19 +180,90 @@ class PhabricatorClient:
         Returns:
             A hash containing the repo info, or None if the repo isn't found.
         """
-        result = self._GET('/phid.query', {'phids[]': [phid]})
-        return result.get(phid) if result else None
+        return self.get_repos([phid]).get(phid) if phid else None
+
+    def get_repos(self, phids):
+        """ Gets several repos with a single request to Phabricator.
+
+        Args:
+            phids: A list of repo phids.
+
+        Returns:
+            A dict of repo hashes by phid. Repos which aren't found are left
+            out.
+        """
+        resolved = self.resolve_phids(phids)
+        return {
+            phid: data
+            for phid, data in resolved.items() if _found(data) is not None
+        }
+
+    def resolve_phids(self, phids):
+        """ Gets objects of any types by phid, with one request per method.
+
+        Users are requested with user.query, revisions with
+        differential.query and every other type, e.g. repos and diffs, with
+        phid.query. A user or revision left out by its method is looked up
+        with phid.query too, which knows of the objects the api key can't
+        view, to tell if it is missing or invisible. That lookup is part of
+        the single phid.query request.
+
+        Args:
+            phids: A list of phids, of any types.
+
+        Returns:
+            A dict with each of the phids as a key. The value is the object
+            hash, as returned by its Conduit method, MISSING if the object
+            doesn't exist, or INVISIBLE if the api key doesn't have
+            permission to view it.
+        """
+        phids = set(phids)
+        by_method = defaultdict(list)
+        for phid in phids:
+            method = PHID_TYPE_METHODS.get(phid_type(phid))
+            if method is not None:
+                by_method[method].append(phid)
+
+        resolved = {}
+        for method, method_phids in sorted(by_method.items()):
+            result = self._GET(method, {'phids[]': sorted(method_phids)})
+            for data in result or []:
+                resolved[data['phid']] = data
+
+        unresolved = sorted(phids - set(resolved))
+        handles = {}
+        if unresolved:
+            handles = self._GET('/phid.query', {'phids[]': unresolved}) or {}
+        for phid in unresolved:
+            if phid not in handles:
+                resolved[phid] = MISSING
+            elif phid_type(phid) in PHID_TYPE_METHODS:
+                resolved[phid] = INVISIBLE
+            else:
+                resolved[phid] = handles[phid]
+        return resolved
 
     def _request(self, url, data=None, params=None, method='GET'):
         data = data if data else {}
         data['api.token'] = self.api_key
-        response = requests.request(
-            method=method,
-            url=self.api_url + url,
-            params=params,
-            data=data,
-            timeout=10
-        ).json()
+        timeout = deadline.upstream_timeout()
+        try:
+            with upstream.record('phabricator', url.lstrip('/'), data):
+                response = requests.request(
+                    method=method,
+                    url=self.api_url + url,
+                    params=params,
+                    data=data,
+                    timeout=timeout
+                )
+        except requests.Timeout:
+            # Raises DeadlineExceeded if the request used up the deadline.
+            deadline.remaining()
+            raise
+
+        # Decode straight from the raw body bytes with the fastest available
+        # decoder instead of letting requests guess the text encoding first.
+        response = loads(response.content)
 
         if response['error_code']:
             exp = PhabricatorAPIException(response.get('error_info'))
@@ -105,6 +280,13 @@ class PhabricatorClient:
         return self._request(url, data, params, 'POST')
 
 
+def _found(resolved):
+    """ Return a resolve_phids() value, or None for a missing or invisible
+    object.
+    """
+    return None if resolved in (MISSING, INVISIBLE) else resolved
+
+
 class PhabricatorAPIException(Exception):
     """ An exception class to handle errors from the Phabricator API """
     error_code = None
@@ -0,0 +1,176 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Opt-in profiling of single requests.
+
+A request is profiled with cProfile when it sends the PROFILE_SECRET in the
+X-Lando-Profile header, or when it is picked by the PROFILE_SAMPLE_RATE (a
+fraction of all requests). Each profile is written to PROFILE_DIR as a
+pstats file, next to a JSON file with the route, the response time and the
+upstream calls made. Only the PROFILE_MAX_FILES most recent profiles are
+kept.
+
+When neither PROFILE_SECRET nor PROFILE_SAMPLE_RATE is set no request hooks
+are installed, so profiling costs nothing.
+
+Read a profile with:
+
+    $ python -m pstats /tmp/lando-api-profiles/<profile id>.prof
+"""
+import cProfile
+import glob
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+from landoapi import upstream
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Lando-Profile'
+PROFILE_ID_HEADER = 'X-Lando-Profile-Id'
+
+
+class RequestProfile:
+    """ The cProfile profile and upstream calls of the current request. """
+
+    def __init__(self):
+        # Starts with the time in microseconds, so ids sort in time order.
+        self.id = '{:d}-{}'.format(
+            int(time.time() * 1000000), uuid.uuid4().hex[:8]
+        )
+        self.profile = cProfile.Profile()
+        self.upstream_calls = []
+        self.started_at = None
+        self.duration = None
+        self._thread = threading.get_ident()
+
+    def __call__(self, call):
+        # Upstream listeners see the calls of every thread, keep only those
+        # made while handling this request.
+        if threading.get_ident() == self._thread:
+            self.upstream_calls.append(call)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        upstream.add_listener(self)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        upstream.remove_listener(self)
+        self.duration = time.monotonic() - self.started_at
+
+
+class Profiler:
+    """ Profiles the requests opted in to profiling, see the module doc. """
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_SECRET', None)
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_DIR', '/tmp/lando-api-profiles')
+        app.config.setdefault('PROFILE_MAX_FILES', 100)
+
+        self.secret = app.config['PROFILE_SECRET']
+        self.sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        self.directory = app.config['PROFILE_DIR']
+        self.max_files = app.config['PROFILE_MAX_FILES']
+        if not self.secret and not self.sample_rate:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start_profile)
+        app.after_request(self.stop_profile)
+        app.teardown_request(self.discard_profile)
+
+    def wants_profile(self):
+        """ Return True if the current request should be profiled. """
+        token = request.headers.get(PROFILE_HEADER)
+        if token and self.secret:
+            return hmac.compare_digest(
+                token.encode('utf-8'), self.secret.encode('utf-8')
+            )
+        return random.random() < self.sample_rate
+
+    def start_profile(self):
+        if not self.wants_profile():
+            return
+
+        profile = RequestProfile()
+        try:
+            profile.start()
+        except ValueError:
+            # Another profiler is active in this thread.
+            upstream.remove_listener(profile)
+            return
+        g.request_profile = profile
+
+    def stop_profile(self, response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+
+        profile.stop()
+        try:
+            self.write(profile, response)
+        except OSError:
+            logger.exception('Unable to write the request profile.')
+            return response
+
+        response.headers[PROFILE_ID_HEADER] = profile.id
+        return response
+
+    def discard_profile(self, exc):
+        # Stop the profile of a request which failed before after_request.
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            profile.stop()
+
+    def write(self, profile, response):
+        """ Write a profile to the ring of profile files. """
+        path = os.path.join(self.directory, profile.id)
+        profile.profile.dump_stats(path + '.prof')
+
+        upstream_calls = [
+            {
+                'service': call.service,
+                'method': call.method,
+                'duration': call.duration,
+            } for call in profile.upstream_calls
+        ]
+        summary = {
+            'id': profile.id,
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'duration': profile.duration,
+            'upstream_duration': sum(c['duration'] for c in upstream_calls),
+            'upstream_calls': upstream_calls,
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+        self.prune()
+
+    def prune(self):
+        """ Remove the oldest profiles beyond PROFILE_MAX_FILES. """
+        profiles = sorted(glob.glob(os.path.join(self.directory, '*.prof')))
+        excess = len(profiles) - self.max_files
+        for path in profiles[:max(excess, 0)]:
+            for name in (path, path[:-len('.prof')] + '.json'):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+
+profiler = Profiler()
@@ -0,0 +1,619 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Loading of revisions and their stacks from Phabricator.
+
+This is the single path used to get revisions, both by the revisions API
+and when landing. Loaded stacks are cached, so a revision that was just
+viewed in the UI can be landed without asking Phabricator for it again.
+
+What a revision looks like depends on who is looking, so stacks are cached
+by visibility class:
+
+    public:   Stacks loaded with the unprivileged api key. Anyone may see
+              them, so they are used for every api key, but only when they
+              are complete: a stack with a parent hidden from the
+              unprivileged api key may look different to a user who can see
+              that parent.
+    per key:  Stacks loaded with a user's api key, which may contain private
+              or secure revisions, are only used for that same api key.
+
+Only loads with the unprivileged api key ever write to the public namespace,
+so private data can't end up there.
+
+The dependencies between revisions are recorded in the revision_edges
+table, so the ancestors of a revision can be requested all at once the next
+time its stack is loaded. The phid of a loaded revision is cached by its id,
+which never changes, so the revision is then requested in that same call.
+
+Concurrent loads of the same stack, or of the same revision without its
+stack, with the same api key are coalesced, so only one of them requests it
+from Phabricator. With REVISION_LOAD_LOCK_DIR set, the processes of a host
+also take turns loading a stack or one of its revisions, and find the stacks
+loaded by the others in the cache when CACHE_TYPE=filesystem.
+"""
+import hashlib
+import time
+
+from flask import current_app
+
+from landoapi import deadline
+from landoapi.cache import cache
+from landoapi.models.revision import PhabricatorObjects
+from landoapi.models.revision_edge import RevisionEdge
+from landoapi.phabricator_client import PhabricatorClient
+from landoapi.singleflight import SingleFlight, file_lock
+
+stack_loads = SingleFlight()
+
+# The cache key of the time up to which the sync recorded the modified
+# revisions, see mark_synced().
+SYNC_CHECKED_AT_KEY = 'revision-sync:checked-at'
+
+
+def load_stack(
+    revision_id,
+    api_key=None,
+    max_age=None,
+    with_users=True,
+    with_repos=True,
+    allow_partial=False
+):
+    """ Gets a revision and all of its parent revisions.
+
+    Args:
+        revision_id: The id of the revision. This can be in the form of an
+            integer or an integer prefixed with 'D', e.g. 'D12345'.
+        api_key: The Phabricator api key to load the revisions with, or None
+            to use the unprivileged api key.
+        max_age: How old, in seconds, a cached stack may be and still be
+            used. Defaults to the REVISION_CACHE_MAX_AGE config value.
+        with_users: False if the authors of the revisions aren't needed.
+            Their lookups are skipped unless the stack is cached, and the
+            authors may then be None.
+        with_repos: False if the repos of the revisions aren't needed, like
+            with_users.
+        allow_partial: True to return the stack loaded so far, instead of
+            raising DeadlineExceeded, when the request's deadline passes
+            while loading the ancestors. The response is then marked
+            partial, see landoapi.deadline.
+
+    Returns:
+        The Revision with its parents loaded, or None if the revision doesn't
+        exist or the api key doesn't have permission to view it.
+
+    Raises:
+        DeadlineExceeded: If the request's deadline passes before the stack
+            is loaded.
+    """
+    revision = _get_cached(revision_id, api_key, max_age)
+    if revision is not None:
+        return revision
+
+    key = _stack_cache_key(revision_id, api_key)
+    flight = (key, with_users, with_repos, allow_partial)
+    try:
+        revision, complete = stack_loads.do(
+            flight,
+            _load_stack,
+            key,
+            revision_id,
+            api_key,
+            max_age,
+            with_users,
+            with_repos,
+            allow_partial,
+            timeout=deadline.remaining()
+        )
+    except TimeoutError:
+        raise deadline.DeadlineExceeded()
+    if not complete:
+        deadline.mark_partial()
+    return revision
+
+
+def _load_stack(
+    key, revision_id, api_key, max_age, with_users, with_repos, allow_partial
+):
+    """ Loads a stack for load_stack(), once per host when locking.
+
+    Returns:
+        A (revision, complete) tuple, complete being False for a partial
+        stack.
+    """
+    lock_dir = current_app.config['REVISION_LOAD_LOCK_DIR']
+    with file_lock(lock_dir, key, timeout=deadline.remaining()):
+        # The stack may have been cached while waiting for the lock.
+        revision = _get_cached(revision_id, api_key, max_age)
+        if revision is not None:
+            return revision, True
+
+        phab = PhabricatorClient(api_key)
+        data, ancestors = _get_revision(phab, revision_id)
+        if not data:
+            return None, True
+
+        return _build_stack(
+            phab, data, api_key, with_users, with_repos, allow_partial,
+            ancestors
+        )
+
+
+def _get_revision(phab, revision_id):
+    """ Requests a revision, together with its known ancestors when its phid
+    is cached.
+
+    Returns:
+        A (data, ancestors) tuple of the revision hash, None if the revision
+        doesn't exist or can't be viewed, and the list of the ancestor hashes
+        requested with it.
+    """
+    phid = cache.get(_phid_cache_key(revision_id))
+    if phid is None:
+        return phab.get_revision(id=revision_id), []
+
+    phids = {phid} | RevisionEdge.ancestors(phid)
+    found = phab.get_revisions(phids=sorted(phids))
+    data = next((d for d in found if d['phid'] == phid), None)
+    return data, [d for d in found if d['phid'] != phid]
+
+
+def _build_stack(
+    phab,
+    data,
+    api_key,
+    with_users,
+    with_repos,
+    allow_partial,
+    ancestors=(),
+    timeout=None
+):
+    """ Loads the parents of a revision, caching only complete stacks.
+
+    Stacks without their authors or repos aren't cached either, the other
+    loads expect them to be there.
+
+    Args:
+        ancestors: Hashes of ancestors of the revision already requested,
+            they are used instead of requesting them again.
+        timeout: How long, in seconds, the stack stays cached. Defaults to
+            the REVISION_CACHE_TIMEOUT config value.
+
+    Returns:
+        A (revision, complete) tuple, complete being False for a partial
+        stack.
+    """
+    objects = PhabricatorObjects(phab, with_users, with_repos)
+    revision, *fetched = objects.revisions([data] + list(ancestors))
+    cache.set(_phid_cache_key(data['id']), data['phid'])
+    complete = _load_ancestors(
+        objects, [revision], allow_partial, fetched=fetched
+    )
+    if complete and with_users and with_repos:
+        _set_cached(data['id'], api_key, revision, time.time(), timeout)
+    return revision, complete
+
+
+def cache_stack(phab, data, api_key=None):
+    """ Loads the parents of a revision already fetched and caches the stack.
+
+    The stack stays cached for REVISION_SYNC_CACHE_TIMEOUT seconds. It is
+    used past REVISION_CACHE_MAX_AGE for as long as the sync vouches for it,
+    see record_modified().
+
+    Args:
+        phab: The PhabricatorClient the revision was fetched with.
+        data: The revision hash, as returned by Phabricator.
+        api_key: The api key of phab, or None if it uses the unprivileged
+            api key.
+
+    Returns:
+        The Revision with its parents loaded.
+    """
+    timeout = current_app.config['REVISION_SYNC_CACHE_TIMEOUT']
+    revision, _ = _build_stack(
+        phab, data, api_key, True, True, False, timeout=timeout
+    )
+    return revision
+
+
+def record_modified(revisions_data):
+    """ Records when revisions listed by the sync were last modified.
+
+    A cached stack older than its max_age is still used while the sync
+    checked for modifications within max_age, see mark_synced(), and none of
+    its revisions was modified after it was loaded.
+
+    Args:
+        revisions_data: Revision hashes, as returned by Phabricator.
+    """
+    timeout = current_app.config['REVISION_SYNC_CACHE_TIMEOUT']
+    for data in revisions_data:
+        cache.set(
+            _modified_cache_key(data['id']),
+            int(data['dateModified']),
+            timeout=timeout
+        )
+
+
+def mark_synced(checked_at):
+    """ Records that every modification made before checked_at was passed
+    to record_modified().
+    """
+    timeout = current_app.config['REVISION_SYNC_CACHE_TIMEOUT']
+    cache.set(SYNC_CHECKED_AT_KEY, checked_at, timeout=timeout)
+
+
+def load_revision(
+    revision_id, api_key=None, max_age=None, with_users=True, with_repos=True
+):
+    """ Gets a revision, reusing a cached stack when it is fresh enough.
+
+    Unlike load_stack(), the parents of the revision aren't requested from
+    Phabricator when there is no usable cached stack, so the parents of the
+    returned Revision may not be loaded. Concurrent loads of the same
+    revision are coalesced like those of load_stack(), and take the same
+    REVISION_LOAD_LOCK_DIR lock as the loads of its stack.
+
+    Args:
+        revision_id: The id of the revision. This can be in the form of an
+            integer or an integer prefixed with 'D', e.g. 'D12345'.
+        api_key: The Phabricator api key to load the revision with, or None
+            to use the unprivileged api key.
+        max_age: How old, in seconds, a cached stack may be and still be
+            used. Defaults to the REVISION_CACHE_MAX_AGE config value.
+        with_users: False if the author of the revision isn't needed, see
+            load_stack().
+        with_repos: False if the repo of the revision isn't needed.
+
+    Returns:
+        The Revision, or None if the revision doesn't exist or the api key
+        doesn't have permission to view it.
+    """
+    revision = _get_cached(revision_id, api_key, max_age)
+    if revision is not None:
+        return revision
+
+    key = _stack_cache_key(revision_id, api_key)
+    flight = (key, with_users, with_repos, 'revision')
+    try:
+        return stack_loads.do(
+            flight,
+            _load_revision,
+            key,
+            revision_id,
+            api_key,
+            max_age,
+            with_users,
+            with_repos,
+            timeout=deadline.remaining()
+        )
+    except TimeoutError:
+        raise deadline.DeadlineExceeded()
+
+
+def _load_revision(key, revision_id, api_key, max_age, with_users, with_repos):
+    """ Loads a revision for load_revision(), under the lock of its stack.
+
+    Waiting for the lock lets a stack being loaded by another process be
+    used instead.
+    """
+    lock_dir = current_app.config['REVISION_LOAD_LOCK_DIR']
+    with file_lock(lock_dir, key, timeout=deadline.remaining()):
+        revision = _get_cached(revision_id, api_key, max_age)
+        if revision is not None:
+            return revision
+
+        phab = PhabricatorClient(api_key)
+        data = phab.get_revision(id=revision_id)
+        if not data:
+            return None
+
+        objects = PhabricatorObjects(phab, with_users, with_repos)
+        return objects.revision(data)
+
+
+def load_stacks(revision_ids, api_key=None, max_age=None):
+    """ Gets several revisions and all of their parent revisions.
+
+    The revisions which aren't cached are loaded together: they are requested
+    from Phabricator in a single call, then their ancestors level by level.
+    Ancestors, authors and repos shared by several of the stacks are only
+    requested once.
+
+    Args:
+        revision_ids: A list of revision ids, each in the form of an integer
+            or an integer prefixed with 'D', e.g. 'D12345'.
+        api_key: The Phabricator api key to load the revisions with, or None
+            to use the unprivileged api key.
+        max_age: How old, in seconds, a cached stack may be and still be
+            used. Defaults to the REVISION_CACHE_MAX_AGE config value.
+
+    Returns:
+        A dict mapping each of the revision_ids to its Revision with its
+        parents loaded, or to None if the revision doesn't exist or the api
+        key doesn't have permission to view it.
+    """
+    stacks = {}
+    missing = []
+    for revision_id in revision_ids:
+        stacks[revision_id] = _get_cached(revision_id, api_key, max_age)
+        if stacks[revision_id] is None:
+            missing.append(revision_id)
+    if not missing:
+        return stacks
+
+    phab = PhabricatorClient(api_key)
+    objects = PhabricatorObjects(phab)
+    found = objects.revisions(phab.get_revisions(ids=missing))
+    _load_ancestors(objects, found)
+
+    loaded_at = time.time()
+    by_id = {str(revision.id): revision for revision in found}
+    for revision_id in missing:
+        revision = by_id.get(_id_num(revision_id))
+        stacks[revision_id] = revision
+        if revision is not None:
+            _set_cached(revision_id, api_key, revision, loaded_at)
+    return stacks
+
+
+def load_levels(
+    revision_ids=(), phids=(), api_key=None, depth=1, max_age=None
+):
+    """ Gets revisions and their ancestors up to depth levels up.
+
+    This lets a client show the top of a deep stack without waiting for all
+    of it: the ancestors are only requested from Phabricator up to depth
+    levels up, and the parents left out can be requested next with their
+    phids. Stacks which are cached are used whole, serialize_levels() then
+    leaves out the ancestors above depth.
+
+    Args:
+        revision_ids: A list of revision ids, each in the form of an integer
+            or an integer prefixed with 'D', e.g. 'D12345'.
+        phids: A list of revision phids, e.g. the parents left out of a
+            previous call.
+        api_key: The Phabricator api key to load the revisions with, or None
+            to use the unprivileged api key.
+        depth: The most levels of ancestors to load, or None to load them
+            all.
+        max_age: How old, in seconds, a cached stack may be and still be
+            used. Defaults to the REVISION_CACHE_MAX_AGE config value.
+
+    Returns:
+        A dict mapping each of the revision_ids and phids to its Revision,
+        or to None if the revision doesn't exist or the api key doesn't have
+        permission to view it.
+    """
+    revisions = {}
+    missing = []
+    for revision_id in revision_ids:
+        revisions[revision_id] = _get_cached(revision_id, api_key, max_age)
+        if revisions[revision_id] is None:
+            missing.append(revision_id)
+    if not missing and not phids:
+        return revisions
+
+    phab = PhabricatorClient(api_key)
+    objects = PhabricatorObjects(phab)
+    found = []
+    if missing:
+        found.extend(objects.revisions(phab.get_revisions(ids=missing)))
+    if phids:
+        found.extend(objects.revisions(phab.get_revisions(phids=phids)))
+    _load_ancestors(objects, found, depth=depth)
+
+    # Stacks short enough to be loaded whole are cached like any other.
+    loaded_at = time.time()
+    by_id = {str(revision.id): revision for revision in found}
+    for revision_id in missing:
+        revision = by_id.get(_id_num(revision_id))
+        revisions[revision_id] = revision
+        if revision is not None and _stack_complete(revision):
+            _set_cached(revision_id, api_key, revision, loaded_at)
+
+    by_phid = {revision.phid: revision for revision in found}
+    for phid in phids:
+        revisions[phid] = by_phid.get(phid)
+    return revisions
+
+
+def _load_ancestors(
+    objects, revisions, allow_partial=False, depth=None, fetched=()
+):
+    """ Loads all the ancestors of revisions, setting their parents.
+
+    The ancestors recorded in the revision_edges index are requested from
+    Phabricator together in a single call. Parents the index doesn't know
+    about yet are then requested level by level, all the missing parents of
+    a level in a single call. The index is updated with the loaded stacks.
+
+    Revisions depended on through several paths, e.g. in a diamond shaped
+    stack or by several of the revisions, are loaded once and shared.
+
+    Args:
+        objects: The PhabricatorObjects registry used to build the revisions,
+            so that authors and repos are shared across the whole stack.
+        revisions: The Revisions to load the ancestors of.
+        allow_partial: True to stop loading when the request's deadline
+            passes, instead of raising DeadlineExceeded. The revisions of the
+            level being loaded then have no parents.
+        depth: The most levels of ancestors to load, or None to load them
+            all. The revisions of the last level then have no parents.
+        fetched: Ancestors already requested along with the revisions, which
+            aren't requested again.
+
+    Returns:
+        True if all the ancestors were loaded, False if the deadline passed.
+    """
+    stack = {revision.phid: revision for revision in revisions}
+    loaded = {revision.phid: revision for revision in fetched}
+    loaded.update(stack)
+    try:
+        _load_levels(objects, loaded, stack, depth)
+    except deadline.DeadlineExceeded:
+        if not allow_partial:
+            raise
+        complete = False
+    else:
+        complete = True
+
+    RevisionEdge.record(stack.values())
+    return complete
+
+
+def _load_levels(objects, loaded, stack, depth=None):
+    """ Loads the ancestors of the revisions in stack for _load_ancestors().
+    """
+    unavailable = set()
+    known_ancestors = RevisionEdge.ancestors(*loaded, depth=depth)
+    known_ancestors -= set(loaded)
+    if known_ancestors:
+        _fetch_revisions(objects, known_ancestors, loaded, unavailable)
+
+    level = list(stack.values())
+    levels = 0
+    while level and levels != depth:
+        parent_phids = {phid for r in level for phid in r.parent_phids}
+        missing = parent_phids - set(loaded) - unavailable
+        if missing:
+            _fetch_revisions(objects, missing, loaded, unavailable)
+
+        next_level = []
+        for r in level:
+            r.parents = tuple(
+                loaded[phid] for phid in r.parent_phids if phid in loaded
+            )
+            for parent in r.parents:
+                if parent.phid not in stack:
+                    stack[parent.phid] = parent
+                    next_level.append(parent)
+        level = next_level
+        levels += 1
+
+
+def _fetch_revisions(objects, phids, loaded, unavailable):
+    """ Requests revisions from Phabricator in a single call.
+
+    The Revisions are added to loaded by phid, and the phids of those which
+    don't exist or can't be viewed are added to unavailable.
+    """
+    phids = sorted(phids)
+    for revision in objects.revisions(objects.phab.get_revisions(phids=phids)):
+        loaded[revision.phid] = revision
+    unavailable.update(phid for phid in phids if phid not in loaded)
+
+
+def _get_cached(revision_id, api_key, max_age):
+    """ Returns the fresh cached stack of a revision which api_key may use.
+
+    A complete public stack is used for every api key, otherwise only the
+    stack cached for api_key itself is.
+    """
+    public_key = _stack_cache_key(revision_id, None)
+    revision = _get_fresh(public_key, max_age, complete_only=bool(api_key))
+    if revision is not None or not api_key:
+        return revision
+    return _get_fresh(_stack_cache_key(revision_id, api_key), max_age)
+
+
+def _get_fresh(key, max_age, complete_only=False):
+    """ Returns the cached Revision for key if it is younger than max_age.
+
+    With complete_only, a Revision whose stack wasn't complete when cached
+    isn't returned.
+    """
+    if max_age is None:
+        max_age = current_app.config['REVISION_CACHE_MAX_AGE']
+
+    cached = cache.get(key)
+    if cached is None:
+        return None
+
+    loaded_at, revision, complete = cached
+    if complete_only and not complete:
+        return None
+    if time.time() - loaded_at > max_age and \
+            not _unmodified_since_sync(revision, max_age):
+        return None
+    return revision
+
+
+def _unmodified_since_sync(revision, max_age):
+    """ Returns True if the sync checked for modifications within max_age,
+    and found none in the stack of revision.
+    """
+    checked_at = cache.get(SYNC_CHECKED_AT_KEY)
+    if checked_at is None or time.time() - checked_at > max_age:
+        return False
+
+    stack = _stack_revisions(revision)
+    keys = [_modified_cache_key(r.id) for r in stack]
+    modified = cache.get_many(*keys)
+    return all(
+        m is None or m <= r.date_modified for r, m in zip(stack, modified)
+    )
+
+
+def _set_cached(revision_id, api_key, revision, loaded_at, timeout=None):
+    """ Caches the stack of a revision in the namespace of api_key. """
+    if timeout is None:
+        timeout = current_app.config['REVISION_CACHE_TIMEOUT']
+    cache.set(
+        _stack_cache_key(revision_id, api_key),
+        (loaded_at, revision, _stack_complete(revision)),
+        timeout=timeout
+    )
+
+
+def _stack_revisions(revision):
+    """ Returns revision and the ancestors loaded in its stack. """
+    pending = [revision]
+    seen = {}
+    while pending:
+        revision = pending.pop()
+        if revision.phid not in seen:
+            seen[revision.phid] = revision
+            pending.extend(revision.parents)
+    return list(seen.values())
+
+
+def _stack_complete(revision):
+    """ Returns True if every ancestor of revision is loaded in its stack. """
+    pending = [revision]
+    seen = set()
+    while pending:
+        revision = pending.pop()
+        if revision.phid in seen:
+            continue
+        seen.add(revision.phid)
+        parent_phids = {parent.phid for parent in revision.parents}
+        if parent_phids != set(revision.parent_phids):
+            return False
+        pending.extend(revision.parents)
+    return True
+
+
+def _stack_cache_key(revision_id, api_key):
+    # The api key is hashed to keep the secret out of the cache. The entries
+    # are (loaded_at, revision, complete) tuples.
+    if api_key:
+        digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        namespace = 'key-' + digest
+    else:
+        namespace = 'public'
+    return 'revision-stack:{}:{}'.format(namespace, _id_num(revision_id))
+
+
+def _phid_cache_key(revision_id):
+    return 'revision-phid:{}'.format(_id_num(revision_id))
+
+
+def _modified_cache_key(revision_id):
+    return 'revision-modified:{}'.format(_id_num(revision_id))
+
+
+def _id_num(revision_id):
+    return str(revision_id).strip().replace('D', '')
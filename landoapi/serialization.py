@@ -0,0 +1,45 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+JSON decoding helpers.
+
+A faster JSON decoder is used when ujson is installed, otherwise the
+standard library json module is used.
+"""
+import json
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+if ujson is not None:
+    _loads = ujson.loads
+else:
+    _loads = _stdlib_loads
+
+
+def loads(data):
+    """Decode a JSON document.
+
+    Args:
+        data: The JSON document as a str or as UTF-8 encoded bytes. Passing
+            the raw bytes of a response body avoids an extra decoding step.
+
+    Returns:
+        The decoded Python object.
+
+    Raises:
+        ValueError: If the document is not valid JSON. The standard library's
+            JSONDecodeError and the errors of the optional decoders are all
+            subclasses of ValueError.
+    """
+    return _loads(data)
@@ -0,0 +1,143 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Coalescing of identical concurrent computations.
+
+When many requests ask for the same thing at once, e.g. a popular revision
+stack, only the first one computes it. The others wait for it and share its
+result, see SingleFlight.
+
+file_lock() extends this to the processes of a host: the process holding
+the lock for a key computes it, and the others then find the result in a
+cache shared between processes.
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Keys are spread over this many lock files, so the number of files stays
+# bounded.
+LOCK_FILES = 256
+
+# Seconds between attempts to take a lock file with a timeout.
+LOCK_POLL_INTERVAL = 0.01
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.callers = 1
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Runs a function at most once at a time per key in this process.
+
+    Callers asking for a key already being computed wait for the running
+    call, and get its result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, timeout=None):
+        """ Return fn(*args), sharing the call with the concurrent callers
+        using the same key.
+
+        Args:
+            key: The key of the call.
+            fn: The function to call.
+            args: The arguments of the function.
+            timeout: The most seconds to wait for the running call of another
+                caller, None to wait for as long as it takes.
+
+        Raises:
+            TimeoutError: If the running call didn't finish within timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.callers += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    call.callers -= 1
+                raise TimeoutError()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def callers(self, key):
+        """ Return the number of callers sharing the running call for key. """
+        with self._lock:
+            call = self._calls.get(key)
+            return call.callers if call else 0
+
+
+@contextmanager
+def file_lock(directory, key, timeout=None):
+    """ Hold an exclusive lock on key, shared by the processes of a host.
+
+    Several keys may share a lock file, so a lock should only be held while
+    computing the value of its key.
+
+    Args:
+        directory: The directory of the lock files, or None to not lock.
+        key: The name of the lock.
+        timeout: The most seconds to wait for the lock, None to wait for as
+            long as it takes.
+
+    Raises:
+        TimeoutError: If the lock couldn't be taken within timeout.
+    """
+    if directory is None:
+        yield
+        return
+
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    name = '{:d}.lock'.format(digest[0] % LOCK_FILES)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'a') as f:
+        _flock(f, timeout)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _flock(f, timeout):
+    if timeout is None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError()
+            time.sleep(LOCK_POLL_INTERVAL)
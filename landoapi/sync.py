@@ -0,0 +1,188 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Incremental sync of recently modified revisions from Phabricator.
+
+Pages through the revisions modified since the last sync, newest first, and
+loads their stacks with the unprivileged api key. This warms the revision
+cache and the revision_edges index ahead of requests. Run it with
+`manage.py sync`.
+
+The cursor is the dateModified of the newest revision synced, stored in the
+sync_cursors table. Revisions modified in the same second as the cursor are
+synced again on the next run, so none are missed.
+
+A sync requests at most max_pages pages. The first sync then skips the
+older revisions, which would otherwise take a sync through every revision.
+Later syncs don't: the revisions left are older than those synced, so the
+cursor stays put, and the next sync resumes from the first page which wasn't
+fully synced. The cursor moves once a sync reaches it.
+
+Only a cache shared between processes, i.e. CACHE_TYPE=filesystem, is
+warmed for the API workers; the revision_edges index always is. A sync with
+any other cache type logs a warning.
+
+The dateModified of every revision listed is recorded in the cache. Once a
+sync has listed all the revisions modified since the cursor, the cached
+stacks none of whose revisions were modified since they were loaded are
+used past REVISION_CACHE_MAX_AGE, see landoapi.revisions.record_modified().
+"""
+import logging
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from landoapi.models.sync_cursor import SyncCursor
+from landoapi.phabricator_client import PhabricatorClient
+from landoapi.revisions import cache_stack, mark_synced, record_modified
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = 'phabricator-revisions'
+# Where an incremental sync stopped by max_pages resumes: the offset of the
+# first page not fully synced, and the cursor to set once the sync is done.
+RESUME_OFFSET_NAME = CURSOR_NAME + ':resume-offset'
+RESUME_CURSOR_NAME = CURSOR_NAME + ':resume-cursor'
+
+SyncResult = namedtuple('SyncResult', ['synced', 'failed', 'cursor'])
+
+
+class RateLimiter:
+    """ Spaces out calls to wait() to at most rate per second. """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def modified_revisions(phab, since, page_size, max_pages=None, offset=0):
+    """ Request the revisions modified at or after since, newest first.
+
+    Args:
+        phab: The PhabricatorClient to page through revisions with.
+        since: A dateModified timestamp.
+        page_size: The revisions requested per page.
+        max_pages: The most pages to request, None for no limit.
+        offset: The offset of the first page to request.
+
+    Returns:
+        A (revisions, next_offset) tuple of the revision hashes in page
+        order, and the offset of the next page, None if paging got to since
+        or to the last revision.
+    """
+    revisions = []
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        page = phab.get_modified_revisions(page_size, offset)
+        pages += 1
+        for data in page:
+            if int(data['dateModified']) < since:
+                return revisions, None
+            revisions.append(data)
+        if len(page) < page_size:
+            return revisions, None
+        offset += page_size
+    return revisions, offset
+
+
+def sync_revisions(page_size=100, max_pages=None, concurrency=4, rate=None):
+    """ Warm the cache and index with the revisions modified since the last
+    sync.
+
+    Args:
+        page_size: The revisions requested per differential.query page.
+        max_pages: The most pages to request, None for no limit. See the
+            module doc for how the sync goes on from there.
+        concurrency: The most stacks loaded at the same time.
+        rate: The most stacks loaded per second, None for no limit.
+
+    Returns:
+        A SyncResult with the numbers of revisions synced and failed, and the
+        new cursor.
+    """
+    app = current_app._get_current_object()
+    if app.config['CACHE_TYPE'] != 'filesystem':
+        logger.warning(
+            'CACHE_TYPE is %s, the API processes won\'t see the stacks '
+            'synced. Only the revision_edges index is updated.',
+            app.config['CACHE_TYPE']
+        )
+
+    started = time.time()
+    phab = PhabricatorClient(None)
+    since = SyncCursor.get_value(CURSOR_NAME)
+    resume_offset = SyncCursor.get_value(RESUME_OFFSET_NAME)
+    resume_cursor = SyncCursor.get_value(RESUME_CURSOR_NAME)
+    limiter = RateLimiter(rate)
+
+    def sync_one(data):
+        limiter.wait()
+        with app.app_context():
+            try:
+                cache_stack(phab, data)
+            except Exception:
+                logger.exception('Unable to sync D%s.', data['id'])
+                return False
+        return True
+
+    paged, next_offset = modified_revisions(
+        phab, since, page_size, max_pages, resume_offset
+    )
+    # Revisions modified while paging move to the first page and may be
+    # seen twice.
+    revisions = OrderedDict((data['phid'], data) for data in paged)
+    revisions = list(revisions.values())
+    record_modified(revisions)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(sync_one, revisions))
+
+    synced, failed, failed_phids = [], [], set()
+    for data, ok in zip(revisions, results):
+        (synced if ok else failed).append(int(data['dateModified']))
+        if not ok:
+            failed_phids.add(data['phid'])
+
+    newest = max(synced + [resume_cursor, since])
+    if since and next_offset is not None:
+        # Resume from the first page which wasn't fully synced, the cursor
+        # stays put until the sync gets to it.
+        failed_at = [
+            i for i, data in enumerate(paged) if data['phid'] in failed_phids
+        ]
+        fully_synced = min(failed_at, default=len(paged))
+        offset = resume_offset + fully_synced // page_size * page_size
+        SyncCursor.set_value(RESUME_OFFSET_NAME, offset)
+        SyncCursor.set_value(RESUME_CURSOR_NAME, newest)
+        return SyncResult(len(synced), len(failed), since)
+
+    # Don't move past a revision which failed, so it is retried next time.
+    cursor = newest
+    if failed:
+        cursor = min(cursor, min(failed) - 1)
+    cursor = max(cursor, since)
+    if cursor != since:
+        SyncCursor.set_value(CURSOR_NAME, cursor)
+    if resume_offset or resume_cursor:
+        SyncCursor.set_value(RESUME_OFFSET_NAME, 0)
+        SyncCursor.set_value(RESUME_CURSOR_NAME, 0)
+    elif next_offset is None:
+        # Every revision modified between the cursor and the start of this
+        # sync was listed. A resumed sync didn't list the first pages again.
+        mark_synced(started)
+
+    return SyncResult(len(synced), len(failed), cursor)
@@ -0,0 +1,18 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Time limits, in seconds, shared by the app and the gunicorn configuration.
+
+This module imports nothing, so the gunicorn configuration can read them
+without loading the app.
+"""
+
+# The default deadline of an API request, see landoapi.deadline.
+REQUEST_DEADLINE = 20
+
+# Seconds between the comments sent to keep an idle event stream open.
+EVENTS_KEEPALIVE = 15
+
+# Seconds after which an event stream is closed, the client reconnects.
+EVENTS_MAX_DURATION = 300
@@ -6,25 +6,22 @@ import os
 import requests
 import requests_mock
 
+from landoapi import deadline, upstream
+
 
 class TransplantClient:
     """ A class to interface with Transplant's API. """
 
     def __init__(self):
         self.api_url = os.getenv('TRANSPLANT_URL')
+        self.session = requests.Session()
 
-    @requests_mock.mock()
-    def land(self, ldap_username, tree, request):
+    def land(self, ldap_username, tree):
         """ Sends a push request to Transplant API to land a revision.
 
         Returns request_id received from Transplant API.
         """
-        # Connect to stubbed Transplant service
-        request.post(
-            self.api_url + '/autoland',
-            json={'request_id': 1},
-            status_code=200
-        )
+        self._mount_stub()
 
         # API structure from VCT/testing/autoland_mach_commands.py
         result = self._POST(
@@ -42,15 +39,37 @@ class TransplantClient:
         # Transplant API is responding with a created request_id of the job
         return result.get('request_id') if result else None
 
+    def _mount_stub(self):
+        """ Connect to stubbed Transplant service.
+
+        The stub is mounted on the session of this client only, the requests
+        made by other threads meanwhile aren't affected.
+        """
+        stub = requests_mock.Adapter()
+        stub.register_uri(
+            'POST',
+            self.api_url + '/autoland',
+            json={'request_id': 1},
+            status_code=200
+        )
+        self.session.mount(self.api_url, stub)
+
     def _request(self, url, data=None, params=None, method='GET'):
         data = data if data else {}
-        response = requests.request(
-            method=method,
-            url=self.api_url + url,
-            params=params,
-            data=data,
-            timeout=10
-        )
+        timeout = deadline.upstream_timeout()
+        try:
+            with upstream.record('transplant', url.lstrip('/'), data):
+                response = self.session.request(
+                    method=method,
+                    url=self.api_url + url,
+                    params=params,
+                    data=data,
+                    timeout=timeout
+                )
+        except requests.Timeout:
+            # Raises DeadlineExceeded if the request used up the deadline.
+            deadline.remaining()
+            raise
 
         status_code = response.status_code
         response = response.json()
@@ -0,0 +1,107 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Observation of the requests made to upstream services.
+
+The Phabricator and Transplant clients wrap each request in record(), which
+reports an UpstreamCall to the registered listeners once the request is
+done. Listeners are called from the thread making the request and must be
+quick.
+"""
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+UpstreamCall = namedtuple(
+    'UpstreamCall', ['service', 'method', 'params', 'duration']
+)
+
+# Request parameters which are never passed on to listeners.
+SECRET_PARAMS = ('api.token', )
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def add_listener(listener):
+    """ Call listener(upstream_call) after every upstream request. """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _listeners_lock:
+        _listeners.remove(listener)
+
+
+@contextmanager
+def record(service, method, params=None):
+    """ Report the request made in the block to the listeners.
+
+    Args:
+        service: The name of the upstream service, e.g. 'phabricator'.
+        method: The API method or path requested.
+        params: The parameters of the request.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - start
+        if _listeners:
+            params = {
+                k: v
+                for k, v in (params or {}).items() if k not in SECRET_PARAMS
+            }
+            call = UpstreamCall(service, method, params, duration)
+            for listener in list(_listeners):
+                listener(call)
+
+
+class CallRecorder:
+    """ Listener keeping the upstream calls made while it is active.
+
+    Usable as a context manager:
+
+        with CallRecorder() as recorder:
+            load_stack('D1')
+        assert recorder.count('phabricator') <= 3
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_listener(self)
+
+    def clear(self):
+        with self._lock:
+            del self.calls[:]
+
+    def count(self, service=None, method=None):
+        """ Return the number of calls made to a service and method. """
+        return len(self._matching(service, method))
+
+    def duration(self, service=None):
+        """ Return the total seconds spent in calls to a service. """
+        return sum(call.duration for call in self._matching(service, None))
+
+    def _matching(self, service, method):
+        with self._lock:
+            calls = list(self.calls)
+        if service is not None:
+            calls = [call for call in calls if call.service == service]
+        if method is not None:
+            calls = [call for call in calls if call.method == method]
+        return calls
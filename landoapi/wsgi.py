@@ -0,0 +1,44 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+WSGI entry point for production servers.
+
+The app is created when this module is imported. With gunicorn it is
+imported once in the master process, before the workers are forked, see
+landoapi/gunicorn_config.py:
+
+    $ gunicorn --config python:landoapi.gunicorn_config landoapi.wsgi:app
+"""
+import os
+
+from landoapi.admission import admission
+from landoapi.app import create_app
+from landoapi.compression import compressor
+from landoapi.models.replica import replica_lag
+from landoapi.models.storage import db, pool_stats
+from landoapi.notifier import landing_statuses
+
+app = create_app(os.environ.get('VERSION_PATH', '/app/version.json')).app
+
+
+def dispose_engines():
+    """ Drop the database connections pooled by this process.
+
+    Pooled connections must not be shared with forked processes, as both
+    would then use the same sockets.
+    """
+    binds = [None] + list(app.config.get('SQLALCHEMY_BINDS') or ())
+    with app.app_context():
+        for bind in binds:
+            db.get_engine(app, bind=bind).dispose()
+
+
+def reset_process_state():
+    """ Reset the in-process state a forked worker inherited. """
+    dispose_engines()
+    pool_stats.reset()
+    replica_lag.reset()
+    landing_statuses.reset()
+    compressor.bodies.clear()
+    admission.reset()
@@ -98,11 +98,20 @@ def create_db(ctx):
     )
 
 
+@task(name='migrate')
+def migrate(ctx):
+    """Apply pending database schema migrations."""
+    ctx.run(
+        "docker-compose run --rm lando-api "
+        "python landoapi/manage.py db upgrade"
+    )
+
+
 namespace = Collection(
     Collection(
         'lint',
         lint_all,
         lint_flake8,
         lint_yapf,
-    ), build, create_db, format, imageid, test, version
+    ), build, create_db, format, imageid, migrate, test, version
 )
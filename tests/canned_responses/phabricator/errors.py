@@ -8,3 +8,9 @@ CANNED_ERROR_1 = {
   "error_code": "ERR-CONDUIT-CORE",
   "error_info": "The value for parameter 'responsibleUsers' is not valid JSON. All parameters must be encoded as JSON values, including strings (which means you need to surround them in double quotes). Check your syntax. Value was: dsfdsf."
 }
+
+CANNED_ERROR_NOT_FOUND = {
+  "result": None,
+  "error_code": "ERR_NOT_FOUND",
+  "error_info": "Diff not found."
+}
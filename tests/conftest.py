@@ -2,20 +2,24 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import json
+import os
 
 import pytest
 import requests_mock
 
 from landoapi.app import create_app
+from landoapi.models.storage import db as _db
+from landoapi.upstream import CallRecorder
 from tests.factories import PhabResponseFactory
 
 
 @pytest.fixture
-def docker_env_vars(monkeypatch):
+def docker_env_vars(monkeypatch, tmpdir):
     """Monkeypatch environment variables that we'd get running under docker."""
     monkeypatch.setenv('PHABRICATOR_URL', 'http://phabricator.test')
     monkeypatch.setenv('TRANSPLANT_URL', 'http://autoland.test')
     monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    monkeypatch.setenv('DIFF_STORE_DIR', tmpdir.join('diffs').strpath)
 
 
 @pytest.fixture
@@ -25,6 +29,28 @@ def phabfactory():
         yield PhabResponseFactory(m)
 
 
+@pytest.fixture
+def transplant(docker_env_vars, phabfactory):
+    """Mock the Transplant service, which answers landings with request id 1.
+
+    requests_mock intercepts the requests of every session, so Transplant is
+    mocked with the same mocker as Phabricator.
+    """
+    phabfactory.mock.post(
+        os.environ['TRANSPLANT_URL'] + '/autoland',
+        status_code=200,
+        json={'request_id': 1}
+    )
+    return phabfactory.mock
+
+
+@pytest.fixture
+def upstream_calls():
+    """Record the requests made to Phabricator and Transplant."""
+    with CallRecorder() as recorder:
+        yield recorder
+
+
 @pytest.fixture
 def versionfile(tmpdir):
     """Provide a temporary version.json on disk."""
@@ -47,3 +73,13 @@ def app(versionfile, docker_env_vars):
     """Needed for pytest-flask."""
     app = create_app(versionfile.strpath)
     return app.app
+
+
+@pytest.fixture
+def db(app):
+    """Reset database for each test."""
+    with app.app_context():
+        _db.create_all()
+        yield _db
+        _db.session.remove()
+        _db.drop_all()
@@ -5,6 +5,7 @@
 Data factories for writing integration tests.
 """
 from copy import deepcopy
+from urllib.parse import parse_qs
 
 from landoapi.utils import extract_rawdiff_id_from_uri
 from tests.canned_responses.phabricator.repos import CANNED_REPO_MOZCENTRAL
@@ -94,6 +95,47 @@ class PhabResponseFactory:
 
         return result_json
 
+    def stack(self, depth):
+        """Return a linear stack of `depth` Revisions, the last one on top.
+
+        Unlike with revision(), a differential.query for several of the
+        Revisions returns all of them. The Revisions are modified one second
+        apart, the top one last, and can be paged through in modification
+        order.
+        """
+        repo = self.repo()
+        revisions = []
+        for i in range(1, depth + 1):
+            revision = deepcopy(first_result_in_response(CANNED_REVISION_1))
+            revision['id'] = str(i)
+            revision['phid'] = 'PHID-DREV-%s' % i
+            revision['dateModified'] = str(int(revision['dateModified']) + i)
+            revision['repositoryPHID'] = phid_for_response(repo)
+            revision['auxiliary']['phabricator:depends-on'] = (
+                ['PHID-DREV-%s' % (i - 1)] if i > 1 else []
+            )
+            revisions.append(revision)
+
+        def query_revisions(request, context):
+            form = parse_qs(request.text)
+            if 'order' in form:
+                offset = int(form['offset'][0])
+                limit = int(form['limit'][0])
+                result = list(reversed(revisions))[offset:offset + limit]
+            else:
+                wanted = form.get('ids[]', []) + form.get('phids[]', [])
+                result = [
+                    r for r in revisions if {r['id'], r['phid']} & set(wanted)
+                ]
+            return {'result': result, 'error_code': None, 'error_info': None}
+
+        self.mock.get(
+            phab_url('differential.query'),
+            status_code=200,
+            json=query_revisions
+        )
+        return revisions
+
     def diff(self):
         """Return a Revision Diff."""
         diff = deepcopy(CANNED_REVISION_1_DIFF)
@@ -0,0 +1,131 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import threading
+
+import pytest
+
+from landoapi.admission import admission, Lane
+from landoapi.app import create_app
+from landoapi.models.revision import Revision
+
+
+@pytest.fixture
+def app(versionfile, docker_env_vars, monkeypatch):
+    monkeypatch.setenv('LANDING_LARGE_DIFF_LINES', '1000')
+    app = create_app(versionfile.strpath)
+    return app.app
+
+
+def revision(line_count):
+    return Revision(
+        1,
+        'PHID-DREV-1',
+        None,
+        'Title',
+        'http://phabricator.test/D1',
+        0,
+        0,
+        0,
+        'Needs Review',
+        '',
+        '',
+        None,
+        None,
+        line_count=line_count
+    )
+
+
+def test_lane_admits_up_to_its_concurrency():
+    lane = Lane('large', 1)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def land():
+        with lane.admit():
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=land)
+    thread.start()
+    assert entered.wait(5)
+    assert lane.snapshot()['active'] == 1
+
+    with pytest.raises(TimeoutError):
+        with lane.admit(timeout=0.01):
+            pass
+    release.set()
+    thread.join()
+
+    with lane.admit(timeout=1):
+        pass
+    snapshot = lane.snapshot()
+    assert snapshot['admitted'] == 2
+    assert snapshot['timed_out'] == 1
+    assert snapshot['waiting'] == 0
+    assert snapshot['active'] == 0
+
+
+def test_full_lane_without_timeout_waits_for_a_slot():
+    lane = Lane('large', 1)
+    admitted = threading.Event()
+
+    def land():
+        with lane.admit():
+            admitted.set()
+
+    with lane.admit():
+        thread = threading.Thread(target=land)
+        thread.start()
+        assert not admitted.wait(0.1)
+        assert lane.snapshot()['waiting'] == 1
+    thread.join(5)
+    assert admitted.is_set()
+    assert lane.snapshot()['timed_out'] == 0
+
+
+def test_lane_slots_are_shared_through_the_lock_dir(tmpdir):
+    # Two lanes with the same lock dir stand for the lane of two processes.
+    lock_dir = tmpdir.join('lanes').strpath
+    first = Lane('large', 1, lock_dir)
+    second = Lane('large', 1, lock_dir)
+
+    with first.admit(timeout=1):
+        with pytest.raises(TimeoutError):
+            with second.admit(timeout=0.05):
+                pass
+    with second.admit(timeout=1):
+        pass
+    assert second.snapshot()['admitted'] == 1
+    assert second.snapshot()['timed_out'] == 1
+    assert second.snapshot()['waiting'] == 0
+
+
+def test_landings_are_routed_by_diff_line_count(app):
+    assert admission.lane_for(revision(100)).name == 'small'
+    assert admission.lane_for(revision(1000)).name == 'large'
+    assert admission.lane_for(revision(None)).name == 'large'
+
+
+def test_landing_goes_through_its_lane(db, client, phabfactory, transplant):
+    phabfactory.user()
+    phabfactory.revision()
+    response = client.post(
+        '/landings?api_key=api-key',
+        data=json.dumps({
+            'revision_id': 'D1'
+        }),
+        content_type='application/json'
+    )
+    assert response.status_code == 202
+
+    response = client.get('/landings/lanes')
+    assert response.status_code == 200
+    assert response.json['small']['admitted'] == 1
+    assert response.json['large']['admitted'] == 0
+    assert response.json['large']['concurrency'] == 1
+
+    # The lane is chosen without requesting the diff.
+    paths = [request.path for request in phabfactory.mock.request_history]
+    assert '/api/differential.getrawdiff' not in paths
@@ -0,0 +1,71 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import gzip
+import json
+
+import pytest
+
+from landoapi.app import create_app
+from landoapi.compression import CompressedBodies, compressor
+
+
+@pytest.fixture
+def app(versionfile, docker_env_vars, monkeypatch):
+    monkeypatch.setenv('COMPRESS_MIN_SIZE', '10')
+    app = create_app(versionfile.strpath)
+    return app.app
+
+
+def get_version(client, accept_encoding):
+    return client.get(
+        '/__version__', headers={'Accept-Encoding': accept_encoding}
+    )
+
+
+def test_json_response_is_gzipped_when_accepted(client):
+    response = get_version(client, 'gzip, deflate')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) == len(response.data)
+    version = json.loads(gzip.decompress(response.data).decode('utf-8'))
+    assert version['version'] == '0.0.0'
+
+
+def test_response_is_not_compressed_unless_accepted(client):
+    for accept_encoding in ('', 'identity', 'gzip;q=0'):
+        response = get_version(client, accept_encoding)
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.data.decode('utf-8'))['version'] == '0.0.0'
+
+
+def test_small_responses_are_not_compressed(client, monkeypatch):
+    monkeypatch.setattr(compressor, 'min_size', 1000000)
+    response = get_version(client, 'gzip')
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_identical_bodies_are_compressed_once(client, monkeypatch):
+    calls = []
+
+    def counting_gzip(data, level):
+        calls.append(data)
+        return gzip.compress(data, level)
+
+    monkeypatch.setitem(compressor.encodings, 'gzip', counting_gzip)
+    compressor.bodies.clear()
+    first = get_version(client, 'gzip')
+    second = get_version(client, 'gzip')
+    assert first.data == second.data
+    assert len(calls) == 1
+
+
+def test_compressed_bodies_are_kept_in_a_bounded_lru():
+    bodies = CompressedBodies(2)
+    bodies.set('a', b'1')
+    bodies.set('b', b'2')
+    assert bodies.get('a') == b'1'
+    bodies.set('c', b'3')
+    assert bodies.get('b') is None
+    assert bodies.get('a') == b'1'
+    assert bodies.get('c') == b'3'
@@ -0,0 +1,62 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import time
+
+import pytest
+from flask import g
+
+from landoapi import deadline
+from landoapi.app import parse_deadlines
+
+
+def test_no_deadline_outside_of_bounded_operations(app):
+    with app.app_context():
+        assert deadline.remaining() is None
+        assert deadline.upstream_timeout() == deadline.UPSTREAM_TIMEOUT
+    assert deadline.remaining() is None
+
+
+def test_upstream_timeout_is_the_time_remaining(app):
+    with app.app_context():
+        g.deadline = time.monotonic() + 2
+        assert 0 < deadline.upstream_timeout() <= 2
+
+        g.deadline = time.monotonic() - 1
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.upstream_timeout()
+
+
+def test_bounded_operation_returns_504_after_deadline(app):
+    app.config['REQUEST_DEADLINES'] = {'test.slow': 0.5}
+
+    @deadline.bounded('test.slow')
+    def slow():
+        assert 0 < deadline.remaining() <= 0.5
+        raise deadline.DeadlineExceeded()
+
+    with app.test_request_context():
+        response = slow()
+        assert response.status_code == 504
+        assert g.get('deadline') is None
+
+
+def test_bounded_operation_uses_default_deadline(app):
+    app.config['REQUEST_DEADLINE'] = 3
+
+    @deadline.bounded('test.other')
+    def other():
+        return deadline.remaining(), deadline.is_partial()
+
+    with app.test_request_context():
+        left, partial = other()
+    assert 0 < left <= 3
+    assert not partial
+
+
+def test_parse_deadlines():
+    assert parse_deadlines('') == {}
+    assert parse_deadlines('revisions.get:10, landings.land:2.5') == {
+        'revisions.get': 10.0,
+        'landings.land': 2.5,
+    }
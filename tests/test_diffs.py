@@ -0,0 +1,109 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import os
+
+import pytest
+
+from landoapi.app import create_app
+from landoapi.diffs import diff_store, get_diff_id, load_rawdiff
+from landoapi.phabricator_client import PhabricatorClient
+from tests.canned_responses.phabricator.errors import CANNED_ERROR_NOT_FOUND
+from tests.canned_responses.phabricator.revisions import \
+    CANNED_REVISION_1_RAW_DIFF
+from tests.utils import phab_url, phid_for_response
+
+RAWDIFF = CANNED_REVISION_1_RAW_DIFF['result']
+
+
+@pytest.fixture
+def app(versionfile, docker_env_vars, monkeypatch, tmpdir):
+    monkeypatch.setenv('DIFF_STORE_DIR', tmpdir.join('diffs').strpath)
+    monkeypatch.setenv('DIFF_STORE_MAX_SIZE', '1000')
+    app = create_app(versionfile.strpath)
+    return app.app
+
+
+def test_stored_diff_is_content_addressed(app):
+    first = diff_store.put(1, RAWDIFF)
+    second = diff_store.put(2, RAWDIFF, 'api-key')
+    assert first.path == second.path
+    assert first.size == len(RAWDIFF.encode('utf-8'))
+    assert first.files == 1
+    with open(first.path) as f:
+        assert f.read() == RAWDIFF
+
+
+def test_stored_diff_is_only_public_when_loaded_without_api_key(app):
+    diff_store.put(1, RAWDIFF)
+    diff_store.put(2, RAWDIFF + '\n', 'api-key')
+    assert diff_store.get(1).digest == diff_store.get(1, 'other-key').digest
+    assert diff_store.get(2, 'api-key') is not None
+    assert diff_store.get(2) is None
+    assert diff_store.get(2, 'other-key') is None
+
+
+def test_least_recently_used_diffs_are_evicted(app):
+    # Each body takes 400 bytes of the 1000 the store may use.
+    bodies = {diff_id: str(diff_id) * 400 for diff_id in range(1, 4)}
+    diff_store.put(1, bodies[1])
+    diff_store.put(2, bodies[2])
+    os.utime(diff_store.get(1).path, (0, 0))
+    os.utime(diff_store.get(2).path, (1, 1))
+    diff_store.get(1)
+
+    diff_store.put(3, bodies[3])
+    assert diff_store.get(1) is not None
+    assert diff_store.get(2) is None
+    assert diff_store.get(3) is not None
+
+
+def test_load_rawdiff_requests_phabricator_once(app, phabfactory):
+    phabfactory.rawdiff(diffID='43480')
+    with app.app_context():
+        stored = load_rawdiff(43480, 'api-key')
+        assert stored.files == 1
+        calls = phabfactory.mock.call_count
+        assert load_rawdiff(43480, 'api-key') == stored
+        assert phabfactory.mock.call_count == calls
+
+
+def test_get_diff_id_from_diff_uri(app, phabfactory):
+    diff = phabfactory.diff()
+    phab = PhabricatorClient('api-key')
+    assert get_diff_id(phab, phid_for_response(diff)) == 43480
+
+
+def test_get_diff_id_of_unknown_uri_returns_none(app, phabfactory):
+    diff = phabfactory.diff()
+    diff_phid = phid_for_response(diff)
+    diff['result'][diff_phid]['uri'] = 'http://phabricator.test/D1'
+    phabfactory.phid(diff)
+    phab = PhabricatorClient('api-key')
+    assert get_diff_id(phab, diff_phid) is None
+
+
+def test_get_diff(client, phabfactory):
+    phabfactory.rawdiff(diffID='43480')
+    response = client.get('/diffs/43480?api_key=api-key')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/x-diff'
+    assert response.get_data(as_text=True) == RAWDIFF
+    assert 'Content-Encoding' not in response.headers
+
+    etag = response.headers['ETag']
+    response = client.get(
+        '/diffs/43480?api_key=api-key', headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+
+
+def test_get_diff_returns_404(client, phabfactory):
+    phabfactory.mock.get(
+        phab_url('differential.getrawdiff'),
+        status_code=200,
+        json=CANNED_ERROR_NOT_FOUND
+    )
+    response = client.get('/diffs/9000?api_key=api-key')
+    assert response.status_code == 404
+    assert response.content_type == 'application/problem+json'
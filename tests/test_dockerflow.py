@@ -4,11 +4,29 @@
 
 import json
 
+from landoapi.models.storage import pool_stats
+
 
 def test_dockerflow_lb_endpoint_returns_200(client):
     assert client.get('/__lbheartbeat__').status_code == 200
 
 
+def test_dockerflow_heartbeat_reports_database_pool_stats(client):
+    pool_stats.reset()
+    pool_stats.record_checkout(0.5, 10, 10)
+    response = client.get('/__heartbeat__')
+    assert response.status_code == 200
+    assert response.json == {
+        'database_pool': {
+            'checkouts': 1,
+            'mean_wait': 0.5,
+            'max_wait': 0.5,
+            'saturated_checkouts': 1,
+        },
+    }
+    pool_stats.reset()
+
+
 def test_dockerflow_version_endpoint_response(client):
     response = client.get('/__version__')
     assert response.status_code == 200
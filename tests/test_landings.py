@@ -2,29 +2,47 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import json
+import threading
+import time
+
 import pytest
+from sqlalchemy import event
 
-from landoapi.models.storage import db as _db
-from landoapi.models.landing import (Landing, TRANSPLANT_JOB_STARTED)
+from landoapi.app import create_app
+from landoapi.models.storage import db as _db, unit_of_work
+from landoapi.models.landing import (
+    Landing, landing_status_poller, TRANSPLANT_JOB_FINISHED,
+    TRANSPLANT_JOB_STARTED
+)
+from landoapi.notifier import landing_statuses
 
 from tests.canned_responses.phabricator.revisions import *
 from tests.canned_responses.lando_api.revisions import *
 from tests.canned_responses.lando_api.landings import *
 
 
+@pytest.fixture
+def app(versionfile, docker_env_vars, monkeypatch):
+    # Read the statuses changed by other processes without delay.
+    monkeypatch.setenv('LANDING_STATUS_POLL_INTERVAL', '0.01')
+    app = create_app(versionfile.strpath)
+    return app.app
+
+
 @pytest.fixture
 def db(app):
     """Reset database for each test."""
     with app.app_context():
         _db.init_app(app)
         _db.create_all()
+        landing_statuses.reset()
         # we just created.
         yield _db
         _db.session.remove()
         _db.drop_all()
 
 
-def test_landing_revision(db, client, phabfactory):
+def test_landing_revision(db, client, phabfactory, transplant):
     phabfactory.user()
     phabfactory.revision()
     response = client.post(
@@ -48,6 +66,71 @@ def test_landing_revision(db, client, phabfactory):
     }
 
 
+def test_landing_upstream_calls(
+    db, client, phabfactory, transplant, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.revision()
+    response = client.post(
+        '/landings?api_key=api-key',
+        data=json.dumps({
+            'revision_id': 'D1'
+        }),
+        content_type='application/json'
+    )
+    assert response.status_code == 202
+    # The revision, its author, its repo and its diff, but not its parents.
+    assert upstream_calls.count('phabricator') <= 5
+    assert upstream_calls.count('transplant', 'autoland') == 1
+
+
+def test_landing_reuses_revision_loaded_by_view(
+    db, client, phabfactory, transplant, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.revision()
+    response = client.get('/revisions/D1?api_key=api-key')
+    assert response.status_code == 200
+    upstream_calls.clear()
+
+    response = client.post(
+        '/landings?api_key=api-key',
+        data=json.dumps({
+            'revision_id': 'D1'
+        }),
+        content_type='application/json'
+    )
+    assert response.status_code == 202
+    # Only the diff, which viewing the revision doesn't need, is requested.
+    assert upstream_calls.count('phabricator', 'differential.query') == 0
+    assert upstream_calls.count('phabricator', 'user.query') == 0
+
+    # Landing again reuses the stored diff too.
+    upstream_calls.clear()
+    Landing.create('D1', 'api-key', save=False)
+    assert upstream_calls.count('phabricator') == 0
+
+
+def test_landing_refetches_stale_revision(
+    app, db, client, phabfactory, transplant, upstream_calls
+):
+    app.config['LANDING_REVISION_MAX_AGE'] = 0
+    phabfactory.user()
+    phabfactory.revision()
+    client.get('/revisions/D1?api_key=api-key')
+    upstream_calls.clear()
+
+    response = client.post(
+        '/landings?api_key=api-key',
+        data=json.dumps({
+            'revision_id': 'D1'
+        }),
+        content_type='application/json'
+    )
+    assert response.status_code == 202
+    assert upstream_calls.count('phabricator', 'differential.query') > 0
+
+
 def test_get_transplant_status(db, client):
     Landing(1, 'D1', 'started').save(True)
     response = client.get('/landings/1')
@@ -92,3 +175,172 @@ def test_get_jobs(db, client):
     response = client.get('/landings?revision_id=D1&status=finished')
     assert response.status_code == 200
     assert len(response.json) == 1
+
+
+def test_bulk_update_status(db):
+    Landing.bulk_create(
+        [Landing(i, 'D%s' % i, TRANSPLANT_JOB_STARTED) for i in range(1, 6)]
+    )
+    updated = Landing.bulk_update_status(
+        {
+            1: TRANSPLANT_JOB_FINISHED,
+            2: TRANSPLANT_JOB_FINISHED,
+            3: 'failed',
+            99: TRANSPLANT_JOB_FINISHED,
+        }
+    )
+    assert updated == 3
+
+    statuses = {
+        landing.request_id: landing.status
+        for landing in Landing.query.all()
+    }
+    assert statuses == {
+        1: TRANSPLANT_JOB_FINISHED,
+        2: TRANSPLANT_JOB_FINISHED,
+        3: 'failed',
+        4: TRANSPLANT_JOB_STARTED,
+        5: TRANSPLANT_JOB_STARTED,
+    }
+
+
+def test_save_in_unit_of_work_commits_once(db):
+    with unit_of_work():
+        first = Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+        # The saved Landing has an id before the block commits.
+        assert first.id is not None
+        Landing(2, 'D2', TRANSPLANT_JOB_STARTED).save(True)
+        with unit_of_work():
+            Landing(3, 'D3', TRANSPLANT_JOB_STARTED).save(True)
+    assert Landing.query.count() == 3
+
+
+def test_unit_of_work_rolls_back_on_error(db):
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+            Landing(2, 'D2', TRANSPLANT_JOB_STARTED).save(True)
+            raise RuntimeError()
+    assert Landing.query.count() == 0
+
+    # Saving outside of a unit of work still commits right away.
+    Landing(3, 'D3', TRANSPLANT_JOB_STARTED).save(True)
+    _db.session.rollback()
+    assert Landing.query.count() == 1
+
+
+def publish_when_waited_on(request_id, status):
+    def publish():
+        while not landing_statuses.waiters():
+            time.sleep(0.001)
+        landing_statuses.publish(request_id, status)
+
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    return publisher
+
+
+def test_get_landing_waits_for_status_change(db, client):
+    Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+    publisher = publish_when_waited_on(1, TRANSPLANT_JOB_FINISHED)
+
+    response = client.get('/landings/1?wait=10&since_status=started')
+    publisher.join()
+    assert response.status_code == 200
+    assert response.json['status'] == TRANSPLANT_JOB_FINISHED
+
+
+def change_status_when_waited_on(status):
+    """ Change the status in the database without publishing it, the way
+    another process would.
+    """
+    engine = _db.engine
+
+    def change():
+        while not landing_statuses.waiters():
+            time.sleep(0.001)
+        engine.execute(Landing.__table__.update().values(status=status))
+
+    changer = threading.Thread(target=change)
+    changer.start()
+    return changer
+
+
+def test_get_landing_reads_status_changed_by_other_process(db, client):
+    Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+    changer = change_status_when_waited_on(TRANSPLANT_JOB_FINISHED)
+
+    response = client.get('/landings/1?wait=10&since_status=started')
+    changer.join()
+    assert response.status_code == 200
+    assert response.json['status'] == TRANSPLANT_JOB_FINISHED
+
+
+def test_get_landing_does_not_wait_if_status_changed(db, client):
+    Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+    response = client.get('/landings/1?wait=10&since_status=finished')
+    assert response.status_code == 200
+    assert response.json == CANNED_LANDING_1
+
+
+def test_committed_status_changes_are_published(db):
+    Landing.bulk_create([Landing(1, 'D1', TRANSPLANT_JOB_STARTED)])
+    Landing.bulk_update_status({1: TRANSPLANT_JOB_FINISHED})
+    status = landing_statuses.wait(1, TRANSPLANT_JOB_STARTED, 0)
+    assert status == TRANSPLANT_JOB_FINISHED
+
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            Landing(2, 'D2', TRANSPLANT_JOB_STARTED).save(True)
+            raise RuntimeError()
+    assert landing_statuses.wait(2, None, 0) is None
+
+
+def test_statuses_are_read_in_one_query(db):
+    Landing.bulk_create(
+        [Landing(i, 'D%s' % i, TRANSPLANT_JOB_STARTED) for i in (1, 2, 3)]
+    )
+    Landing.bulk_update_status({2: TRANSPLANT_JOB_FINISHED})
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(_db.engine, 'before_cursor_execute', record)
+    try:
+        statuses = landing_status_poller.read([1, 2, 4])
+    finally:
+        event.remove(_db.engine, 'before_cursor_execute', record)
+    assert len(statements) == 1
+    assert statuses == {1: TRANSPLANT_JOB_STARTED, 2: TRANSPLANT_JOB_FINISHED}
+
+
+def test_landing_events(db, client):
+    Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+    publisher = publish_when_waited_on(1, TRANSPLANT_JOB_FINISHED)
+
+    response = client.get('/landings/1/events')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.get_data(as_text=True) == (
+        'event: status\ndata: {"id": 1, "status": "started"}\n\n'
+        'event: status\ndata: {"id": 1, "status": "finished"}\n\n'
+    )
+    publisher.join()
+
+
+def test_landing_events_read_status_changed_by_other_process(db, client):
+    Landing(1, 'D1', TRANSPLANT_JOB_STARTED).save(True)
+    changer = change_status_when_waited_on(TRANSPLANT_JOB_FINISHED)
+
+    response = client.get('/landings/1/events')
+    assert response.get_data(as_text=True) == (
+        'event: status\ndata: {"id": 1, "status": "started"}\n\n'
+        'event: status\ndata: {"id": 1, "status": "finished"}\n\n'
+    )
+    changer.join()
+
+
+def test_landing_events_for_missing_landing(db, client):
+    response = client.get('/landings/1/events')
+    assert response.status_code == 404
@@ -0,0 +1,97 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Tests for the database schema migrations.
+"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from landoapi import migrations
+
+
+@pytest.fixture
+def engine(tmpdir):
+    return create_engine('sqlite:///%s' % tmpdir.join('migrations.db'))
+
+
+def index_names(engine, table):
+    return {i['name'] for i in inspect(engine).get_indexes(table)}
+
+
+def column_names(engine, table):
+    return {c['name'] for c in inspect(engine).get_columns(table)}
+
+
+def test_migrations_are_numbered_in_sequence():
+    versions = [m.version for m in migrations.load_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_upgrade_empty_database(engine):
+    applied = migrations.upgrade(engine, echo=lambda message: None)
+    assert [m.version for m in applied] == \
+        [m.version for m in migrations.load_migrations()]
+    assert migrations.current_version(engine) == migrations.head_version()
+    assert {'created_at', 'updated_at'} <= column_names(engine, 'landings')
+    assert {'ix_landings_revision_id', 'ix_landings_status'} <= \
+        index_names(engine, 'landings')
+    assert column_names(engine, 'revision_edges') == \
+        {'child_phid', 'parent_phid', 'date_modified'}
+
+
+def test_upgrade_database_created_before_migrations(engine):
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                'CREATE TABLE landings (id INTEGER PRIMARY KEY, '
+                'request_id INTEGER UNIQUE, revision_id VARCHAR(30), '
+                'status INTEGER)'
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO landings (request_id, revision_id, status) "
+                "VALUES (1, 'D1', 'started')"
+            )
+        )
+
+    migrations.upgrade(engine, echo=lambda message: None)
+    assert 'created_at' in column_names(engine, 'landings')
+    with engine.connect() as connection:
+        count = connection.execute(text('SELECT COUNT(*) FROM landings'))
+        assert count.scalar() == 1
+
+
+def test_upgrade_to_target_then_head(engine):
+    migrations.upgrade(engine, target=1, echo=lambda message: None)
+    assert migrations.current_version(engine) == 1
+    assert 'created_at' not in column_names(engine, 'landings')
+
+    applied = migrations.upgrade(engine, echo=lambda message: None)
+    assert [m.version for m in applied] == \
+        list(range(2, migrations.head_version() + 1))
+
+
+def test_upgrade_is_a_noop_when_up_to_date(engine):
+    migrations.upgrade(engine, echo=lambda message: None)
+    assert migrations.upgrade(engine, echo=lambda message: None) == []
+
+
+def test_created_schema_matches_migrated_schema(app, engine, tmpdir):
+    from landoapi.models.storage import db
+
+    migrations.upgrade(engine, echo=lambda message: None)
+
+    created = create_engine('sqlite:///%s' % tmpdir.join('created.db'))
+    with app.app_context():
+        db.metadata.create_all(created)
+    migrations.stamp(created)
+
+    assert migrations.current_version(created) == migrations.head_version()
+    assert column_names(created, 'landings') == \
+        column_names(engine, 'landings')
+    assert index_names(created, 'landings') == \
+        index_names(engine, 'landings')
+    assert column_names(created, 'revision_edges') == \
+        column_names(engine, 'revision_edges')
@@ -0,0 +1,81 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import threading
+import time
+
+from flask import Flask
+
+from landoapi.notifier import Notifier, Poller
+
+
+def test_wait_returns_published_value():
+    notifier = Notifier()
+    results = []
+    waiter = threading.Thread(
+        target=lambda: results.append(notifier.wait(1, 'started', 5))
+    )
+    waiter.start()
+    while not notifier.waiters():
+        time.sleep(0.001)
+
+    notifier.publish(1, 'finished')
+    waiter.join(5)
+    assert results == ['finished']
+    assert notifier.waiters() == 0
+
+
+def test_wait_times_out_without_change():
+    notifier = Notifier()
+    notifier.publish(1, 'started')
+    notifier.publish(2, 'finished')
+    assert notifier.wait(1, 'started', 0.01) is None
+
+
+def test_wait_returns_value_published_before_waiting():
+    notifier = Notifier()
+    notifier.publish(1, 'finished')
+    assert notifier.wait(1, 'started', 0) == 'finished'
+
+
+def test_remembered_keys_are_bounded():
+    notifier = Notifier(max_keys=2)
+    for key in range(3):
+        notifier.publish(key, 'finished')
+    assert notifier.wait(0, 'started', 0) is None
+    assert notifier.wait(2, 'started', 0) == 'finished'
+
+
+def test_poller_reads_the_keys_waited_on_at_once():
+    notifier = Notifier()
+    statuses = {1: 'finished', 2: 'started', 3: 'finished'}
+    reads = []
+
+    def read(keys):
+        reads.append(sorted(keys))
+        return {key: statuses[key] for key in keys}
+
+    poller = Poller(notifier, read)
+    poller.init_app(Flask(__name__), 0.01)
+    poller.poll()
+    assert reads == []
+
+    results = {}
+
+    def wait(key):
+        results[key] = notifier.wait(key, 'started', 5)
+
+    waiters = [threading.Thread(target=wait, args=(key, )) for key in (1, 2)]
+    for waiter in waiters:
+        waiter.start()
+    while notifier.waiters() < 2:
+        time.sleep(0.001)
+
+    poller.start()
+    waiters[0].join(5)
+    assert results == {1: 'finished'}
+    assert reads[0] == [1, 2]
+
+    statuses[2] = 'finished'
+    waiters[1].join(5)
+    assert results == {1: 'finished', 2: 'finished'}
@@ -7,8 +7,8 @@ Tests for the PhabricatorClient
 import pytest
 import requests_mock
 
-from landoapi.phabricator_client import PhabricatorClient, \
-    PhabricatorAPIException
+from landoapi.phabricator_client import INVISIBLE, MISSING, \
+    PhabricatorClient, PhabricatorAPIException
 from landoapi.utils import extract_rawdiff_id_from_uri
 
 from tests.utils import *
@@ -32,6 +32,34 @@ def test_get_revision_with_200_response():
         assert revision == CANNED_REVISION_1['result'][0]
 
 
+def test_get_revisions_batches_ids_in_one_request():
+    phab = PhabricatorClient(api_key='api-key')
+    result = CANNED_REVISION_1['result'] + CANNED_REVISION_2['result']
+    with requests_mock.mock() as m:
+        m.get(
+            phab_url('differential.query'),
+            status_code=200,
+            json={
+                'result': result,
+                'error_code': None,
+                'error_info': None,
+            }
+        )
+        revisions = phab.get_revisions(ids=['D1', '2'])
+        assert m.call_count == 1
+        assert form_matcher('ids[]', '1')(m.last_request)
+        assert form_matcher('ids[]', '2')(m.last_request)
+        phids = [r['phid'] for r in revisions]
+        assert phids == ['PHID-DREV-1', 'PHID-DREV-2']
+
+
+def test_get_revisions_without_ids_or_phids_makes_no_request():
+    phab = PhabricatorClient(api_key='api-key')
+    with requests_mock.mock() as m:
+        assert phab.get_revisions() == []
+        assert m.call_count == 0
+
+
 def test_get_current_user_with_200_response():
     phab = PhabricatorClient(api_key='api-key')
     with requests_mock.mock() as m:
@@ -66,6 +94,126 @@ def test_get_repo_returns_with_200_response():
         assert repo == canned_response_repo
 
 
+def test_get_users_batches_phids_in_one_request():
+    phab = PhabricatorClient(api_key='api-key')
+    user_phid = CANNED_USER_1['result'][0]['phid']
+    with requests_mock.mock() as m:
+        m.get(phab_url('user.query'), status_code=200, json=CANNED_USER_1)
+        m.get(
+            phab_url('phid.query'), status_code=200, json=CANNED_EMPTY_RESULT
+        )
+        users = phab.get_users([user_phid, 'PHID-USER-2'])
+        assert m.request_history[0].path == '/api/user.query'
+        assert form_matcher('phids[]', user_phid)(m.request_history[0])
+        assert form_matcher('phids[]', 'PHID-USER-2')(m.request_history[0])
+        assert users == CANNED_USER_1['result']
+
+
+def test_get_repos_returns_repos_by_phid():
+    phab = PhabricatorClient(api_key='api-key')
+    with requests_mock.mock() as m:
+        m.get(
+            phab_url('phid.query'),
+            status_code=200,
+            json=CANNED_REPO_MOZCENTRAL
+        )
+        phids = list(CANNED_REPO_MOZCENTRAL['result'])
+        repos = phab.get_repos(phids)
+        assert m.call_count == 1
+        assert repos == CANNED_REPO_MOZCENTRAL['result']
+
+
+def test_get_users_and_repos_without_phids_make_no_request():
+    phab = PhabricatorClient(api_key='api-key')
+    with requests_mock.mock() as m:
+        assert phab.get_users([]) == []
+        assert phab.get_repos([]) == {}
+        assert m.call_count == 0
+
+
+def test_resolve_phids_makes_one_request_per_method():
+    phab = PhabricatorClient(api_key='api-key')
+    user = CANNED_USER_1['result'][0]
+    repo_phid, repo = list(CANNED_REPO_MOZCENTRAL['result'].items())[0]
+    revision = CANNED_REVISION_1['result'][0]
+    with requests_mock.mock() as m:
+        m.get(phab_url('user.query'), status_code=200, json=CANNED_USER_1)
+        m.get(
+            phab_url('differential.query'),
+            status_code=200,
+            json=CANNED_REVISION_1
+        )
+        m.get(
+            phab_url('phid.query'),
+            status_code=200,
+            json=CANNED_REPO_MOZCENTRAL
+        )
+        resolved = phab.resolve_phids(
+            [user['phid'], repo_phid, revision['phid']]
+        )
+        assert m.call_count == 3
+        assert resolved == {
+            user['phid']: user,
+            repo_phid: repo,
+            revision['phid']: revision,
+        }
+
+
+def test_resolve_phids_tells_missing_from_invisible():
+    phab = PhabricatorClient(api_key='api-key')
+    # phid.query knows of the revisions the api key can't view.
+    handles = {'PHID-DREV-2': {'phid': 'PHID-DREV-2', 'name': 'D2'}}
+    with requests_mock.mock() as m:
+        m.get(
+            phab_url('differential.query'),
+            status_code=200,
+            json=CANNED_EMPTY_RESULT
+        )
+        m.get(
+            phab_url('phid.query'),
+            status_code=200,
+            json={
+                'result': handles,
+                'error_code': None,
+                'error_info': None,
+            }
+        )
+        resolved = phab.resolve_phids(['PHID-DREV-2', 'PHID-DREV-3'])
+        assert m.call_count == 2
+        assert resolved == {'PHID-DREV-2': INVISIBLE, 'PHID-DREV-3': MISSING}
+
+
+def test_resolve_phids_without_phids_makes_no_request():
+    phab = PhabricatorClient(api_key='api-key')
+    with requests_mock.mock() as m:
+        assert phab.resolve_phids([]) == {}
+        assert m.call_count == 0
+
+
+def test_get_rawdiff_returns_text():
+    phab = PhabricatorClient(api_key='api-key')
+    with requests_mock.mock() as m:
+        m.get(
+            phab_url('differential.getrawdiff'),
+            status_code=200,
+            json=CANNED_REVISION_1_RAW_DIFF
+        )
+        rawdiff = phab.get_rawdiff(43480)
+        assert rawdiff == CANNED_REVISION_1_RAW_DIFF['result']
+        assert form_matcher('diffID', '43480')(m.last_request)
+
+
+def test_get_rawdiff_of_unknown_diff_returns_none():
+    phab = PhabricatorClient(api_key='api-key')
+    with requests_mock.mock() as m:
+        m.get(
+            phab_url('differential.getrawdiff'),
+            status_code=200,
+            json=CANNED_ERROR_NOT_FOUND
+        )
+        assert phab.get_rawdiff(9000) is None
+
+
 def test_phabricator_exception():
     """ Ensures that the PhabricatorClient converts JSON errors from Phabricator
     into proper exceptions with the error_code and error_message in tact.
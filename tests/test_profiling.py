@@ -0,0 +1,79 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import pstats
+
+import pytest
+
+from landoapi.app import create_app
+from landoapi.compression import compressor
+from landoapi.profiling import PROFILE_HEADER, PROFILE_ID_HEADER
+
+
+@pytest.fixture
+def profile_dir(tmpdir):
+    return tmpdir.join('profiles')
+
+
+@pytest.fixture
+def app(versionfile, docker_env_vars, monkeypatch, profile_dir):
+    monkeypatch.setenv('PROFILE_SECRET', 'profile-secret')
+    monkeypatch.setenv('PROFILE_DIR', profile_dir.strpath)
+    monkeypatch.setenv('PROFILE_MAX_FILES', '2')
+    app = create_app(versionfile.strpath)
+    return app.app
+
+
+def profiled_get(client, url, secret='profile-secret'):
+    return client.get(url, headers={PROFILE_HEADER: secret})
+
+
+def test_request_with_secret_is_profiled(client, profile_dir):
+    response = profiled_get(client, '/__lbheartbeat__')
+    assert response.status_code == 200
+
+    profile_id = response.headers[PROFILE_ID_HEADER]
+    pstats.Stats(profile_dir.join(profile_id + '.prof').strpath)
+    summary = json.loads(profile_dir.join(profile_id + '.json').read())
+    assert summary['route'] == '/__lbheartbeat__'
+    assert summary['status'] == 200
+    assert summary['upstream_calls'] == []
+
+
+def test_request_without_secret_is_not_profiled(client, profile_dir):
+    response = client.get('/__lbheartbeat__')
+    assert PROFILE_ID_HEADER not in response.headers
+
+    response = profiled_get(client, '/__lbheartbeat__', 'wrong-secret')
+    assert PROFILE_ID_HEADER not in response.headers
+    assert profile_dir.listdir() == []
+
+
+def test_profile_includes_response_compression(
+    client, profile_dir, monkeypatch
+):
+    monkeypatch.setattr(compressor, 'min_size', 10)
+    headers = {PROFILE_HEADER: 'profile-secret', 'Accept-Encoding': 'gzip'}
+    response = client.get('/__version__', headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    profile_id = response.headers[PROFILE_ID_HEADER]
+    stats = pstats.Stats(profile_dir.join(profile_id + '.prof').strpath)
+    functions = {function for _, _, function in stats.stats}
+    assert 'compress_response' in functions
+
+
+def test_profiles_are_kept_in_a_bounded_ring(client, profile_dir):
+    ids = []
+    for _ in range(3):
+        response = profiled_get(client, '/__lbheartbeat__')
+        ids.append(response.headers[PROFILE_ID_HEADER])
+    kept = sorted(p.purebasename for p in profile_dir.listdir('*.prof'))
+    assert kept == ids[1:]
+
+
+def test_profiling_is_off_by_default(versionfile, docker_env_vars):
+    flask_app = create_app(versionfile.strpath).app
+    response = profiled_get(flask_app.test_client(), '/__lbheartbeat__')
+    assert PROFILE_ID_HEADER not in response.headers
@@ -0,0 +1,106 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Tests for routing landing queries to a read replica.
+
+The primary and the replica are two separate SQLite files which are never
+synchronized, so the data a request sees shows which one it read from.
+"""
+import json
+
+import pytest
+
+from landoapi.app import create_app
+from landoapi.models import replica
+from landoapi.models.landing import Landing
+from landoapi.models.storage import db as _db, REPLICA_BIND
+
+
+@pytest.fixture
+def app(versionfile, docker_env_vars, monkeypatch, tmpdir):
+    monkeypatch.setenv(
+        'DATABASE_URL', 'sqlite:///%s' % tmpdir.join('primary.db')
+    )
+    monkeypatch.setenv(
+        'DATABASE_REPLICA_URL', 'sqlite:///%s' % tmpdir.join('replica.db')
+    )
+    replica.replica_lag.reset()
+    app = create_app(versionfile.strpath)
+    return app.app
+
+
+@pytest.fixture
+def db(db, app):
+    """Also create the tables in the replica."""
+    replica_engine = db.get_engine(app, bind=REPLICA_BIND)
+    db.metadata.create_all(replica_engine)
+    yield db
+    db.metadata.drop_all(replica_engine)
+
+
+def test_reads_go_to_replica(db, client):
+    Landing(1, 'D1', 'started').save(True)
+
+    response = client.get('/landings')
+    assert response.status_code == 200
+    assert response.json == []
+
+    response = client.get('/landings/1')
+    assert response.status_code == 404
+
+
+def test_client_reads_its_own_writes(db, client, phabfactory, transplant):
+    phabfactory.user()
+    phabfactory.revision()
+    response = client.post(
+        '/landings?api_key=api-key',
+        data=json.dumps({
+            'revision_id': 'D1'
+        }),
+        content_type='application/json'
+    )
+    assert response.status_code == 202
+
+    # The test client sends back the cookie set by the write.
+    response = client.get('/landings/1')
+    assert response.status_code == 200
+    assert response.json['revision_id'] == 'D1'
+
+
+def test_lagging_replica_falls_back_to_primary(db, client, monkeypatch):
+    monkeypatch.setattr(replica, 'measure_replica_lag', lambda: 3600.0)
+    Landing(1, 'D1', 'started').save(True)
+
+    response = client.get('/landings')
+    assert len(response.json) == 1
+
+
+def test_unavailable_replica_falls_back_to_primary(db, client, monkeypatch):
+    monkeypatch.setattr(replica, 'measure_replica_lag', lambda: None)
+    Landing(1, 'D1', 'started').save(True)
+
+    response = client.get('/landings/1')
+    assert response.status_code == 200
+
+
+def test_writes_inside_read_replica_block_go_to_primary(db, app):
+    with replica.read_replica() as session:
+        assert session.use_replica
+        Landing(1, 'D1', 'started').save(True)
+        # The pending landing is autoflushed before the query is run.
+        session.add(Landing(2, 'D2', 'started'))
+        assert Landing.query.count() == 0
+        Landing.query.filter_by(request_id=1).update({'status': 'landed'})
+        session.commit()
+    assert not _db.session().use_replica
+
+    primary = _db.get_engine(app)
+    assert primary.execute('SELECT COUNT(*) FROM landings').scalar() == 2
+    status = primary.execute(
+        'SELECT status FROM landings WHERE request_id = 1'
+    )
+    assert status.scalar() == 'landed'
+    replica_engine = _db.get_engine(app, bind=REPLICA_BIND)
+    count = replica_engine.execute('SELECT COUNT(*) FROM landings').scalar()
+    assert count == 0
@@ -0,0 +1,96 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from collections import namedtuple
+
+from sqlalchemy import event
+
+from landoapi.models.revision_edge import RevisionEdge
+
+StubRevision = namedtuple('StubRevision', 'phid date_modified parent_phids')
+
+
+def test_ancestors_of_diamond(db):
+    RevisionEdge.record(
+        [
+            StubRevision('D4', 1, ('D2', 'D3')),
+            StubRevision('D3', 1, ('D1', )),
+            StubRevision('D2', 1, ('D1', )),
+            StubRevision('D1', 1, ()),
+            StubRevision('D9', 1, ('D8', )),
+        ]
+    )
+    assert RevisionEdge.ancestors('D4') == {'D1', 'D2', 'D3'}
+    assert RevisionEdge.ancestors('D1') == set()
+    assert RevisionEdge.ancestors('D0') == set()
+
+
+def test_ancestors_ends_on_cycles(db):
+    RevisionEdge.record(
+        [
+            StubRevision('D1', 1, ('D2', )),
+            StubRevision('D2', 1, ('D1', )),
+        ]
+    )
+    assert RevisionEdge.ancestors('D1') == {'D1', 'D2'}
+
+
+def test_ancestors_within_depth(db):
+    RevisionEdge.record(
+        [
+            StubRevision('D4', 1, ('D3', )),
+            StubRevision('D3', 1, ('D2', )),
+            StubRevision('D2', 1, ('D1', )),
+            StubRevision('D9', 1, ('D8', )),
+            StubRevision('D8', 1, ('D9', )),
+        ]
+    )
+    assert RevisionEdge.ancestors('D4', depth=2) == {'D3', 'D2'}
+    assert RevisionEdge.ancestors('D4', depth=10) == {'D3', 'D2', 'D1'}
+    assert RevisionEdge.ancestors('D4', depth=0) == set()
+    assert RevisionEdge.ancestors('D9', depth=5) == {'D8', 'D9'}
+
+
+def test_record_only_rewrites_modified_revisions(db):
+    RevisionEdge.record([StubRevision('D3', 1, ('D1', ))])
+
+    # Same dateModified, the recorded edges are kept.
+    RevisionEdge.record([StubRevision('D3', 1, ('D2', ))])
+    assert RevisionEdge.ancestors('D3') == {'D1'}
+
+    RevisionEdge.record([StubRevision('D3', 2, ('D2', ))])
+    assert RevisionEdge.ancestors('D3') == {'D2'}
+
+    RevisionEdge.record([StubRevision('D3', 3, ())])
+    assert RevisionEdge.ancestors('D3') == set()
+
+
+def test_record_skips_unrecorded_revisions_without_parents(db):
+    deletes = []
+
+    def count_delete(delete_context):
+        deletes.append(delete_context)
+
+    event.listen(db.session(), 'after_bulk_delete', count_delete)
+    RevisionEdge.record([StubRevision('D1', 1, ()), StubRevision('D2', 1, ())])
+    event.remove(db.session(), 'after_bulk_delete', count_delete)
+    assert deletes == []
+    assert RevisionEdge.query.count() == 0
+
+
+def test_record_is_best_effort_on_conflicts(db):
+    row = {'child_phid': 'D2', 'parent_phid': 'D1', 'date_modified': 1}
+
+    def record_concurrently(delete_context):
+        # Another request records the same edge after the delete.
+        insert = RevisionEdge.__table__.insert().values(**row)
+        delete_context.session.execute(insert)
+
+    event.listen(db.session(), 'after_bulk_delete', record_concurrently)
+    RevisionEdge.record([StubRevision('D2', 1, ('D1', ))])
+    event.remove(db.session(), 'after_bulk_delete', record_concurrently)
+
+    # The transaction was rolled back, and the index is still usable.
+    assert RevisionEdge.ancestors('D2') == set()
+    RevisionEdge.record([StubRevision('D2', 1, ('D1', ))])
+    assert RevisionEdge.ancestors('D2') == {'D1'}
@@ -0,0 +1,209 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Tests for the Revision, User and Repo value objects.
+"""
+import pickle
+from copy import deepcopy
+
+from landoapi.phabricator_client import INVISIBLE, MISSING
+from landoapi.models.revision import PhabricatorObjects, Revision, \
+    serialize_graph, serialize_levels
+from tests.canned_responses.lando_api.revisions import CANNED_LANDO_REVISION_2
+from tests.canned_responses.phabricator.repos import CANNED_REPO_MOZCENTRAL
+from tests.canned_responses.phabricator.revisions import CANNED_REVISION_1, \
+    CANNED_REVISION_2
+from tests.canned_responses.phabricator.users import CANNED_USER_1
+from tests.utils import first_result_in_response
+
+
+class FakePhabricatorClient:
+    """ Answers user and repo lookups from canned data, counting calls. """
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_user(self, phid):
+        self.calls += 1
+        return deepcopy(first_result_in_response(CANNED_USER_1))
+
+    def get_repo(self, phid):
+        self.calls += 1
+        return deepcopy(first_result_in_response(CANNED_REPO_MOZCENTRAL))
+
+    def resolve_phids(self, phids):
+        self.calls += 1
+        user = first_result_in_response(CANNED_USER_1)
+        repo = first_result_in_response(CANNED_REPO_MOZCENTRAL)
+        return {
+            phid: deepcopy(user if phid.startswith('PHID-USER') else repo)
+            for phid in phids
+        }
+
+
+class HiddenPhabricatorClient(FakePhabricatorClient):
+    """ Resolves users as invisible and repos as missing. """
+
+    def get_user(self, phid):
+        self.calls += 1
+        return None
+
+    def get_repo(self, phid):
+        self.calls += 1
+        return None
+
+    def resolve_phids(self, phids):
+        self.calls += 1
+        return {
+            phid: INVISIBLE if phid.startswith('PHID-USER') else MISSING
+            for phid in phids
+        }
+
+
+def build_stack():
+    phab = FakePhabricatorClient()
+    objects = PhabricatorObjects(phab)
+    parent = objects.revision(first_result_in_response(CANNED_REVISION_1))
+    child = objects.revision(first_result_in_response(CANNED_REVISION_2))
+    child.parents = (parent, )
+    return phab, child
+
+
+def test_revision_serializes_to_api_payload():
+    phab, revision = build_stack()
+    assert revision.serialize() == CANNED_LANDO_REVISION_2
+
+
+def test_revision_serializes_selected_fields():
+    phab, revision = build_stack()
+    payload = revision.serialize(['title', 'author'], parents='ids')
+    assert payload == {
+        'id': 2,
+        'phid': 'PHID-DREV-2',
+        'title': revision.title,
+        'author': revision.author.serialize(),
+        'parent_phids': ['PHID-DREV-1'],
+    }
+    assert 'parent_revisions' not in revision.serialize(parents='none')
+
+
+def test_registry_can_skip_user_and_repo_lookups():
+    phab = FakePhabricatorClient()
+    objects = PhabricatorObjects(phab, with_users=False, with_repos=False)
+    revision, = objects.revisions(
+        [first_result_in_response(CANNED_REVISION_2)]
+    )
+    assert revision.author is None
+    assert revision.repo is None
+    assert phab.calls == 0
+    assert revision.serialize(['title'])['title'] == revision.title
+
+
+def test_stack_shares_author_and_repo_instances():
+    phab, revision = build_stack()
+    parent = revision.parents[0]
+    assert revision.author is parent.author
+    assert revision.repo is parent.repo
+    assert phab.calls == 2
+
+
+def test_revision_parent_phids_come_from_depends_on():
+    phab, revision = build_stack()
+    assert revision.parent_phids == ('PHID-DREV-1', )
+    assert revision.parents[0].parent_phids == ()
+
+
+def test_revision_without_bug_id():
+    data = deepcopy(first_result_in_response(CANNED_REVISION_1))
+    data['auxiliary']['bugzilla.bug-id'] = ''
+    revision = Revision.from_phabricator(data, None, None)
+    assert revision.bug_id is None
+
+
+def test_pickled_stack_keeps_shared_instances():
+    phab, revision = build_stack()
+    revision = pickle.loads(pickle.dumps(revision))
+    assert revision.author is revision.parents[0].author
+    assert revision.serialize() == CANNED_LANDO_REVISION_2
+
+
+def test_revisions_prefetch_authors_and_repos_together():
+    phab = FakePhabricatorClient()
+    objects = PhabricatorObjects(phab)
+    parent, child = objects.revisions(
+        [
+            first_result_in_response(CANNED_REVISION_1),
+            first_result_in_response(CANNED_REVISION_2),
+        ]
+    )
+    assert child.author is parent.author
+    assert child.repo is parent.repo
+    assert phab.calls == 1
+
+    # Objects already seen aren't requested again.
+    objects.revisions([first_result_in_response(CANNED_REVISION_1)])
+    assert phab.calls == 1
+
+
+def test_serialize_graph_lists_shared_nodes_once():
+    phab, revision = build_stack()
+    parent = revision.parents[0]
+    graph = serialize_graph([revision, parent])
+
+    assert sorted(graph['revisions']) == ['PHID-DREV-1', 'PHID-DREV-2']
+    node = graph['revisions']['PHID-DREV-2']
+    assert node['parent_phids'] == ['PHID-DREV-1']
+    assert node['author_phid'] == revision.author.phid
+    assert node['repo_phid'] == revision.repo.phid
+    author, repo = revision.author, revision.repo
+    assert graph['users'] == {author.phid: author.serialize()}
+    assert graph['repos'] == {repo.phid: repo.serialize()}
+
+
+def test_serialize_levels_leaves_out_ancestors_above_depth():
+    phab, revision = build_stack()
+    graph, frontier = serialize_levels([revision], 0)
+    assert sorted(graph['revisions']) == ['PHID-DREV-2']
+    assert graph['revisions']['PHID-DREV-2']['parent_phids'] == ['PHID-DREV-1']
+    assert frontier == ['PHID-DREV-1']
+
+    graph, frontier = serialize_levels([revision], 1)
+    assert graph == serialize_graph([revision])
+    assert frontier == []
+
+
+def test_invisible_author_and_missing_repo_are_not_requested_again():
+    phab = HiddenPhabricatorClient()
+    objects = PhabricatorObjects(phab)
+    parent, child = objects.revisions(
+        [
+            first_result_in_response(CANNED_REVISION_1),
+            first_result_in_response(CANNED_REVISION_2),
+        ]
+    )
+    assert child.author is None
+    assert child.repo is None
+    assert phab.calls == 1
+
+    objects.revision(first_result_in_response(CANNED_REVISION_1))
+    assert phab.calls == 1
+
+    child.parents = (parent, )
+    payload = child.serialize(['author', 'repo'], parents='none')
+    assert payload['author'] is None
+    assert payload['repo'] is None
+    graph = serialize_graph([child])
+    assert graph['revisions']['PHID-DREV-2']['author_phid'] is None
+    assert graph['users'] == {}
+    assert graph['repos'] == {}
+
+
+def test_invisible_author_is_looked_up_once_without_prefetch():
+    phab = HiddenPhabricatorClient()
+    objects = PhabricatorObjects(phab)
+    revision = objects.revision(first_result_in_response(CANNED_REVISION_1))
+    objects.revision(first_result_in_response(CANNED_REVISION_2))
+    assert revision.author is None
+    assert revision.repo is None
+    assert phab.calls == 2
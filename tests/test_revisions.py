@@ -3,11 +3,17 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+
+from landoapi import deadline, revisions
 from tests.canned_responses.lando_api.revisions import *
 from tests.utils import phid_for_response
 
-pytestmark = pytest.mark.usefixtures('docker_env_vars')
+pytestmark = pytest.mark.usefixtures('docker_env_vars', 'db')
 
 
 def test_get_revision(client, phabfactory):
@@ -40,8 +46,333 @@ def test_get_revision_with_parents(client, phabfactory):
     assert parent_revision['phid'] == phid_for_response(rev1)
 
 
+def test_get_revision_stack_upstream_calls(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(20)
+
+    response = client.get('/revisions/D20?api_key=api-key')
+    assert response.status_code == 200
+    revision, depth = response.json, 1
+    while revision['parent_revisions']:
+        revision, depth = revision['parent_revisions'][0], depth + 1
+    assert depth == 20
+
+    # Nothing is known of the stack yet, so it is walked one level per
+    # call. The author and repo shared by the stack are looked up once.
+    assert upstream_calls.count('phabricator', 'differential.query') == 20
+    assert upstream_calls.count('phabricator', 'user.query') == 1
+    assert upstream_calls.count('phabricator', 'phid.query') == 1
+
+    # Once the edge index is warm, the revision and all of its ancestors are
+    # requested together. Another api key doesn't use the cached stack.
+    upstream_calls.clear()
+    response = client.get('/revisions/D20?api_key=other-api-key')
+    assert response.status_code == 200
+    assert upstream_calls.count('phabricator') <= 3
+    assert upstream_calls.count('phabricator', 'differential.query') == 1
+    assert upstream_calls.count('phabricator', 'user.query') == 1
+    assert upstream_calls.count('phabricator', 'phid.query') == 1
+
+
+def test_get_revision_requested_with_its_known_ancestors(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(3)
+    client.get('/revisions/D3?api_key=api-key')
+
+    # The phid of D3 and the phids of its ancestors are now known.
+    upstream_calls.clear()
+    response = client.get('/revisions/D3?api_key=other-api-key')
+    assert response.status_code == 200
+    calls = upstream_calls.calls
+    queries = [c for c in calls if c.method == 'differential.query']
+    assert len(queries) == 1
+    assert sorted(queries[0].params['phids[]']) == [
+        'PHID-DREV-1', 'PHID-DREV-2', 'PHID-DREV-3'
+    ]
+
+
+def test_get_revision_is_cached_per_api_key(client, phabfactory):
+    phabfactory.user()
+    phabfactory.revision()
+    client.get('/revisions/D1?api_key=api-key')
+    phabricator_calls = phabfactory.mock.call_count
+
+    response = client.get('/revisions/D1?api_key=api-key')
+    assert response.json == CANNED_LANDO_REVISION_1
+    assert phabfactory.mock.call_count == phabricator_calls
+
+    client.get('/revisions/D1?api_key=other-api-key')
+    assert phabfactory.mock.call_count > phabricator_calls
+
+
+def test_get_revision_with_selected_fields(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(3)
+    response = client.get('/revisions/D3?api_key=api-key&fields=title,status')
+    assert response.status_code == 200
+    assert sorted(response.json) == [
+        'id', 'parent_revisions', 'phid', 'status', 'title'
+    ]
+    parent = response.json['parent_revisions'][0]
+    assert sorted(parent) == [
+        'id', 'parent_revisions', 'phid', 'status', 'title'
+    ]
+
+    # Authors and repos weren't requested, so they aren't looked up.
+    assert upstream_calls.count('phabricator', 'user.query') == 0
+    assert upstream_calls.count('phabricator', 'phid.query') == 0
+
+
+def test_get_revision_with_parent_ids_only(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(3)
+    response = client.get(
+        '/revisions/D3?api_key=api-key&fields=title&parents=ids'
+    )
+    assert response.status_code == 200
+    assert response.json == {
+        'id': 3,
+        'phid': 'PHID-DREV-3',
+        'title': response.json['title'],
+        'parent_phids': ['PHID-DREV-2'],
+    }
+    assert upstream_calls.count('phabricator', 'differential.query') == 1
+
+    response = client.get('/revisions/D3?api_key=api-key&parents=none')
+    assert 'parent_revisions' not in response.json
+    assert 'parent_phids' not in response.json
+    assert 'author' in response.json
+
+
+def test_get_revision_with_unknown_field_returns_400(client, phabfactory):
+    response = client.get('/revisions/D1?api_key=api-key&fields=diff')
+    assert response.status_code == 400
+
+
+def test_search_revisions_shares_nodes_and_upstream_calls(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(5)
+    response = client.get('/revisions?ids=D5,D3,D9000&api_key=api-key')
+    assert response.status_code == 200
+    assert response.json['results'] == [
+        {
+            'revision_id': 'D5',
+            'phid': 'PHID-DREV-5'
+        },
+        {
+            'revision_id': 'D3',
+            'phid': 'PHID-DREV-3'
+        },
+        {
+            'revision_id': 'D9000',
+            'phid': None
+        },
+    ]
+
+    # The stacks overlap, so each revision, user and repo is listed once.
+    revisions = response.json['revisions']
+    assert sorted(revisions) == ['PHID-DREV-%s' % i for i in range(1, 6)]
+    assert revisions['PHID-DREV-5']['parent_phids'] == ['PHID-DREV-4']
+    assert revisions['PHID-DREV-1']['parent_phids'] == []
+    assert len(response.json['users']) == 1
+    assert len(response.json['repos']) == 1
+
+    # The requested revisions are fetched together, and each level of the
+    # overlapping stacks is requested once.
+    assert upstream_calls.count('phabricator', 'differential.query') <= 5
+    assert upstream_calls.count('phabricator', 'user.query') == 1
+    assert upstream_calls.count('phabricator', 'phid.query') == 1
+
+
+def test_search_revisions_by_levels_with_cursor(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(10)
+    response = client.get('/revisions?ids=D10&depth=3&api_key=api-key')
+    assert response.status_code == 200
+    revisions = response.json['revisions']
+    assert sorted(revisions) == sorted(
+        'PHID-DREV-%s' % i for i in range(7, 11)
+    )
+    assert revisions['PHID-DREV-7']['parent_phids'] == ['PHID-DREV-6']
+    assert response.json['cursor']
+    # Only the first levels are requested.
+    assert upstream_calls.count('phabricator', 'differential.query') <= 4
+
+    cursor = response.json['cursor']
+    response = client.get(
+        '/revisions?cursor={}&depth=3&api_key=api-key'.format(cursor)
+    )
+    assert response.status_code == 200
+    assert response.json['results'] == [
+        {
+            'revision_id': 'D6',
+            'phid': 'PHID-DREV-6'
+        }
+    ]
+    revisions = response.json['revisions']
+    assert sorted(revisions) == ['PHID-DREV-%s' % i for i in range(3, 7)]
+
+    # Without depth, the rest of the stack is returned.
+    cursor = response.json['cursor']
+    response = client.get(
+        '/revisions?cursor={}&api_key=api-key'.format(cursor)
+    )
+    assert sorted(response.json['revisions']) == ['PHID-DREV-1', 'PHID-DREV-2']
+    assert response.json['cursor'] is None
+
+
+def test_search_revisions_with_depth_of_cached_stack(client, phabfactory):
+    phabfactory.user()
+    phabfactory.stack(3)
+    client.get('/revisions/D3?api_key=api-key')
+    phabricator_calls = phabfactory.mock.call_count
+
+    response = client.get('/revisions?ids=D3&depth=1&api_key=api-key')
+    assert sorted(response.json['revisions']) == ['PHID-DREV-2', 'PHID-DREV-3']
+    assert response.json['cursor']
+    assert phabfactory.mock.call_count == phabricator_calls
+
+
+def test_search_revisions_without_ids_or_cursor_returns_400(client):
+    response = client.get('/revisions?api_key=api-key')
+    assert response.status_code == 400
+
+    response = client.get('/revisions?cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert response.json['title'] == 'Invalid cursor'
+
+
+def test_complete_public_stack_is_shared_by_every_api_key(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(3)
+    public = client.get('/revisions/D3')
+    assert upstream_calls.count('phabricator') > 0
+
+    upstream_calls.clear()
+    response = client.get('/revisions/D3?api_key=api-key')
+    assert response.json == public.json
+    assert upstream_calls.count('phabricator') == 0
+
+
+def test_public_stack_with_hidden_parent_is_not_shared(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    revisions = phabfactory.stack(2)
+    # D1 depends on a revision the unprivileged api key can't see.
+    revisions[0]['auxiliary']['phabricator:depends-on'] = ['PHID-DREV-9']
+    client.get('/revisions/D2')
+
+    upstream_calls.clear()
+    client.get('/revisions/D2?api_key=api-key')
+    assert upstream_calls.count('phabricator', 'differential.query') > 0
+
+    # The unprivileged api key still uses the stack it loaded.
+    upstream_calls.clear()
+    client.get('/revisions/D2')
+    assert upstream_calls.count('phabricator') == 0
+
+
+def test_private_stack_is_not_shared_with_public(
+    client, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(2)
+    client.get('/revisions/D2?api_key=api-key')
+
+    upstream_calls.clear()
+    client.get('/revisions/D2')
+    assert upstream_calls.count('phabricator', 'differential.query') > 0
+
+
+def test_concurrent_revision_loads_are_coalesced(
+    app, phabfactory, monkeypatch
+):
+    phabfactory.user()
+    phabfactory.revision()
+    load_revision = revisions._load_revision
+    release = threading.Event()
+    calls = []
+
+    def slow_load_revision(key, revision_id, *args):
+        calls.append(revision_id)
+        release.wait(5)
+        return load_revision(key, revision_id, *args)
+
+    def load():
+        with app.app_context():
+            return revisions.load_revision('D1', 'api-key')
+
+    monkeypatch.setattr(revisions, '_load_revision', slow_load_revision)
+    key = revisions._stack_cache_key('D1', 'api-key')
+    flight = (key, True, True, 'revision')
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(load) for _ in range(4)]
+        timeout = time.monotonic() + 5
+        while revisions.stack_loads.callers(flight) < 4:
+            assert time.monotonic() < timeout
+            time.sleep(0.001)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert calls == ['D1']
+    assert results[0].id == 1
+    assert all(r is results[0] for r in results)
+
+
 def test_get_revision_returns_404(client, phabfactory):
     response = client.get('/revisions/D9000?api_key=api-key')
     assert response.status_code == 404
     assert response.content_type == 'application/problem+json'
     assert response.json == CANNED_LANDO_REVISION_NOT_FOUND
+
+
+def test_get_revision_returns_504_after_deadline(app, client, phabfactory):
+    app.config['REQUEST_DEADLINES'] = {'revisions.get': 0}
+    phabfactory.user()
+    phabfactory.revision()
+    response = client.get('/revisions/D1?api_key=api-key')
+    assert response.status_code == 504
+    assert response.content_type == 'application/problem+json'
+    assert response.json['title'] == 'Deadline exceeded'
+
+
+def test_get_revision_returns_partial_stack_after_deadline(
+    client, phabfactory, monkeypatch
+):
+    phabfactory.user()
+    phabfactory.stack(3)
+
+    load_levels = revisions._load_levels
+    out_of_time = [True]
+
+    def load_until_deadline(objects, loaded, stack, depth=None):
+        if out_of_time[0]:
+            raise deadline.DeadlineExceeded()
+        load_levels(objects, loaded, stack, depth)
+
+    monkeypatch.setattr(revisions, '_load_levels', load_until_deadline)
+    response = client.get('/revisions/D3?api_key=api-key')
+    assert response.status_code == 200
+    assert response.headers[deadline.PARTIAL_HEADER] == 'true'
+    assert response.json['parent_revisions'] == []
+
+    # The partial stack isn't cached.
+    out_of_time[0] = False
+    response = client.get('/revisions/D3?api_key=api-key')
+    assert deadline.PARTIAL_HEADER not in response.headers
+    assert len(response.json['parent_revisions']) == 1
@@ -0,0 +1,19 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Tests for the JSON decoding helpers.
+"""
+import pytest
+
+from landoapi.serialization import loads
+
+
+@pytest.mark.parametrize('document', [b'{"a": [1, null]}', '{"a": [1, null]}'])
+def test_loads_accepts_bytes_and_str(document):
+    assert loads(document) == {'a': [1, None]}
+
+
+def test_loads_raises_value_error():
+    with pytest.raises(ValueError):
+        loads(b'<html>Not JSON</html>')
@@ -0,0 +1,114 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from landoapi.singleflight import SingleFlight, file_lock
+
+
+def wait_for_callers(flight, key, callers):
+    deadline = time.monotonic() + 5
+    while flight.callers(key) < callers:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load(revision_id):
+        calls.append(revision_id)
+        release.wait(5)
+        return {'revision': revision_id}
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [
+            executor.submit(flight.do, 'D1', load, 'D1') for _ in range(4)
+        ]
+        wait_for_callers(flight, 'D1', 4)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert calls == ['D1']
+    assert results == [{'revision': 'D1'}] * 4
+    assert all(r is results[0] for r in results)
+    assert flight.callers('D1') == 0
+
+
+def test_callers_of_other_keys_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do('D1', lambda: 1) == 1
+    assert flight.do('D2', lambda: 2) == 2
+    # A finished call isn't reused.
+    assert flight.do('D1', lambda: 3) == 3
+
+
+def test_exception_is_raised_to_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('Phabricator is down')
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(flight.do, 'D1', fail) for _ in range(2)]
+        wait_for_callers(flight, 'D1', 2)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert flight.do('D1', lambda: 'retried') == 'retried'
+
+
+def test_caller_stops_waiting_after_timeout():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(flight.do, 'D1', release.wait, 5)
+        wait_for_callers(flight, 'D1', 1)
+        with pytest.raises(TimeoutError):
+            flight.do('D1', lambda: 'unused', timeout=0.01)
+        assert flight.callers('D1') == 1
+        release.set()
+        assert leader.result() is True
+
+
+def test_file_lock_is_exclusive(tmpdir):
+    directory = tmpdir.join('locks').strpath
+    held = []
+
+    def hold(name):
+        with file_lock(directory, 'stack:unprivileged:1'):
+            held.append(name)
+            time.sleep(0.05)
+            held.append(name)
+
+    threads = [threading.Thread(target=hold, args=(n, )) for n in 'ab']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert held in (['a', 'a', 'b', 'b'], ['b', 'b', 'a', 'a'])
+
+
+def test_file_lock_without_directory_does_nothing():
+    with file_lock(None, 'stack:unprivileged:1'):
+        pass
+
+
+def test_file_lock_times_out(tmpdir):
+    directory = tmpdir.join('locks').strpath
+    with file_lock(directory, 'stack:unprivileged:1'):
+        with pytest.raises(TimeoutError):
+            with file_lock(directory, 'stack:unprivileged:1', timeout=0.01):
+                pass
@@ -0,0 +1,59 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Tests for the database engine configuration.
+"""
+import sqlite3
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+
+from landoapi.models.storage import db, enable_sqlite_wal, \
+    InstrumentedQueuePool, ping_connection, pool_stats
+
+
+def engine_options(app, uri):
+    options = {}
+    db.apply_driver_hacks(app, make_url(uri), options)
+    return options
+
+
+def test_postgresql_engine_options(app):
+    app.config['SQLALCHEMY_POOL_PRE_PING'] = True
+    app.config['SQLALCHEMY_STATEMENT_TIMEOUT'] = 5000
+    options = engine_options(app, 'postgresql://lando@db/lando')
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert (ping_connection, 'checkout') in options['pool_events']
+    assert options['connect_args']['options'] == \
+        '-c statement_timeout=5000'
+
+
+def test_sqlite_file_engine_options(app, tmpdir):
+    app.config['SQLALCHEMY_SQLITE_WAL'] = True
+    options = engine_options(app, 'sqlite:///%s' % tmpdir.join('lando.db'))
+    assert (enable_sqlite_wal, 'connect') in options['pool_events']
+    assert 'pool_size' not in options
+    # Flask-SQLAlchemy doesn't pool connections to sqlite files.
+    assert options['poolclass'] is NullPool
+
+
+def test_sqlite_memory_engine_has_no_wal(app):
+    app.config['SQLALCHEMY_SQLITE_WAL'] = True
+    options = engine_options(app, 'sqlite://')
+    assert (enable_sqlite_wal, 'connect') not in options['pool_events']
+
+
+def test_pool_records_checkouts_and_saturation():
+    pool_stats.reset()
+    pool = InstrumentedQueuePool(
+        lambda: sqlite3.connect(':memory:'), pool_size=1, max_overflow=1
+    )
+    first = pool.connect()
+    assert pool_stats.snapshot()['saturated_checkouts'] == 0
+    second = pool.connect()
+    stats = pool_stats.snapshot()
+    assert stats['checkouts'] == 2
+    assert stats['saturated_checkouts'] == 1
+    second.close()
+    first.close()
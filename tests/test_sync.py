@@ -0,0 +1,151 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from landoapi import revisions, sync
+from landoapi.cache import cache
+from landoapi.models.revision_edge import RevisionEdge
+from landoapi.models.sync_cursor import SyncCursor
+from landoapi.revisions import load_stack, record_modified
+from landoapi.sync import CURSOR_NAME, RateLimiter, sync_revisions
+
+
+def test_sync_warms_cache_and_index(db, phabfactory, upstream_calls):
+    phabfactory.user()
+    revisions = phabfactory.stack(5)
+
+    result = sync_revisions(page_size=2, concurrency=1)
+    assert result.synced == 5
+    assert result.failed == 0
+    assert result.cursor == int(revisions[-1]['dateModified'])
+    assert SyncCursor.get_value(CURSOR_NAME) == result.cursor
+    assert RevisionEdge.ancestors('PHID-DREV-5') == {
+        'PHID-DREV-%s' % i
+        for i in range(1, 5)
+    }
+
+    upstream_calls.clear()
+    assert load_stack('D5').id == 5
+    assert upstream_calls.count() == 0
+
+
+def age_cached_stack(revision_id, seconds):
+    key = revisions._stack_cache_key(revision_id, None)
+    loaded_at, revision, complete = cache.get(key)
+    cache.set(key, (loaded_at - seconds, revision, complete))
+
+
+def test_synced_stack_is_used_while_unmodified(
+    db, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(5)
+    sync_revisions(page_size=10, concurrency=1)
+    age_cached_stack('D5', 600)
+
+    upstream_calls.clear()
+    assert load_stack('D5').id == 5
+    assert upstream_calls.count() == 0
+
+
+def test_synced_stack_with_modified_revision_is_reloaded(
+    db, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    stack = phabfactory.stack(5)
+    sync_revisions(page_size=10, concurrency=1)
+    age_cached_stack('D5', 600)
+
+    # D3 was modified after the stack was loaded.
+    modified = dict(stack[2])
+    modified['dateModified'] = str(int(modified['dateModified']) + 60)
+    record_modified([modified])
+
+    upstream_calls.clear()
+    assert load_stack('D5').id == 5
+    assert upstream_calls.count('phabricator', 'differential.query') > 0
+
+
+def test_synced_stack_is_not_used_past_max_age_without_sync(
+    db, phabfactory, upstream_calls
+):
+    phabfactory.user()
+    phabfactory.stack(5)
+    sync_revisions(page_size=10, concurrency=1)
+    age_cached_stack('D5', 600)
+    cache.delete(revisions.SYNC_CHECKED_AT_KEY)
+
+    upstream_calls.clear()
+    assert load_stack('D5').id == 5
+    assert upstream_calls.count('phabricator', 'differential.query') > 0
+
+
+def test_sync_warns_about_process_local_cache(
+    app, db, phabfactory, monkeypatch
+):
+    phabfactory.user()
+    phabfactory.stack(1)
+    warnings = []
+    monkeypatch.setattr(
+        sync.logger, 'warning', lambda *args: warnings.append(args)
+    )
+    sync_revisions(page_size=10, concurrency=1)
+    assert len(warnings) == 1
+
+    app.config['CACHE_TYPE'] = 'filesystem'
+    sync_revisions(page_size=10, concurrency=1)
+    assert len(warnings) == 1
+
+
+def test_sync_resumes_from_cursor(db, phabfactory):
+    phabfactory.user()
+    revisions = phabfactory.stack(5)
+    SyncCursor.set_value(CURSOR_NAME, int(revisions[2]['dateModified']))
+
+    result = sync_revisions(page_size=10, concurrency=1)
+    # D3 was modified in the same second as the cursor, so it is synced
+    # again.
+    assert result.synced == 3
+    assert result.cursor == int(revisions[-1]['dateModified'])
+
+
+def test_first_sync_is_bounded_by_max_pages(db, phabfactory):
+    phabfactory.user()
+    revisions = phabfactory.stack(5)
+
+    result = sync_revisions(page_size=2, max_pages=1, concurrency=1)
+    assert result.synced == 2
+    assert result.cursor == int(revisions[-1]['dateModified'])
+
+
+def test_capped_incremental_sync_resumes_where_it_stopped(db, phabfactory):
+    phabfactory.user()
+    revisions = phabfactory.stack(5)
+    since = int(revisions[0]['dateModified'])
+    SyncCursor.set_value(CURSOR_NAME, since)
+
+    # D5 and D4, then D3 and D2. D1 is still to be synced, so the cursor
+    # stays put.
+    for _ in range(2):
+        result = sync_revisions(page_size=2, max_pages=1, concurrency=1)
+        assert result.synced == 2
+        assert result.cursor == since
+
+    result = sync_revisions(page_size=2, max_pages=1, concurrency=1)
+    assert result.synced == 1
+    assert result.cursor == int(revisions[-1]['dateModified'])
+    assert SyncCursor.get_value(CURSOR_NAME) == result.cursor
+
+    # The next sync starts from the newest revisions again.
+    result = sync_revisions(page_size=2, max_pages=1, concurrency=1)
+    assert result.synced == 1
+    assert result.cursor == int(revisions[-1]['dateModified'])
+
+
+def test_rate_limiter_spaces_out_calls(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('landoapi.sync.time.sleep', sleeps.append)
+    limiter = RateLimiter(10)
+    for _ in range(3):
+        limiter.wait()
+    assert len(sleeps) == 2
+    assert all(0 < s <= 0.2 for s in sleeps)
@@ -0,0 +1,26 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Tests for the TransplantClient
+"""
+import pytest
+import requests
+import requests_mock
+
+from landoapi.transplant_client import TransplantClient
+
+pytestmark = pytest.mark.usefixtures('docker_env_vars')
+
+
+def test_land_is_answered_by_the_stub():
+    assert TransplantClient().land('ldap_username', 'mozilla-central') == 1
+
+
+def test_stub_is_scoped_to_the_client_session():
+    trans = TransplantClient()
+    trans.land('ldap_username', 'mozilla-central')
+    url = trans.api_url + '/autoland'
+    assert isinstance(trans.session.get_adapter(url), requests_mock.Adapter)
+    adapter = requests.Session().get_adapter(url)
+    assert not isinstance(adapter, requests_mock.Adapter)
@@ -0,0 +1,43 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+import requests_mock
+
+from landoapi import upstream
+from landoapi.phabricator_client import PhabricatorClient
+from landoapi.upstream import CallRecorder
+from tests.canned_responses.phabricator.users import CANNED_USER_1
+from tests.utils import phab_url
+
+
+def test_record_reports_calls_to_listeners():
+    params = {'phids[]': ['PHID-USER-1']}
+    with CallRecorder() as recorder:
+        with upstream.record('phabricator', 'user.query', params):
+            pass
+        with pytest.raises(ValueError):
+            with upstream.record('transplant', 'autoland'):
+                raise ValueError()
+    with upstream.record('phabricator', 'user.whoami'):
+        pass
+
+    assert [(c.service, c.method, c.params) for c in recorder.calls] == [
+        ('phabricator', 'user.query', params),
+        ('transplant', 'autoland', {}),
+    ]
+    assert recorder.count() == 2
+    assert recorder.count('phabricator') == 1
+    assert recorder.count('phabricator', 'user.whoami') == 0
+    assert recorder.duration() >= 0
+
+
+def test_phabricator_calls_are_recorded_without_api_key(
+    docker_env_vars, upstream_calls
+):
+    with requests_mock.mock() as m:
+        m.get(phab_url('user.whoami'), status_code=200, json=CANNED_USER_1)
+        PhabricatorClient('secret-api-key').get_current_user()
+
+    assert upstream_calls.count('phabricator', 'user.whoami') == 1
+    assert upstream_calls.calls[0].params == {}
@@ -0,0 +1,30 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import importlib
+
+import pytest
+
+from landoapi.models.storage import pool_stats
+from landoapi.notifier import landing_statuses
+
+
+@pytest.fixture
+def wsgi(versionfile, docker_env_vars, monkeypatch):
+    monkeypatch.setenv('VERSION_PATH', versionfile.strpath)
+    import landoapi.wsgi
+    return importlib.reload(landoapi.wsgi)
+
+
+def test_wsgi_app_serves_requests(wsgi):
+    response = wsgi.app.test_client().get('/__lbheartbeat__')
+    assert response.status_code == 200
+
+
+def test_reset_process_state_after_fork(wsgi):
+    pool_stats.record_checkout(0.5, 1, 10)
+    landing_statuses.publish(1, 'started')
+
+    wsgi.reset_process_state()
+    assert pool_stats.snapshot()['checkouts'] == 0
+    assert landing_statuses.wait(1, None, 0) is None